@@ -1,15 +1,146 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from .models import *
+from .moderation import approve_reviews, hide_reviews, reject_reviews
+from .pagination import EstimatedCountPaginator
+from .stats import defer_stats_refresh
 
-admin.site.register(CustomUser, UserAdmin)
+# Списки админки рассчитаны на миллионы строк: связанные объекты подгружаются одним JOIN
+# (list_select_related), внешние ключи выбираются полем id или автодополнением вместо
+# выпадающего списка всех строк, поиск идёт по префиксу ('^') индексированных полей,
+# а число строк без фильтров берётся из статистики СУБД.
 
-models_to_register = [
-    Store, OrderStatus, Order, OrderItem,
-    ProductCategory, Brand, Country, Product,
-    StoreInventory, Wishlist, WishlistItem,
-    ReviewLog, ProductComposition, Nutrient
-]
 
-for model in models_to_register:
-    admin.site.register(model)
\ No newline at end of file
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице при включённом фильтре или поиске
+    show_full_result_count = False
+    list_per_page = 50
+
+    def delete_queryset(self, request, queryset):
+        # Сигналы удаления пересчитывают сводку товара на каждую строку; здесь — один раз на всё действие
+        with defer_stats_refresh():
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(UserAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ('^username', '^email', '^phone')
+
+
+# Небольшие справочники; search_fields нужны для автодополнения в других формах
+@admin.register(Store)
+class StoreAdmin(admin.ModelAdmin):
+    list_display = ('name', 'address', 'phone', 'open_hours')
+    search_fields = ('^name',)
+
+
+@admin.register(OrderStatus, ProductCategory, Country, Nutrient)
+class DictionaryAdmin(admin.ModelAdmin):
+    search_fields = ('^name',)
+
+
+@admin.register(Brand)
+class BrandAdmin(admin.ModelAdmin):
+    list_display = ('name', 'country')
+    list_select_related = ('country',)
+    autocomplete_fields = ('country',)
+    search_fields = ('^name',)
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ('name', 'brand', 'category', 'price')
+    list_select_related = ('brand', 'category')
+    list_filter = ('category', 'brand')
+    autocomplete_fields = ('brand', 'category')
+    search_fields = ('^name',)
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'status', 'store', 'order_date')
+    list_select_related = ('user', 'status', 'store')
+    list_filter = ('status', 'store')
+    date_hierarchy = 'order_date'
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('status', 'store')
+    search_fields = ('=id', '^user__username')
+    inlines = [OrderItemInline]
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'order', 'product', 'quantity', 'price')
+    list_select_related = ('order', 'product')
+    raw_id_fields = ('order', 'product')
+    search_fields = ('=order__id',)
+
+
+@admin.register(StoreInventory)
+class StoreInventoryAdmin(LargeTableAdmin):
+    list_display = ('store', 'product', 'quantity', 'updated_at', 'changed_at')
+    list_select_related = ('store', 'product')
+    list_filter = ('store',)
+    date_hierarchy = 'changed_at'
+    raw_id_fields = ('product',)
+    autocomplete_fields = ('store',)
+    search_fields = ('^product__name',)
+
+
+@admin.register(Wishlist)
+class WishlistAdmin(LargeTableAdmin):
+    list_display = ('id', 'user')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    search_fields = ('^user__username',)
+
+
+@admin.register(WishlistItem)
+class WishlistItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'wishlist', 'product', 'quantity')
+    list_select_related = ('wishlist__user', 'product')
+    raw_id_fields = ('wishlist', 'product')
+
+
+@admin.register(ReviewLog)
+class ReviewLogAdmin(LargeTableAdmin):
+    list_display = ('id', 'product', 'user', 'grade', 'viewable', 'review_date')
+    list_select_related = ('product', 'user')
+    list_filter = ('viewable',)
+    date_hierarchy = 'review_date'
+    raw_id_fields = ('user', 'product')
+    search_fields = ('^product__name', '^user__username')
+    actions = ['approve', 'hide', 'reject']
+
+    @admin.action(description='Опубликовать выбранные отзывы', permissions=['change'])
+    def approve(self, request, queryset):
+        count = approve_reviews(queryset)
+        self.message_user(request, f'Опубликовано отзывов: {count}', messages.SUCCESS)
+
+    @admin.action(description='Снять с публикации выбранные отзывы', permissions=['change'])
+    def hide(self, request, queryset):
+        count = hide_reviews(queryset)
+        self.message_user(request, f'Снято с публикации: {count}', messages.SUCCESS)
+
+    @admin.action(description='Отклонить (удалить) выбранные отзывы', permissions=['delete'])
+    def reject(self, request, queryset):
+        count = reject_reviews(queryset)
+        self.message_user(request, f'Отклонено отзывов: {count}', messages.SUCCESS)
+
+
+@admin.register(ProductComposition)
+class ProductCompositionAdmin(LargeTableAdmin):
+    list_display = ('product', 'nutrient', 'amount')
+    list_select_related = ('product', 'nutrient')
+    raw_id_fields = ('product',)
+    autocomplete_fields = ('nutrient',)
+    search_fields = ('^product__name',)
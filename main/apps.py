@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from . import checks, signals  # noqa: F401
+        from .profiling import install_query_recorder
+
+        connection_created.connect(install_query_recorder, dispatch_uid='main-query-recorder')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
@@ -0,0 +1,110 @@
+import gzip
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.templatetags.static import static
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Сторонние CSS, JS и шрифты, которые раньше подключались с CDN. Команда vendor_assets скачивает их
+# в main/static/vendor вместе со всеми файлами из url(...) в CSS, collectstatic добавляет хэш
+# содержимого к именам и сжимает. Пока локальной копии нет, шаблон ссылается на CDN, а check --deploy
+# предупреждает об этом (main.W001).
+VENDOR_DIR = 'vendor'
+VENDOR_ASSETS = {
+    'bootstrap.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'bootstrap.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+    'fontawesome/css/all.css': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0/css/all.min.css',
+    'fonts/montserrat.css': 'https://fonts.googleapis.com/css2?family=Montserrat:wght@600;700&display=swap',
+}
+
+# Файлы, которые имеет смысл сжимать заранее; шрифты woff2 и картинки уже сжаты
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.ttf', '.otf', '.eot', '.ico')
+# Имя с хэшем содержимого от ManifestStaticFilesStorage: styles.1a2b3c4d5e6f.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE_CONTROL = 'public, max-age=300'
+
+
+def vendor_path(name):
+    return f'{VENDOR_DIR}/{name}'
+
+
+# Адреса найденных локальных копий. Промах не запоминается: копия, скачанная vendor_assets
+# при работающем сервере, подхватывается без перезапуска
+_local_urls = {}
+
+
+def vendor_asset_url(name):
+    # Локальная копия, если vendor_assets уже запускалась, иначе исходный CDN
+    url = _local_urls.get(name)
+    if url is None:
+        path = vendor_path(name)
+        if not finders.find(path):
+            return VENDOR_ASSETS[name]
+        url = _local_urls[name] = static(path)
+    return url
+
+
+def missing_vendor_assets():
+    return [name for name in VENDOR_ASSETS if not finders.find(vendor_path(name))]
+
+
+def compress_file(path):
+    # Рядом с файлом кладутся .gz и .br (если установлен пакет brotli), только когда они меньше оригинала
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    written = []
+    for suffix, compress in variants:
+        compressed = compress()
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+def accepted_encodings(request):
+    header = request.headers.get('Accept-Encoding', '')
+    return {part.split(';')[0].strip() for part in header.split(',')}
+
+
+@require_safe
+def serve_static(request, path):
+    # Раздача собранной статики (STATIC_ROOT) без отдельного веб-сервера: файлы с хэшем в имени кэшируются
+    # браузером навсегда, заранее сжатые варианты выбираются по Accept-Encoding
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(full_path)
+    encodings = accepted_encodings(request)
+    served_path, encoding = full_path, None
+    for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if name in encodings and os.path.isfile(full_path + suffix):
+            served_path, encoding = full_path + suffix, name
+            break
+
+    response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if HASHED_NAME.search(path) else MUTABLE_CACHE_CONTROL
+    )
+    return response
@@ -0,0 +1,103 @@
+import asyncio
+from functools import wraps
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.shortcuts import render
+from . import views
+from .caching import cache_anonymous_page, catalog_stamps, conditional_page, product_stamps
+from .facets import catalog_facets
+from .forms import ReviewForm
+from .images import attach_variants
+from .pagination import KeysetPaginator
+from .product_page import (
+    build_product_page, clamp_reviews_page, get_product, load_composition, load_reviews, load_user_review, parse_page,
+)
+
+# Асинхронные версии страниц каталога, товара и поиска для запуска под ASGI (ns.asgi).
+# Асинхронный ORM Django выполняет запросы по очереди в одном потоке, поэтому независимые
+# запросы страницы запускаются в пуле потоков, каждый на своём соединении, и ждутся через asyncio.gather.
+
+
+def in_own_connection(func):
+    @wraps(func)
+    def inner(*args):
+        # Рабочий поток держит собственное соединение; CONN_MAX_AGE позволяет переиспользовать его между запросами
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return inner
+
+
+def run_query(func, *args):
+    return sync_to_async(in_own_connection(func), thread_sensitive=False)(*args)
+
+
+@conditional_page(catalog_stamps)
+@cache_anonymous_page(stamp_names=catalog_stamps)
+async def catalog_view(request):
+    products, ordering, query_string = views.catalog_query(request.GET)
+    selected = views.catalog_filters(request.GET)
+    paginator = KeysetPaginator(products, ordering, views.CATALOG_PER_PAGE)
+
+    facets, page_obj = await asyncio.gather(
+        run_query(catalog_facets, selected['filters'], selected['price_min'], selected['price_max']),
+        run_query(paginator.get_page, request.GET.get('cursor')),
+    )
+    await run_query(attach_variants, page_obj)
+
+    return render(request, 'catalog.html', {
+        'facets': facets,
+        'price_min': selected['price_min'],
+        'price_max': selected['price_max'],
+        'page_obj': page_obj,
+        'query_string': query_string,
+        'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+    })
+
+
+@conditional_page(product_stamps)
+@cache_anonymous_page(stamp_names=product_stamps)
+async def product_detail_view(request, pk):
+    if request.method not in ('GET', 'HEAD'):
+        # Отзыв сохраняет синхронное представление
+        return await sync_to_async(views.product_detail_view)(request, pk=pk)
+
+    user = await request.auser()
+    reviews_page = parse_page(request.GET.get('reviews_page'))
+    # Первая страница отзывов есть всегда и загружается вместе с остальным; номер другой страницы
+    # сначала ограничивается числом страниц из сводки товара
+    queries = [run_query(get_product, pk), run_query(load_composition, pk), run_query(load_user_review, user, pk)]
+    if reviews_page == 1:
+        queries.append(run_query(load_reviews, pk, reviews_page))
+    product, composition, user_review, *reviews = await asyncio.gather(*queries)
+    if reviews:
+        reviews, = reviews
+    else:
+        reviews_page = clamp_reviews_page(product, reviews_page)
+        reviews = await run_query(load_reviews, pk, reviews_page)
+    page = build_product_page(product, composition, reviews, user_review, reviews_page)
+
+    return render(request, 'product_detail.html', {
+        **page,
+        'review_form': ReviewForm() if user.is_authenticated and not page['has_review'] else None,
+    })
+
+
+async def search_view(request):
+    # Шаблон обращается к request.user, ленивая загрузка из асинхронного кода запрещена
+    request.user = await request.auser()
+    query = request.GET.get('q')
+    products, ordering = views.search_query(query)
+    paginator = KeysetPaginator(products, ordering, views.SEARCH_PER_PAGE)
+    page_obj = await run_query(paginator.get_page, request.GET.get('cursor'))
+    await run_query(attach_variants, page_obj)
+
+    return render(request, 'search_results.html', {
+        'query': query,
+        'page_obj': page_obj,
+        'query_string': urlencode({'q': query or ''}),
+    })
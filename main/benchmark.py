@@ -0,0 +1,380 @@
+import json
+import math
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from .cart import CART_SESSION_KEY
+from .facets import facet_index
+from .lookups import LOOKUP_TABLES
+from .models import (
+    Brand, Country, CustomUser, Nutrient, Order, OrderItem, OrderStatus, Product, ProductCategory,
+    ProductComposition, ReviewLog, Store, StoreInventory, Wishlist, WishlistItem,
+)
+from .profiling import RequestProfile, current_profile
+from .search import rebuild_search_index
+from .stats import rebuild_product_stats
+from .suggest import suggest_index
+from .utils import batched
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def summarize_latencies(latencies):
+    # Сводка по задержкам в миллисекундах
+    if not latencies:
+        return {'count': 0}
+    return {
+        'count': len(latencies),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+    }
+
+
+def insert_batches(model, rows, batch_size, log):
+    # Вставка генератора строк пачками: память не зависит от размера набора,
+    # каждая пачка фиксируется отдельной транзакцией, чтобы не держать одну транзакцию на весь набор
+    total = 0
+    for batch in batched(rows, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create(batch, batch_size=batch_size)
+        total += len(batch)
+        log(f'{model.__name__}: {total}')
+    return total
+
+
+def seed_dataset(products=100_000, reviews=1_000_000, stores=50, users=1_000, orders_per_user=50,
+                 items_per_order=3, inventory=True, batch_size=5_000, seed=1, log=print):
+    # Синтетический каталог для замеров; имена с префиксом bench, чтобы отличать от реальных данных
+    rnd = random.Random(seed)
+    now = timezone.now()
+
+    Country.objects.bulk_create([Country(name=f'bench-country-{i}') for i in range(10)])
+    ProductCategory.objects.bulk_create([ProductCategory(name=f'bench категория {i}') for i in range(20)])
+    country_ids = list(Country.objects.filter(name__startswith='bench-country-').values_list('id', flat=True))
+    Brand.objects.bulk_create([
+        Brand(name=f'bench brand {i}', country_id=rnd.choice(country_ids)) for i in range(200)
+    ])
+    Nutrient.objects.bulk_create([Nutrient(name=f'bench нутриент {i}') for i in range(10)])
+    Store.objects.bulk_create([Store(name=f'bench store {i}', address='-', phone='-', open_hours='-') for i in range(stores)])
+    for name in ('Черновик', 'В обработке', 'Завершён'):
+        OrderStatus.objects.get_or_create(name=name)
+
+    category_ids = list(ProductCategory.objects.filter(name__startswith='bench ').values_list('id', flat=True))
+    brand_ids = list(Brand.objects.filter(name__startswith='bench ').values_list('id', flat=True))
+    nutrient_ids = list(Nutrient.objects.filter(name__startswith='bench ').values_list('id', flat=True))
+    store_ids = list(Store.objects.filter(name__startswith='bench ').values_list('id', flat=True))
+    words = ['протеин', 'сывороточный', 'гейнер', 'креатин', 'аминокислоты', 'батончик', 'витамины', 'изолят',
+             'шоколад', 'ваниль', 'клубника', 'казеин', 'коллаген', 'омега', 'энергетик']
+
+    first_product = (Product.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+    insert_batches(Product, (
+        Product(
+            name=f'bench {" ".join(rnd.sample(words, 3))} {i}',
+            category_id=rnd.choice(category_ids),
+            brand_id=rnd.choice(brand_ids),
+            price=rnd.randint(100, 10_000),
+            description=' '.join(rnd.choices(words, k=30)),
+        )
+        for i in range(products)
+    ), batch_size, log)
+    product_ids = list(Product.objects.filter(id__gt=first_product).order_by('id').values_list('id', flat=True))
+
+    insert_batches(ProductComposition, (
+        ProductComposition(product_id=product_id, nutrient_id=nutrient_id, amount=rnd.randint(1, 50))
+        for product_id in product_ids
+        for nutrient_id in rnd.sample(nutrient_ids, 3)
+    ), batch_size, log)
+
+    if inventory:
+        insert_batches(StoreInventory, (
+            StoreInventory(store_id=store_id, product_id=product_id, quantity=rnd.randint(0, 50), updated_at=now)
+            for store_id in store_ids
+            for product_id in product_ids
+        ), batch_size, log)
+
+    first_user = (CustomUser.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+    insert_batches(CustomUser, (
+        CustomUser(username=f'bench-user-{first_user}-{i}', password='!', phone=str(i)[:10])
+        for i in range(users)
+    ), batch_size, log)
+    user_ids = list(CustomUser.objects.filter(id__gt=first_user).values_list('id', flat=True))
+
+    insert_batches(ReviewLog, (
+        ReviewLog(
+            user_id=rnd.choice(user_ids),
+            product_id=rnd.choice(product_ids),
+            grade=rnd.randint(1, 5),
+            comment='bench отзыв',
+            viewable=rnd.random() < 0.9,
+        )
+        for _ in range(reviews)
+    ), batch_size, log)
+
+    status_ids = list(OrderStatus.objects.exclude(name='Черновик').values_list('id', flat=True))
+    first_order = (Order.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+    insert_batches(Order, (
+        Order(user_id=user_id, status_id=rnd.choice(status_ids), store_id=rnd.choice(store_ids), comment='bench')
+        for user_id in user_ids
+        for _ in range(orders_per_user)
+    ), batch_size, log)
+    prices = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'price'))
+    insert_batches(OrderItem, (
+        OrderItem(order_id=order_id, product_id=product_id, quantity=rnd.randint(1, 3), price=prices[product_id])
+        for order_id in Order.objects.filter(id__gt=first_order).values_list('id', flat=True).iterator()
+        for product_id in rnd.sample(product_ids, items_per_order)
+    ), batch_size, log)
+
+    # bulk_create не вызывает сигналы: сводки и поисковый индекс строятся отдельно (тоже пачками),
+    # кэши справочников и индексы в памяти сбрасываются после фиксации данных,
+    # иначе другие процессы перестроили бы их по ещё не зафиксированным строкам
+    for total in rebuild_product_stats():
+        log(f'ProductStats: {total}')
+    for total in rebuild_search_index():
+        log(f'SearchTerm: {total}')
+    transaction.on_commit(invalidate_seeded_caches)
+
+
+def invalidate_seeded_caches():
+    for table in LOOKUP_TABLES.values():
+        table.invalidate()
+    suggest_index.invalidate()
+    facet_index.invalidate()
+
+
+def bench_context():
+    # Объекты, на которых измеряются маршруты: самый обсуждаемый товар и покупатель с самой длинной историей
+    product = (
+        Product.objects.select_related('stats').order_by('-stats__review_count', 'id').first()
+    )
+    user = (
+        CustomUser.objects.annotate(orders_count=Count('order')).order_by('-orders_count', 'id').first()
+    )
+    order = user.order_set.exclude(status__name='Черновик').order_by('-id').first() if user else None
+    word = product.name.split()[1] if product and len(product.name.split()) > 1 else 'протеин'
+    return {
+        'product': product,
+        'user': user,
+        'order': order,
+        'store': Store.objects.filter(storeinventory__product=product).first() if product else None,
+        'query': word,
+    }
+
+
+def cart_session(ctx):
+    return {CART_SESSION_KEY: {str(ctx['product'].id): 1}}
+
+
+def prepare_wishlist_item(ctx):
+    wishlist, _ = Wishlist.objects.get_or_create(user=ctx['user'])
+    item, _ = WishlistItem.objects.get_or_create(wishlist=wishlist, product=ctx['product'], defaults={'quantity': 1})
+    return {'item_id': item.id}
+
+
+def bench_staff():
+    # Сотрудник для служебных маршрутов; если его нет, создаётся внутри откатываемой транзакции замера
+    staff = CustomUser.objects.filter(is_superuser=True).order_by('id').first()
+    return staff or CustomUser.objects.create_superuser('bench-staff', password=None)
+
+
+def inventory_payload(ctx):
+    return json.dumps({'items': [
+        {'product_id': ctx['product'].id, 'quantity': 5, 'updated_at': timezone.now().isoformat()},
+    ]})
+
+
+def bench_requests(ctx):
+    # Запросы для каждого именованного маршрута из ns/urls.py (проверяет unbenched_routes).
+    # prepare готовит данные внутри откатываемой транзакции и возвращает параметры маршрута,
+    # session возвращает данные, которые кладутся в сессию клиента перед запросом,
+    # auth — True для покупателя или 'staff' для сотрудника, settings переопределяются на время запроса.
+    product_id = ctx['product'].id
+    order_id = ctx['order'].id if ctx['order'] else 0
+    store_id = ctx['store'].id if ctx['store'] else 0
+    return [
+        {'name': 'catalog', 'method': 'get', 'data': {}},
+        {'name': 'catalog', 'method': 'get', 'data': {'sort': 'price_desc'}, 'label': 'catalog?sort=price_desc'},
+        {'name': 'contacts', 'method': 'get'},
+        {'name': 'about', 'method': 'get'},
+        {'name': 'product-detail', 'method': 'get', 'kwargs': {'pk': product_id}},
+        {'name': 'product-detail', 'method': 'get', 'kwargs': {'pk': product_id}, 'auth': True,
+         'label': 'product-detail (auth)'},
+        {'name': 'login', 'method': 'get'},
+        {'name': 'logout', 'method': 'post', 'auth': True},
+        {'name': 'register', 'method': 'get'},
+        {'name': 'profile', 'method': 'get', 'auth': True},
+        {'name': 'edit-profile', 'method': 'get', 'auth': True},
+        {'name': 'add-to-wishlist', 'method': 'post', 'kwargs': {'product_id': product_id}, 'auth': True},
+        {'name': 'remove-from-wishlist', 'method': 'get', 'prepare': prepare_wishlist_item, 'auth': True},
+        {'name': 'wishlist', 'method': 'get', 'prepare': prepare_wishlist_item, 'kwargs_from_prepare': False,
+         'auth': True},
+        {'name': 'cart', 'method': 'get', 'session': cart_session, 'auth': True},
+        {'name': 'cart', 'method': 'get', 'session': cart_session, 'label': 'cart (anonymous)'},
+        {'name': 'add-to-cart', 'method': 'post', 'kwargs': {'product_id': product_id}},
+        {'name': 'update-cart', 'method': 'post', 'session': cart_session, 'data': {f'quantity_{product_id}': '2'}},
+        {'name': 'remove-from-cart', 'method': 'post', 'kwargs': {'product_id': product_id}, 'session': cart_session},
+        {'name': 'checkout', 'method': 'post', 'session': cart_session, 'data': {'store_id': store_id}, 'auth': True},
+        {'name': 'order-detail', 'method': 'get', 'kwargs': {'pk': order_id}, 'auth': True},
+        {'name': 'password_change', 'method': 'get', 'auth': True},
+        {'name': 'search', 'method': 'get', 'data': {'q': ctx['query']}},
+        {'name': 'search-suggest', 'method': 'get', 'data': {'q': ctx['query'][:3]}},
+        {'name': 'metrics', 'method': 'get', 'auth': 'staff'},
+        {'name': 'moderation-queue', 'method': 'get', 'auth': 'staff'},
+        {'name': 'inventory-sync', 'method': 'post', 'kwargs': {'store_id': store_id},
+         'data': inventory_payload, 'content_type': 'application/json',
+         'headers': {'Authorization': 'Bearer bench-token'},
+         'settings': {'INVENTORY_SYNC_TOKENS': {'bench-token': store_id}}},
+        {'name': 'inventory-changes', 'method': 'get', 'data': {'limit': 500}, 'auth': 'staff'},
+        {'name': 'async-catalog', 'method': 'get', 'data': {}},
+        {'name': 'async-product-detail', 'method': 'get', 'kwargs': {'pk': product_id}},
+        {'name': 'async-search', 'method': 'get', 'data': {'q': ctx['query']}},
+    ]
+
+
+def unbenched_routes(specs, urlconf=None):
+    # Именованные маршруты верхнего уровня, для которых нет запроса в bench_requests.
+    # Раздача статики (SERVE_STATIC) — не страница приложения, admin подключён через include без имени
+    routes = {pattern.name for pattern in get_resolver(urlconf).url_patterns if getattr(pattern, 'name', None)}
+    return sorted(routes - {spec['name'] for spec in specs} - {'static'})
+
+
+def measure_request(client, ctx, spec, repeats=5, cold=False):
+    # Каждый запрос выполняется в транзакции, которая откатывается: данные не меняются между повторами.
+    # Запросы считаются через профиль main.profiling: он получает SQL и из рабочих потоков асинхронных страниц.
+    # Выборочное профилирование middleware на время замера отключено, чтобы не перехватывать профиль
+    wall, db, counts, statuses = [], [], [], []
+    path = None
+    overrides = {**spec.get('settings', {}), 'PROFILING': {**settings.PROFILING, 'ENABLED': False}}
+    for attempt in range(repeats + 1):
+        with transaction.atomic(), override_settings(**overrides):
+            kwargs = dict(spec.get('kwargs', {}))
+            data = spec.get('data', {})
+            data = data(ctx) if callable(data) else dict(data)
+            if spec.get('prepare'):
+                prepared = spec['prepare'](ctx)
+                if spec.get('kwargs_from_prepare', True):
+                    kwargs.update(prepared)
+            # Сессия прошлого прогона откатилась вместе с транзакцией, но могла остаться в кэше
+            client.cookies.clear()
+            if spec.get('auth') == 'staff':
+                client.force_login(bench_staff())
+            elif spec.get('auth'):
+                client.force_login(ctx['user'])
+            else:
+                client.logout()
+            if cold:
+                cache.clear()
+            if spec.get('session'):
+                session = client.session
+                session.update(spec['session'](ctx))
+                session.save()
+            path = reverse(spec['name'], kwargs=kwargs or None)
+            extra = {key: spec[key] for key in ('content_type', 'headers') if key in spec}
+
+            profile = RequestProfile()
+            token = current_profile.set(profile)
+            try:
+                started = time.perf_counter()
+                response = getattr(client, spec['method'])(path, data, **extra)
+                elapsed = (time.perf_counter() - started) * 1000
+            finally:
+                current_profile.reset(token)
+            transaction.set_rollback(True)
+
+        # Первый прогон прогревает кэши процесса и не учитывается
+        if attempt == 0 and repeats > 0:
+            continue
+        wall.append(elapsed)
+        db.append(profile.db_time * 1000)
+        counts.append(profile.query_count)
+        statuses.append(response.status_code)
+
+    return {
+        'name': spec.get('label', spec['name']),
+        'method': spec['method'].upper(),
+        'path': path,
+        'status': statuses[-1],
+        'queries': max(counts),
+        'db_ms': round(statistics.median(db), 3),
+        'wall_ms': round(statistics.median(wall), 3),
+        'wall_p95_ms': round(percentile(wall, 95), 3),
+    }
+
+
+def compare_results(previous, current):
+    # Разница с предыдущим прогоном по имени маршрута
+    before = {row['name']: row for row in previous.get('results', [])}
+    rows = []
+    for row in current['results']:
+        old = before.get(row['name'])
+        if not old:
+            continue
+        rows.append({
+            'name': row['name'],
+            'queries': (old['queries'], row['queries']),
+            'db_ms': (old['db_ms'], row['db_ms']),
+            'wall_ms': (old['wall_ms'], row['wall_ms']),
+        })
+    return rows
+
+
+def http_load(url, total, concurrency, headers=None):
+    # Нагрузка на запущенный сервер: concurrency потоков делят между собой total запросов
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    tickets = iter(range(total))
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                if next(tickets, None) is None:
+                    return
+            request = urllib.request.Request(url, headers=headers or {})
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    return {
+        'errors': errors,
+        'duration_s': round(duration, 3),
+        'rps': round(len(latencies) / duration, 1) if duration else None,
+        **summarize_latencies(latencies),
+    }
@@ -0,0 +1,207 @@
+import hashlib
+import re
+import time
+from functools import wraps
+from urllib.parse import urlencode
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.middleware.csrf import get_token
+
+GENERATION_KEY = 'pagecache:generation'
+MODIFIED_PREFIX = 'modified:'
+CSRF_PLACEHOLDER = b'__csrf_token_placeholder__'
+CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+# Имена фрагментов шаблонов, которые кэшируются по id товара
+PRODUCT_FRAGMENTS = ('product_card',)
+
+
+def page_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def modified_stamps(names):
+    # Время последнего изменения (нс) по именам отметок: 'pages', 'lookups', 'product:<id>'.
+    # Отметка, вытесненная из кэша, считается изменённой сейчас — клиент получит страницу целиком
+    keys = [MODIFIED_PREFIX + name for name in names]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    return [found.get(key, 0) for key in keys]
+
+
+def touch_modified(names):
+    now = time.time_ns()
+    cache.set_many({MODIFIED_PREFIX + name: now for name in names}, None)
+
+
+def invalidate_pages():
+    # Все закэшированные страницы устаревают разом: меняется поколение в ключе
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
+    touch_modified(['pages'])
+
+
+def invalidate_products(product_ids):
+    # Устаревают страницы этих товаров и списки товаров (отметка 'products'), остальной кэш страниц остаётся
+    product_ids = list(product_ids)
+    keys = [
+        make_template_fragment_key(fragment, [product_id])
+        for fragment in PRODUCT_FRAGMENTS
+        for product_id in product_ids
+    ]
+    if keys:
+        cache.delete_many(keys)
+    touch_modified(['products', *(f'product:{product_id}' for product_id in product_ids)])
+
+
+def page_cache_key(request, stamps=()):
+    # Пустые параметры отбрасываются, порядок параметров не важен.
+    # Отметки изменения данных страницы входят в ключ: после touch_modified страница строится заново
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values if value)
+    digest = hashlib.md5(f'{request.path}?{urlencode(params)}:{stamps}'.encode()).hexdigest()
+    return f'page:{page_generation()}:{digest}'
+
+
+def is_cacheable_request(request):
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return False
+    # Страница с непоказанными сообщениями у каждого своя
+    return CookieStorage.cookie_name not in request.COOKIES
+
+
+def cached_page_response(request, cached):
+    content, content_type = cached
+    token = get_token(request).encode()
+    response = HttpResponse(content.replace(CSRF_PLACEHOLDER, token), content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def store_page(key, response, timeout):
+    if response.status_code == 200 and not response.streaming and not response.cookies:
+        content = CSRF_INPUT_RE.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+        page_timeout = timeout if timeout is not None else settings.PAGE_CACHE_TIMEOUT
+        cache.set(key, (content, response['Content-Type']), page_timeout)
+        response['X-Page-Cache'] = 'miss'
+
+
+def cache_anonymous_page(timeout=None, stamp_names=None):
+    # Кэширует страницу целиком для анонимных посетителей.
+    # CSRF-токен в формах сохраняется заглушкой и подставляется для каждого запроса заново.
+    # Поколение в ключе меняет invalidate_pages; страницы, зависящие от товаров, передают stamp_names
+    # (как у conditional_page), иначе изменения товаров их не затронут.
+    def cache_key(request, *args, **kwargs):
+        stamps = modified_stamps(stamp_names(request, *args, **kwargs)) if stamp_names else ()
+        return page_cache_key(request, stamps)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Ленивый request.user обратился бы к базе синхронно, поэтому пользователь загружается заранее
+                request.user = await request.auser()
+                if not is_cacheable_request(request):
+                    return await view(request, *args, **kwargs)
+
+                key = cache_key(request, *args, **kwargs)
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached_page_response(request, cached)
+
+                response = await view(request, *args, **kwargs)
+                store_page(key, response, timeout)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            key = cache_key(request, *args, **kwargs)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached_page_response(request, cached)
+
+            response = view(request, *args, **kwargs)
+            store_page(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+def page_validators(request, names):
+    # ETag и Last-Modified страницы из отметок изменения данных. В ETag входят адрес с параметрами
+    # и CSRF-cookie: сохранённая браузером страница содержит токен, выданный под эту cookie
+    stamps = modified_stamps(names)
+    params = sorted((key, value) for key, values in request.GET.lists() for value in values)
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    source = f'{request.path}?{urlencode(params)}:{csrf_cookie}:{stamps}'
+    return quote_etag(hashlib.md5(source.encode()).hexdigest()), max(stamps) // 1_000_000_000
+
+
+def add_validators(response, etag, last_modified):
+    if response.status_code in (200, 304) and not response.has_header('ETag'):
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        # Браузер переспрашивает страницу каждый раз и получает 304, пока данные не изменились
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_page(stamp_names):
+    # Условный GET для анонимных посетителей: stamp_names(request, *args, **kwargs) возвращает имена отметок,
+    # от которых зависит страница. Совпавший If-None-Match или If-Modified-Since получает 304
+    # до запросов к базе и рендеринга. Ставится над cache_anonymous_page.
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                request.user = await request.auser()
+                if not is_cacheable_request(request):
+                    return await view(request, *args, **kwargs)
+                etag, last_modified = page_validators(request, stamp_names(request, *args, **kwargs))
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return add_validators(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+            etag, last_modified = page_validators(request, stamp_names(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def catalog_stamps(request, *args, **kwargs):
+    # Списки товаров (каталог, отзывы на странице «О нас») зависят от всех товаров и справочников
+    return ['pages', 'products']
+
+
+def product_stamps(request, pk, **kwargs):
+    # Товар, его отзывы, остатки и состав (invalidate_products) и названия из справочников
+    return [f'product:{pk}', 'lookups']
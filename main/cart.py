@@ -0,0 +1,152 @@
+import time
+import uuid
+from contextlib import contextmanager
+from django.contrib.sessions.backends.signed_cookies import SessionStore as CookieSessionStore
+from django.core.cache import cache
+from django.db import transaction
+from .models import Order, OrderItem, Product
+
+CART_SESSION_KEY = 'cart'
+# Сколько ждать блокировку корзины и через сколько она снимается сама, если запрос упал
+CART_LOCK_TIMEOUT = 5
+# Статус, под которым корзина раньше хранилась в таблице заказов
+DRAFT_STATUS = 'Черновик'
+
+
+class CartLine:
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def total(self):
+        return self.product.price * self.quantity
+
+
+class SessionCart:
+    # Корзина в сессии: {id товара: количество}. Строки Order/OrderItem появляются только при оформлении.
+    # Ключи хранятся строками, потому что сессия сериализуется в JSON.
+
+    def __init__(self, session):
+        self.session = session
+        self.items = dict(session.get(CART_SESSION_KEY) or {})
+
+    def __len__(self):
+        return len(self.items)
+
+    def save(self):
+        if self.items:
+            self.session[CART_SESSION_KEY] = self.items
+        else:
+            self.session.pop(CART_SESSION_KEY, None)
+
+    @contextmanager
+    def changing(self):
+        # Сессия читается в начале запроса и целиком сохраняется в конце, поэтому параллельные клики
+        # в одной сессии затирали бы изменения друг друга. Изменение корзины выполняется под блокировкой
+        # в общем кэше: корзина перечитывается из хранилища сессий и сразу записывается обратно.
+        session = self.session
+        if session.session_key is None or isinstance(session, CookieSessionStore):
+            # Новая сессия ещё никому не известна; сессия в cookie не хранится на сервере
+            yield
+            self.save()
+            return
+        lock_key = f'cart:lock:{session.session_key}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + CART_LOCK_TIMEOUT
+        while not cache.add(lock_key, token, CART_LOCK_TIMEOUT) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        try:
+            stored = type(session)(session.session_key)
+            self.items = dict(stored.get(CART_SESSION_KEY) or {})
+            if stored.session_key is None:
+                # Сессия истекла или удалена: изменения уйдут в новую вместе с ответом
+                yield
+                self.save()
+                return
+            yield
+            if self.items:
+                stored[CART_SESSION_KEY] = self.items
+            else:
+                stored.pop(CART_SESSION_KEY, None)
+            stored.save()
+            # Корзина уже записана; сессия запроса сохранится в конце только ради своих изменений
+            modified = session.modified
+            self.save()
+            session.modified = modified
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def add(self, product_id, quantity=1):
+        key = str(product_id)
+        with self.changing():
+            self.items[key] = self.items.get(key, 0) + quantity
+
+    def update(self, quantities):
+        # Количества только для товаров, которые уже в корзине; ноль удаляет строку
+        with self.changing():
+            for product_id, quantity in quantities.items():
+                key = str(product_id)
+                if key not in self.items:
+                    continue
+                if quantity > 0:
+                    self.items[key] = quantity
+                else:
+                    del self.items[key]
+
+    def remove(self, product_id):
+        with self.changing():
+            removed = self.items.pop(str(product_id), None) is not None
+        return removed
+
+    def clear(self):
+        with self.changing():
+            self.items = {}
+
+    def quantities(self):
+        return {int(key): quantity for key, quantity in self.items.items()}
+
+    def lines(self):
+        # Товары корзины одним запросом; удалённые из каталога товары пропускаются
+        quantities = self.quantities()
+        if not quantities:
+            return []
+        products = Product.objects.filter(id__in=quantities).order_by('name', 'id')
+        return [CartLine(product, quantities[product.id]) for product in products]
+
+
+def merge_draft_orders(cart, user):
+    # Черновики заказов, сохранённые в базе до перехода на корзину в сессии,
+    # переносятся в корзину при входе и удаляются
+    draft_ids = list(
+        Order.objects.filter(user=user, status__name=DRAFT_STATUS).values_list('id', flat=True)
+    )
+    if not draft_ids:
+        return
+    with transaction.atomic():
+        items = OrderItem.objects.filter(order_id__in=draft_ids).values_list('product_id', 'quantity')
+        for product_id, quantity in items:
+            cart.items[str(product_id)] = cart.items.get(str(product_id), 0) + quantity
+        OrderItem.objects.filter(order_id__in=draft_ids).delete()
+        Order.objects.filter(id__in=draft_ids).delete()
+    cart.save()
+
+
+def purge_draft_orders(before, batch_size=1000):
+    # Удаляет черновики заказов, созданные раньше before, пачками по id.
+    # Генератор возвращает число удалённых заказов нарастающим итогом.
+    total = 0
+    while True:
+        ids = list(
+            Order.objects.filter(status__name=DRAFT_STATUS, order_date__lt=before)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            OrderItem.objects.filter(order_id__in=ids).delete()
+            Order.objects.filter(id__in=ids).delete()
+        total += len(ids)
+        yield total
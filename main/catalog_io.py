@@ -0,0 +1,412 @@
+import csv
+import gzip
+import json
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import lookups
+from .caching import invalidate_pages, invalidate_products
+from .facets import facet_index
+from .models import Brand, Country, Nutrient, Product, ProductCategory, ProductComposition, Store, StoreInventory
+from .search import index_products
+from .stats import refresh_product_stats
+from .suggest import suggest_index
+from .utils import batched
+
+# Импорт и экспорт каталога потоком: строки читаются и пишутся по одной, в памяти держится одна пачка
+# и словари имя -> id для ссылок. Ссылки на товары задаются названием товара и бренда.
+
+FORMATS = ('csv', 'jsonl')
+CENT = Decimal('0.01')
+DECIMAL_LIMIT = Decimal('1e13')
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path.removesuffix('.gz')
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def open_text(path, mode):
+    # '-' означает stdin/stdout, файлы .gz читаются и пишутся со сжатием.
+    # Стандартный поток открывается заново по дескриптору (closefd=False): закрытие файла после импорта
+    # не закрывает sys.stdin, а чтение идёт в UTF-8 с newline='' для csv независимо от локали
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        stream.flush()
+        return open(stream.fileno(), mode, encoding='utf-8', newline='', closefd=False)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def read_rows(f, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_rows(f, fmt, columns, rows):
+    # rows — кортежи значений в порядке columns
+    if fmt == 'csv':
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(['' if value is None else export_value(value) for value in row])
+        return
+    for row in rows:
+        record = {column: None if value is None else export_value(value) for column, value in zip(columns, row)}
+        f.write(json.dumps(record, ensure_ascii=False))
+        f.write('\n')
+
+
+def counted(rows, every, report):
+    # Пропускает строки насквозь и каждые every строк сообщает, сколько прошло и с какой скоростью
+    started = time.perf_counter()
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        yield row
+        if count % every == 0:
+            report(count, count / (time.perf_counter() - started))
+    report(count, count / max(time.perf_counter() - started, 1e-9))
+
+
+def export_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def text(row, field, required=False):
+    value = row.get(field)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportRowError(f'не заполнено поле {field}')
+    return value
+
+
+def decimal(row, field):
+    # Цены и количества в составе — DecimalField(15, 2): до 13 знаков до запятой, дробь округляется до копеек.
+    # Значение, которое база не примет, отклоняет строку, а не всю пачку при записи
+    try:
+        value = Decimal(text(row, field, required=True))
+    except InvalidOperation:
+        raise ImportRowError(f'{field}: не число {row.get(field)!r}')
+    if value.is_finite() and 0 <= value < DECIMAL_LIMIT:
+        value = value.quantize(CENT)
+        # 9999999999999.999 округляется до 10000000000000.00
+        if value < DECIMAL_LIMIT:
+            return value
+    raise ImportRowError(f'{field}: недопустимое значение {row.get(field)!r}')
+
+
+def integer(row, field):
+    try:
+        return int(text(row, field, required=True))
+    except ValueError:
+        raise ImportRowError(f'{field}: не целое число {row.get(field)!r}')
+
+
+def moment(row, field):
+    value = text(row, field)
+    if not value:
+        return timezone.now()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ImportRowError(f'{field}: не дата {value!r}')
+    return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+
+
+class NameMap:
+    # {имя: id} таблицы, загруженный один раз; недостающие записи создаются, если create=True
+    def __init__(self, model, create=False):
+        self.model = model
+        self.create = create
+        self.ids = dict(model.objects.values_list('name', 'id'))
+
+    def resolve(self, name):
+        if not name:
+            return None
+        pk = self.ids.get(name)
+        if pk is None:
+            if not self.create:
+                raise ImportRowError(f'{self.model._meta.verbose_name} {name!r} не найден')
+            pk = self.ids[name] = self.model.objects.create(name=name).id
+        return pk
+
+
+class ProductMap:
+    # {(id бренда, название): id товара} для ссылок из остатков и состава
+    def __init__(self, brands):
+        self.brands = brands
+        self.ids = {
+            (brand_id, name): pk
+            for pk, brand_id, name in Product.objects.values_list('id', 'brand_id', 'name').iterator(chunk_size=10_000)
+        }
+
+    def resolve(self, row):
+        name = text(row, 'product', required=True)
+        brand_name = text(row, 'brand')
+        brand_id = self.brands.resolve(brand_name)
+        pk = self.ids.get((brand_id, name))
+        if pk is None:
+            raise ImportRowError(f'товар {name!r} бренда {brand_name!r} не найден')
+        return pk
+
+
+class Importer:
+    # Правила импорта одного вида строк: build собирает несохранённый объект,
+    # key_fields — ключ для upsert, candidates сужает выборку существующих строк для ключей одной пачки
+    model = None
+    key_fields = ()
+    update_fields = ()
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def candidates(self, keys):
+        raise NotImplementedError
+
+    def key(self, obj):
+        return tuple(getattr(obj, field) for field in self.key_fields)
+
+    def values(self, obj):
+        return tuple(getattr(obj, field) for field in self.update_fields)
+
+    def existing(self, keys):
+        # {ключ: (id, текущие значения обновляемых полей)}; совпадающие строки не переписываются
+        size = len(self.key_fields)
+        rows = self.candidates(keys).values_list('id', *self.key_fields, *self.update_fields)
+        found = {}
+        for pk, *values in rows:
+            key = tuple(values[:size])
+            if key in keys:
+                found[key] = (pk, tuple(values[size:]))
+        return found
+
+    def batch_saved(self, objs):
+        pass
+
+    def finish(self):
+        pass
+
+
+class BrandImporter(Importer):
+    model = Brand
+    key_fields = ('name',)
+    update_fields = ('description', 'photo', 'country_id')
+
+    def __init__(self):
+        self.countries = NameMap(Country, create=True)
+
+    def build(self, row):
+        return Brand(
+            name=text(row, 'name', required=True),
+            description=text(row, 'description'),
+            photo=text(row, 'photo'),
+            country_id=self.countries.resolve(text(row, 'country')),
+        )
+
+    def candidates(self, keys):
+        return Brand.objects.filter(name__in=[name for name, in keys])
+
+    def finish(self):
+        # bulk_create и bulk_update не отправляют сигналы сохранения
+        lookups.brands.invalidate()
+        suggest_index.invalidate()
+        facet_index.invalidate()
+        invalidate_pages()
+
+
+class ProductImporter(Importer):
+    model = Product
+    key_fields = ('brand_id', 'name')
+    update_fields = ('category_id', 'price', 'description', 'photo', 'certificate')
+
+    def __init__(self):
+        self.brands = NameMap(Brand, create=True)
+        self.categories = NameMap(ProductCategory, create=True)
+
+    def build(self, row):
+        return Product(
+            name=text(row, 'name', required=True),
+            brand_id=self.brands.resolve(text(row, 'brand')),
+            category_id=self.categories.resolve(text(row, 'category')),
+            price=decimal(row, 'price'),
+            description=text(row, 'description'),
+            photo=text(row, 'photo'),
+            certificate=text(row, 'certificate'),
+        )
+
+    def candidates(self, keys):
+        return Product.objects.filter(name__in={name for _, name in keys})
+
+    def batch_saved(self, objs):
+        ids = [obj.pk for obj in objs]
+        index_products(ids)
+        refresh_product_stats(ids)
+
+    def finish(self):
+        suggest_index.invalidate()
+
+
+class InventoryImporter(Importer):
+    model = StoreInventory
+    key_fields = ('store_id', 'product_id')
+    update_fields = ('quantity', 'updated_at')
+
+    def __init__(self):
+        self.stores = NameMap(Store)
+        self.products = ProductMap(NameMap(Brand))
+
+    def build(self, row):
+        return StoreInventory(
+            store_id=self.stores.resolve(text(row, 'store', required=True)),
+            product_id=self.products.resolve(row),
+            quantity=integer(row, 'quantity'),
+            updated_at=moment(row, 'updated_at'),
+        )
+
+    def candidates(self, keys):
+        # Выборка по индексу idx_storeinv_store_product, лишние пары отбрасываются в existing
+        return StoreInventory.objects.filter(
+            store_id__in={store_id for store_id, _ in keys},
+            product_id__in={product_id for _, product_id in keys},
+        )
+
+    def batch_saved(self, objs):
+        refresh_product_stats({obj.product_id for obj in objs})
+
+
+class CompositionImporter(Importer):
+    model = ProductComposition
+    key_fields = ('product_id', 'nutrient_id')
+    update_fields = ('amount',)
+
+    def __init__(self):
+        self.nutrients = NameMap(Nutrient, create=True)
+        self.products = ProductMap(NameMap(Brand))
+
+    def build(self, row):
+        return ProductComposition(
+            product_id=self.products.resolve(row),
+            nutrient_id=self.nutrients.resolve(text(row, 'nutrient', required=True)),
+            amount=decimal(row, 'amount'),
+        )
+
+    def candidates(self, keys):
+        return ProductComposition.objects.filter(product_id__in={product_id for product_id, _ in keys})
+
+    def batch_saved(self, objs):
+        product_ids = {obj.product_id for obj in objs}
+        invalidate_products(product_ids)
+        facet_index.refresh(product_ids)
+
+
+IMPORTERS = {
+    'brands': BrandImporter,
+    'products': ProductImporter,
+    'inventory': InventoryImporter,
+    'composition': CompositionImporter,
+}
+
+# Колонки файла и поля для values_list при экспорте
+EXPORT_COLUMNS = {
+    'brands': (Brand, {
+        'name': 'name', 'description': 'description', 'photo': 'photo', 'country': 'country__name',
+    }),
+    'products': (Product, {
+        'name': 'name', 'brand': 'brand__name', 'category': 'category__name', 'price': 'price',
+        'description': 'description', 'photo': 'photo', 'certificate': 'certificate',
+    }),
+    'inventory': (StoreInventory, {
+        'store': 'store__name', 'product': 'product__name', 'brand': 'product__brand__name',
+        'quantity': 'quantity', 'updated_at': 'updated_at',
+    }),
+    'composition': (ProductComposition, {
+        'product': 'product__name', 'brand': 'product__brand__name', 'nutrient': 'nutrient__name',
+        'amount': 'amount',
+    }),
+}
+
+
+def import_rows(kind, rows, batch_size=1000, max_errors=20):
+    # Upsert строк пачками: новые вставляются bulk_create, изменившиеся обновляются bulk_update,
+    # совпадающие с базой пропускаются. Генератор после каждой пачки возвращает счётчики и скорость.
+    importer = IMPORTERS[kind]()
+    model = importer.model
+    progress = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'errors': [], 'rows_per_s': 0.0}
+    started = time.perf_counter()
+
+    for batch in batched(enumerate(rows, start=1), batch_size):
+        objs = {}
+        for number, row in batch:
+            try:
+                obj = importer.build(row)
+            except ImportRowError as e:
+                progress['skipped'] += 1
+                if len(progress['errors']) < max_errors:
+                    progress['errors'].append(f'строка {number}: {e}')
+                continue
+            # Повтор ключа внутри пачки: побеждает последняя строка
+            objs[importer.key(obj)] = obj
+
+        existing = importer.existing(set(objs)) if objs else {}
+        to_create, to_update = [], []
+        for key, obj in objs.items():
+            if key not in existing:
+                to_create.append(obj)
+                continue
+            obj.pk, current = existing[key]
+            if importer.values(obj) != current:
+                to_update.append(obj)
+
+        with transaction.atomic():
+            model.objects.bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                fields = [model._meta.get_field(field).name for field in importer.update_fields]
+                # bulk_update не заполняет поля auto_now, в отличие от save и bulk_create
+                now = timezone.now()
+                for field in model._meta.concrete_fields:
+                    if getattr(field, 'auto_now', False):
+                        fields.append(field.name)
+                        for obj in to_update:
+                            setattr(obj, field.attname, now)
+                model.objects.bulk_update(to_update, fields, batch_size=batch_size)
+            # MySQL не возвращает id вставленных строк
+            missing = [obj for obj in to_create if obj.pk is None]
+            if missing:
+                created = importer.existing({importer.key(obj) for obj in missing})
+                for obj in missing:
+                    obj.pk = created[importer.key(obj)][0]
+            if to_create or to_update:
+                importer.batch_saved(to_create + to_update)
+
+        progress['rows'] += len(batch)
+        progress['created'] += len(to_create)
+        progress['updated'] += len(to_update)
+        progress['unchanged'] += len(objs) - len(to_create) - len(to_update)
+        progress['rows_per_s'] = round(progress['rows'] / (time.perf_counter() - started), 1)
+        yield progress
+
+    importer.finish()
+
+
+def export_rows(kind, chunk_size=2000):
+    model, columns = EXPORT_COLUMNS[kind]
+    rows = model.objects.order_by('id').values_list(*columns.values()).iterator(chunk_size=chunk_size)
+    return list(columns), rows
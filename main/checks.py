@@ -0,0 +1,16 @@
+from django.core.checks import Tags, Warning, register
+from .assets import missing_vendor_assets
+
+
+@register(Tags.staticfiles, deploy=True)
+def vendor_assets_check(app_configs, **kwargs):
+    # Сторонние CSS и JS не хранятся в репозитории: без vendor_assets страницы рабочего сервера
+    # зависят от чужих CDN
+    missing = missing_vendor_assets()
+    if not missing:
+        return []
+    return [Warning(
+        f"Нет локальных копий: {', '.join(missing)}; страницы подключают их с CDN",
+        hint='Выполните python manage.py vendor_assets перед collectstatic',
+        id='main.W001',
+    )]
@@ -0,0 +1,17 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+def increment_quantity(model, amount=1, **lookup):
+    # Увеличивает quantity строки одним UPDATE ... SET quantity = quantity + amount.
+    # Если строки нет, она создаётся; гонку двух вставок разрешает уникальное ограничение,
+    # проигравший запрос повторяет UPDATE. Возвращает True, если строка создана.
+    if model.objects.filter(**lookup).update(quantity=F('quantity') + amount):
+        return False
+    try:
+        with transaction.atomic():
+            model.objects.create(quantity=amount, **lookup)
+        return True
+    except IntegrityError:
+        model.objects.filter(**lookup).update(quantity=F('quantity') + amount)
+        return False
@@ -0,0 +1,302 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from decimal import Decimal, InvalidOperation
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from . import lookups
+from .models import Product, ProductComposition
+
+# Фасеты каталога: (GET-параметр, заголовок). Внутри фасета выбранные значения объединяются через ИЛИ,
+# между фасетами — через И
+FACETS = (
+    ('category', 'Категории'),
+    ('brand', 'Бренд'),
+    ('country', 'Страна'),
+    ('nutrient', 'Состав'),
+    ('rating', 'Рейтинг'),
+    ('stock', 'Наличие'),
+)
+FACET_NAMES = tuple(name for name, _ in FACETS)
+# Корзины рейтинга — нижние границы: товар с оценкой 4.3 входит в «от 4», «от 3» и т. д.
+RATING_BUCKETS = (4, 3, 2, 1)
+IN_STOCK = 1
+
+VERSION_KEY = 'facets:version'
+CHANGES_PREFIX = 'facets:changes:'
+CHANGES_TIMEOUT = 3600
+# Если процесс отстал больше чем на столько изменений, индекс строится заново
+MAX_PENDING_CHANGES = 200
+
+
+def param_list(params, name):
+    # QueryDict из запроса или обычный словарь (explain_queries)
+    if hasattr(params, 'getlist'):
+        return params.getlist(name)
+    value = params.get(name)
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+def parse_facet_filters(params):
+    # {фасет: [id, ...]} только с корректными значениями
+    filters = {}
+    for name in FACET_NAMES:
+        values = set()
+        for value in param_list(params, name):
+            try:
+                values.add(int(value))
+            except (TypeError, ValueError):
+                continue
+        if name == 'rating':
+            values &= set(RATING_BUCKETS)
+        elif name == 'stock':
+            values &= {IN_STOCK}
+        if values:
+            filters[name] = sorted(values)
+    return filters
+
+
+def parse_price(value):
+    try:
+        price = Decimal(value)
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+    return price if price.is_finite() else None
+
+
+def filter_products(products, filters):
+    # Те же условия, что и у индекса, но в SQL: по ним строится выдача каталога
+    if 'category' in filters:
+        products = products.filter(category_id__in=filters['category'])
+    if 'brand' in filters:
+        products = products.filter(brand_id__in=filters['brand'])
+    if 'country' in filters:
+        products = products.filter(brand__country_id__in=filters['country'])
+    if 'nutrient' in filters:
+        products = products.filter(Exists(ProductComposition.objects.filter(
+            product=OuterRef('pk'), nutrient_id__in=filters['nutrient'],
+        )))
+    if 'rating' in filters:
+        products = products.filter(stats__average_rating__gte=min(filters['rating']))
+    if 'stock' in filters:
+        products = products.filter(stats__total_quantity__gt=0)
+    return products
+
+
+def bits_from_positions(positions, size):
+    # Множество позиций -> битовая маска в виде int; через bytearray, а не побитовым |= по большому числу
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def product_values(category_id, brand_id, country_id, rating, quantity, nutrients):
+    # Значения всех фасетов одного товара: [(фасет, значение), ...]
+    values = [('category', category_id), ('brand', brand_id), ('country', country_id)]
+    values += [('nutrient', nutrient_id) for nutrient_id in nutrients]
+    if rating is not None:
+        values += [('rating', bucket) for bucket in RATING_BUCKETS if rating >= bucket]
+    if quantity and quantity > 0:
+        values.append(('stock', IN_STOCK))
+    return [(facet, value) for facet, value in values if value is not None]
+
+
+class FacetIndex:
+    # Битовые маски по значениям фасетов в памяти процесса: каждому товару выдаётся позиция, маска значения —
+    # int с единицами в позициях товаров с этим значением. Количество товаров для значения при текущих фильтрах —
+    # popcount пересечения масок, без запросов к базе.
+    # Изменения товаров записываются в общий кэш журналом: номер версии и список id товаров для каждой версии.
+    # Процесс, увидевший новую версию, перечитывает только эти товары; при пропусках в журнале строит индекс заново.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def bump(self):
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, time.time_ns(), None)
+            return None
+
+    def invalidate(self):
+        # Полная перестройка во всех процессах: у новой версии нет записи в журнале
+        self.bump()
+
+    def refresh(self, product_ids):
+        # Товары перечитываются при следующем обращении к индексу в каждом процессе
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return
+        version = self.bump()
+        if version is not None:
+            cache.set(f'{CHANGES_PREFIX}{version}', product_ids, CHANGES_TIMEOUT)
+
+    def load_rows(self, product_ids=None):
+        products = Product.objects.order_by()
+        compositions = ProductComposition.objects.filter(nutrient__isnull=False).order_by()
+        if product_ids is not None:
+            products = products.filter(id__in=product_ids)
+            compositions = compositions.filter(product_id__in=product_ids)
+        nutrients = {}
+        for product_id, nutrient_id in compositions.values_list('product_id', 'nutrient_id').distinct():
+            nutrients.setdefault(product_id, []).append(nutrient_id)
+        rows = products.values_list(
+            'id', 'category_id', 'brand_id', 'brand__country_id', 'price',
+            'stats__average_rating', 'stats__total_quantity',
+        )
+        for product_id, category_id, brand_id, country_id, price, rating, quantity in rows.iterator(chunk_size=5000):
+            values = product_values(category_id, brand_id, country_id, rating, quantity, nutrients.get(product_id, ()))
+            yield product_id, price, values
+
+    def build(self, version):
+        positions, prices, members = {}, [], {name: {} for name in FACET_NAMES}
+        for product_id, price, values in self.load_rows():
+            position = positions[product_id] = len(prices)
+            prices.append(price)
+            for facet, value in values:
+                members[facet].setdefault(value, []).append(position)
+        size = len(prices)
+        return self.snapshot(
+            version, positions, prices,
+            {facet: {value: bits_from_positions(found, size) for value, found in values.items()}
+             for facet, values in members.items()},
+            alive=(1 << size) - 1,
+        )
+
+    def snapshot(self, version, positions, prices, bitsets, alive):
+        # Снимок не изменяется после создания: запросы читают его без блокировки
+        order = sorted((price, position) for position, price in enumerate(prices) if price is not None)
+        return {
+            'version': version,
+            'positions': positions,
+            'prices': prices,
+            'bitsets': bitsets,
+            'alive': alive,
+            'price_order': [price for price, _ in order],
+            'price_positions': [position for _, position in order],
+            'size': len(prices),
+        }
+
+    def apply(self, data, version, product_ids):
+        # Новый снимок с перечитанными товарами; удалённые товары остаются позициями без битов
+        positions, prices = dict(data['positions']), list(data['prices'])
+        bitsets = {facet: dict(values) for facet, values in data['bitsets'].items()}
+        alive = data['alive']
+        for product_id in product_ids:
+            position = positions.get(product_id)
+            if position is None:
+                continue
+            clear = ~(1 << position)
+            for values in bitsets.values():
+                for value, bits in values.items():
+                    if bits >> position & 1:
+                        values[value] = bits & clear
+            alive &= clear
+            prices[position] = None
+        for product_id, price, values in self.load_rows(product_ids):
+            position = positions.get(product_id)
+            if position is None:
+                position = positions[product_id] = len(prices)
+                prices.append(None)
+            bit = 1 << position
+            prices[position] = price
+            alive |= bit
+            for facet, value in values:
+                bitsets[facet][value] = bitsets[facet].get(value, 0) | bit
+        return self.snapshot(version, positions, prices, bitsets, alive)
+
+    def pending_changes(self, since, version):
+        # Список изменённых товаров между версиями или None, если журнал неполон
+        if version < since or version - since > MAX_PENDING_CHANGES:
+            return None
+        keys = [f'{CHANGES_PREFIX}{number}' for number in range(since + 1, version + 1)]
+        found = cache.get_many(keys)
+        if len(found) != len(keys):
+            return None
+        return {product_id for key in keys for product_id in found[key]}
+
+    def data(self):
+        version = self.version()
+        data = self._data
+        if data is not None and data['version'] == version:
+            return data
+        with self._lock:
+            data = self._data
+            if data is None or data['version'] != version:
+                changes = self.pending_changes(data['version'], version) if data is not None else None
+                data = self._data = self.build(version) if changes is None else self.apply(data, version, changes)
+        return data
+
+    def price_mask(self, data, price_min, price_max):
+        if price_min is None and price_max is None:
+            return data['alive']
+        order = data['price_order']
+        start = bisect_left(order, price_min) if price_min is not None else 0
+        end = bisect_right(order, price_max) if price_max is not None else len(order)
+        return bits_from_positions(data['price_positions'][start:end], data['size'])
+
+    def counts(self, filters, price_min=None, price_max=None):
+        # {фасет: {значение: количество}} — для каждого фасета учитываются фильтры всех остальных,
+        # чтобы было видно, сколько товаров добавит выбор ещё одного значения. Плюс общее число найденных
+        data = self.data()
+        bitsets = data['bitsets']
+        base = data['alive'] & self.price_mask(data, price_min, price_max)
+        selected = {}
+        for facet, values in filters.items():
+            mask = 0
+            for value in values:
+                mask |= bitsets[facet].get(value, 0)
+            selected[facet] = mask
+
+        counts = {}
+        for facet in FACET_NAMES:
+            mask = base
+            for other, other_mask in selected.items():
+                if other != facet:
+                    mask &= other_mask
+            counts[facet] = {value: (bits & mask).bit_count() for value, bits in bitsets[facet].items()}
+        total = base
+        for mask in selected.values():
+            total &= mask
+        return counts, total.bit_count()
+
+
+facet_index = FacetIndex()
+
+
+def facet_labels():
+    # Названия значений из справочников в памяти процесса
+    return {
+        'category': [(row.id, row.name) for row in lookups.categories.all()],
+        'brand': [(row.id, row.name) for row in lookups.brands.all()],
+        'country': [(row.id, row.name) for row in lookups.countries.all()],
+        'nutrient': [(row.id, row.name) for row in lookups.nutrients.all()],
+        'rating': [(bucket, f'от {bucket} ★') for bucket in RATING_BUCKETS],
+        'stock': [(IN_STOCK, 'В наличии')],
+    }
+
+
+def catalog_facets(filters, price_min=None, price_max=None):
+    # Группы флажков для боковой панели каталога. Значения без товаров скрываются, если они не выбраны
+    counts, total = facet_index.counts(filters, price_min, price_max)
+    labels = facet_labels()
+    groups = []
+    for name, title in FACETS:
+        chosen = set(filters.get(name, ()))
+        options = [
+            {'value': value, 'label': label, 'count': counts[name].get(value, 0), 'selected': value in chosen}
+            for value, label in labels[name]
+            if counts[name].get(value) or value in chosen
+        ]
+        if options:
+            groups.append({'name': name, 'title': title, 'options': options})
+    return {'groups': groups, 'total': total}
@@ -0,0 +1,169 @@
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.db import transaction
+from .caching import invalidate_pages, invalidate_products
+from .models import Brand, ImageVariant, Product
+from .utils import batched
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Уменьшенные копии фотографий товаров и брендов в WebP и исходном формате (JPEG или PNG с прозрачностью).
+# Картинки обрабатываются заранее командой build_image_variants в пуле процессов; пути копий хранятся
+# в ImageVariant, шаблоны строят из них srcset. Копии пишутся в IMAGE_VARIANTS_ROOT/variants/...,
+# откуда их раздаёт staticfiles.
+
+VARIANTS_DIR = 'variants'
+DEFAULT_WIDTHS = (240, 480, 960)
+CACHE_PREFIX = 'image-variants:'
+CACHE_TIMEOUT = 24 * 3600
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS))
+
+
+def variants_root():
+    return Path(getattr(settings, 'IMAGE_VARIANTS_ROOT', Path(__file__).resolve().parent / 'static'))
+
+
+def variant_name(source, width, extension):
+    # images/whey.jpg -> variants/images/whey-480w.webp
+    path = PurePosixPath(source)
+    return str(PurePosixPath(VARIANTS_DIR) / path.parent / f'{path.stem}-{width}w.{extension}')
+
+
+def cache_key(source):
+    return CACHE_PREFIX + hashlib.md5(source.encode()).hexdigest()
+
+
+def process_image(job):
+    # Выполняется в отдельном процессе, без обращения к Django:
+    # job — (source, абсолютный путь, время изменения, корень, ширины).
+    # Возвращает (source, время изменения, [(ширина, высота, формат, путь), ...], текст ошибки или None).
+    source, full_path, mtime, root, widths = job
+    try:
+        variants = []
+        with Image.open(full_path) as image:
+            image.load()
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+            fallback = ('png', 'PNG', {'optimize': True}) if has_alpha else \
+                ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True})
+            # Копии шире оригинала не делаются, самая крупная — оригинальной ширины
+            targets = sorted({min(width, image.width) for width in widths})
+            for width in targets:
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+                for extension, fmt, params in (('webp', 'WEBP', {'quality': 80, 'method': 6}), fallback):
+                    name = variant_name(source, width, extension)
+                    target = os.path.join(root, name)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    resized.save(target, fmt, **params)
+                    variants.append((width, height, extension, name))
+        return source, mtime, variants, None
+    except Exception as e:
+        return source, mtime, [], f'{type(e).__name__}: {e}'
+
+
+def image_sources():
+    # Все пути фотографий из базы без повторов
+    sources = set(Product.objects.exclude(photo='').values_list('photo', flat=True).distinct().iterator())
+    sources.update(Brand.objects.exclude(photo='').values_list('photo', flat=True))
+    return sorted(sources)
+
+
+def pending_jobs(sources, force=False):
+    # Задания для файлов без копий или изменившихся после обработки; отсутствующие файлы — отдельным списком
+    processed = {}
+    if not force:
+        processed = dict(
+            ImageVariant.objects.filter(source__in=sources).values_list('source', 'source_mtime').distinct()
+        )
+    jobs, missing = [], []
+    root, widths = str(variants_root()), variant_widths()
+    for source in sources:
+        full_path = finders.find(source)
+        if not full_path:
+            missing.append(source)
+            continue
+        mtime = os.path.getmtime(full_path)
+        if processed.get(source) == mtime:
+            continue
+        jobs.append((source, full_path, mtime, root, widths))
+    return jobs, missing
+
+
+def save_variants(results):
+    # Копии каждого исходника заменяются целиком
+    rows, sources = [], []
+    for source, mtime, variants, error in results:
+        if error:
+            continue
+        sources.append(source)
+        rows.extend(
+            ImageVariant(source=source, width=width, height=height, format=fmt, path=path, source_mtime=mtime)
+            for width, height, fmt, path in variants
+        )
+    with transaction.atomic():
+        ImageVariant.objects.filter(source__in=sources).delete()
+        ImageVariant.objects.bulk_create(rows)
+    cache.delete_many([cache_key(source) for source in sources])
+    # Карточки товаров в кэше фрагментов содержат старую разметку картинки
+    invalidate_products(Product.objects.filter(photo__in=sources).values_list('id', flat=True))
+    # Фото брендов выводятся на странице «О нас»
+    if Brand.objects.filter(photo__in=sources).exists():
+        invalidate_pages()
+    return sources
+
+
+def build_variants(sources, workers=None, batch_size=100, force=False):
+    # Генератор: после каждой пачки возвращает счётчики. Пачки обрабатываются пулом процессов,
+    # поэтому прерванный запуск продолжается с необработанных файлов.
+    if Image is None:
+        raise RuntimeError('Для обработки изображений нужен пакет Pillow')
+    progress = {'processed': 0, 'skipped': 0, 'missing': [], 'errors': []}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch in batched(sources, batch_size):
+            jobs, missing = pending_jobs(batch, force)
+            progress['missing'].extend(missing)
+            progress['skipped'] += len(batch) - len(jobs) - len(missing)
+            results = list(executor.map(process_image, jobs, chunksize=4))
+            progress['errors'].extend(f'{source}: {error}' for source, _, _, error in results if error)
+            progress['processed'] += len(save_variants(results))
+            yield progress
+
+
+def variants_for(sources):
+    # {source: [ImageVariant, ...]} по возрастанию ширины; из кэша, недостающие — одним запросом
+    sources = {source for source in sources if source}
+    if not sources:
+        return {}
+    keys = {cache_key(source): source for source in sources}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = sources - found.keys()
+    if missing:
+        loaded = defaultdict(list)
+        for variant in ImageVariant.objects.filter(source__in=missing).order_by('width', 'format'):
+            loaded[variant.source].append(variant)
+        fresh = {source: loaded.get(source, []) for source in missing}
+        cache.set_many({cache_key(source): value for source, value in fresh.items()}, CACHE_TIMEOUT)
+        found.update(fresh)
+    return found
+
+
+def attach_variants(objects, field='photo'):
+    # Проставляет объектам атрибут <field>_variants для тега responsive_img
+    objects = list(objects)
+    variants = variants_for(getattr(obj, field) for obj in objects)
+    for obj in objects:
+        setattr(obj, f'{field}_variants', variants.get(getattr(obj, field), []))
+    return objects
@@ -0,0 +1,189 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Product, Store, StoreInventory
+from .pagination import keyset_filter
+from .stats import refresh_product_stats
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # {product_id: доступное количество}
+        self.shortages = shortages
+        super().__init__(f'Недостаточно товара на складе: {shortages}')
+
+
+def reserve_stock(store, quantities):
+    # Списывает остатки магазина под заказ: {product_id: количество}.
+    # Строки остатков блокируются одним запросом, списание идёт условным UPDATE,
+    # поэтому параллельные оформления не уводят остаток в минус.
+    quantities = {product_id: qty for product_id, qty in quantities.items() if qty > 0}
+    if not quantities:
+        return
+
+    with transaction.atomic():
+        rows = defaultdict(list)
+        stock = (
+            StoreInventory.objects.select_for_update()
+            .filter(store=store, product_id__in=quantities)
+            .order_by('id')
+        )
+        for row in stock:
+            rows[row.product_id].append(row)
+
+        shortages = {}
+        for product_id, qty in quantities.items():
+            available = sum(row.quantity for row in rows[product_id])
+            if available < qty:
+                shortages[product_id] = available
+        if shortages:
+            raise InsufficientStock(shortages)
+
+        now = timezone.now()
+        for product_id, qty in quantities.items():
+            remaining = qty
+            for row in rows[product_id]:
+                take = min(row.quantity, remaining)
+                if take <= 0:
+                    continue
+                updated = StoreInventory.objects.filter(pk=row.pk, quantity__gte=take).update(
+                    quantity=F('quantity') - take,
+                    updated_at=now,
+                    changed_at=now,
+                )
+                if not updated:
+                    # Остаток изменился мимо блокировки (например, в SQLite)
+                    raise InsufficientStock({product_id: available_quantity(store, product_id)})
+                remaining -= take
+                if not remaining:
+                    break
+
+        refresh_product_stats(quantities)
+
+
+def available_quantity(store, product_id):
+    return sum(StoreInventory.objects.filter(store=store, product_id=product_id).values_list('quantity', flat=True))
+
+
+class InventoryBatchError(ValueError):
+    def __init__(self, errors):
+        # Список сообщений об ошибочных элементах пачки
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def parse_inventory_changes(items):
+    # Пачка от магазина: [{"product_id": 1, "quantity": 5, "updated_at": "2026-01-01T10:00:00+03:00"}, ...].
+    # Возвращает {product_id: (количество, время изменения)}; при повторе товара побеждает более позднее изменение.
+    if not isinstance(items, list):
+        raise InventoryBatchError(['ожидается список изменений'])
+    limit = getattr(settings, 'INVENTORY_SYNC_MAX_BATCH', 5000)
+    if len(items) > limit:
+        raise InventoryBatchError([f'в пачке больше {limit} изменений'])
+
+    changes, errors = {}, []
+    for number, item in enumerate(items):
+        try:
+            product_id, quantity, updated_at = item['product_id'], item['quantity'], item['updated_at']
+        except (KeyError, TypeError):
+            errors.append(f'{number}: нужны поля product_id, quantity и updated_at')
+            continue
+        moment = parse_datetime(updated_at) if isinstance(updated_at, str) else None
+        if type(product_id) is not int or type(quantity) is not int or quantity < 0:
+            errors.append(f'{number}: product_id и quantity должны быть целыми, quantity не меньше нуля')
+        elif moment is None:
+            errors.append(f'{number}: updated_at не дата {updated_at!r}')
+        else:
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            if product_id not in changes or changes[product_id][1] < moment:
+                changes[product_id] = (quantity, moment)
+    if errors:
+        raise InventoryBatchError(errors)
+    return changes
+
+
+def apply_inventory_changes(store, changes):
+    # Применяет пачку {product_id: (количество, updated_at)} одного магазина.
+    # Текущие строки читаются одним запросом по индексу idx_storeinv_store_product,
+    # новые вставляются bulk_create, изменившиеся обновляются bulk_update.
+    # Изменение не новее записанного (updated_at не больше) пропускается как устаревшее.
+    result = {'created': 0, 'updated': 0, 'unchanged': 0, 'stale': 0, 'unknown': []}
+    known = set(Product.objects.filter(id__in=changes).values_list('id', flat=True))
+    result['unknown'] = sorted(set(changes) - known)
+    if not known:
+        return result
+
+    with transaction.atomic():
+        # Пачки одного магазина применяются по очереди, иначе две пачки могут вставить одну и ту же пару
+        Store.objects.select_for_update().filter(pk=store.pk).values_list('id').get()
+        rows = defaultdict(list)
+        current = (
+            StoreInventory.objects.filter(store=store, product_id__in=known)
+            .order_by('id')
+            .values_list('id', 'product_id', 'quantity', 'updated_at', 'changed_at')
+        )
+        for row in current:
+            rows[row[1]].append(row)
+
+        now = timezone.now()
+        to_create, to_update, duplicates, changed = [], [], [], set()
+        for product_id in known:
+            quantity, updated_at = changes[product_id]
+            existing = rows.get(product_id)
+            if not existing:
+                to_create.append(StoreInventory(
+                    store=store, product_id=product_id, quantity=quantity, updated_at=updated_at,
+                ))
+                changed.add(product_id)
+                continue
+            if updated_at <= max(row[3] for row in existing):
+                result['stale'] += 1
+                continue
+            # Магазин сообщает полный остаток товара: лишние строки той же пары сводятся в первую
+            first, *rest = existing
+            duplicates.extend(row[0] for row in rest)
+            changed_at = now
+            if quantity == first[2] and not rest:
+                # Количество то же: обновляется только время магазина, в ленту изменений строка не попадает
+                changed_at = first[4]
+                result['unchanged'] += 1
+            else:
+                changed.add(product_id)
+            to_update.append(StoreInventory(
+                pk=first[0], store=store, product_id=product_id, quantity=quantity,
+                updated_at=updated_at, changed_at=changed_at,
+            ))
+
+        StoreInventory.objects.bulk_create(to_create)
+        if to_update:
+            # bulk_update не заполняет auto_now, changed_at выставлен явно
+            StoreInventory.objects.bulk_update(to_update, ['quantity', 'updated_at', 'changed_at'])
+        if duplicates:
+            StoreInventory.objects.filter(id__in=duplicates).delete()
+        if changed:
+            refresh_product_stats(changed)
+
+    result['created'] = len(to_create)
+    result['updated'] = len(to_update) - result['unchanged']
+    return result
+
+
+def inventory_changes(since=None, after_id=None, limit=500, store=None):
+    # Лента изменений остатков по времени записи на сервере с курсором (changed_at, id).
+    # Строки моложе INVENTORY_FEED_DELAY не отдаются: транзакция, начатая раньше, может
+    # зафиксироваться позже и иначе оказалась бы позади курсора читателя.
+    delay = timedelta(seconds=getattr(settings, 'INVENTORY_FEED_DELAY', 5))
+    rows = StoreInventory.objects.filter(changed_at__lte=timezone.now() - delay)
+    if store is not None:
+        rows = rows.filter(store=store)
+    if since is not None:
+        rows = rows.filter(keyset_filter(('changed_at', 'id'), (since, after_id or 0)))
+    return list(
+        rows.order_by('changed_at', 'id')
+        .values('id', 'store_id', 'product_id', 'quantity', 'updated_at', 'changed_at')[:limit]
+    )
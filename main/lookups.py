@@ -0,0 +1,74 @@
+import time
+from django.core.cache import cache
+from .caching import touch_modified
+from .models import Brand, Country, Nutrient, OrderStatus, ProductCategory, Store
+
+
+class LookupTable:
+    # Кэш маленького справочника в памяти процесса.
+    # Актуальность сверяется с номером версии в общем кэше Django: сигналы сохранения
+    # и удаления увеличивают версию, и все процессы перечитывают таблицу при следующем обращении.
+
+    def __init__(self, model, ordering=('id',)):
+        self.model = model
+        self.ordering = ordering
+        self.version_key = f'lookups:version:{model._meta.label_lower}'
+        self._local = None
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # Начальное значение не должно совпасть с версией, вытесненной из кэша ранее
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def invalidate(self):
+        self._local = None
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+        # Названия из справочника выводятся на страницах товаров (условный GET)
+        touch_modified(['lookups'])
+
+    def load(self):
+        version = self.version()
+        local = self._local
+        if local is None or local['version'] != version:
+            rows = list(self.model.objects.order_by(*self.ordering))
+            local = self._local = {
+                'version': version,
+                'rows': rows,
+                'by_id': {row.pk: row for row in rows},
+            }
+        return local
+
+    def all(self):
+        return self.load()['rows']
+
+    def get(self, pk):
+        try:
+            return self.load()['by_id'][int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise self.model.DoesNotExist(f'{self.model.__name__} с id={pk!r} не найден')
+
+    def get_by(self, field, value):
+        for row in self.all():
+            if getattr(row, field) == value:
+                return row
+        raise self.model.DoesNotExist(f'{self.model.__name__} с {field}={value!r} не найден')
+
+
+order_statuses = LookupTable(OrderStatus)
+categories = LookupTable(ProductCategory)
+brands = LookupTable(Brand)
+stores = LookupTable(Store)
+countries = LookupTable(Country)
+nutrients = LookupTable(Nutrient, ordering=('name', 'id'))
+
+LOOKUP_TABLES = {table.model: table for table in (order_statuses, categories, brands, stores, countries, nutrients)}
+
+
+def get_status(name):
+    return order_statuses.get_by('name', name)
@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from main.benchmark import summarize_latencies
+from main.inventory import InsufficientStock, reserve_stock
+from main.models import Product, Store, StoreInventory
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка списания остатков при параллельном оформлении заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=200, help='Всего попыток оформления')
+        parser.add_argument('--stock', type=int, default=100, help='Начальный остаток товара')
+        parser.add_argument('--quantity', type=int, default=1, help='Количество в одном заказе')
+        parser.add_argument('--keep', action='store_true', help='Не удалять тестовые данные')
+
+    def handle(self, *args, **options):
+        store = Store.objects.create(name='bench-checkout', address='-', phone='-', open_hours='-')
+        product = Product.objects.create(name='bench-checkout', price=1)
+        StoreInventory.objects.create(store=store, product=product, quantity=options['stock'], updated_at=timezone.now())
+
+        threads = options['threads']
+        attempts = options['attempts']
+        quantity = options['quantity']
+        barrier = threading.Barrier(threads)
+        lock = threading.Lock()
+        result = {'successes': 0, 'rejected': 0, 'errors': 0}
+        latencies = []
+
+        def worker(count):
+            barrier.wait()
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    try:
+                        reserve_stock(store, {product.id: quantity})
+                        outcome = 'successes'
+                    except InsufficientStock:
+                        outcome = 'rejected'
+                    except DatabaseError:
+                        outcome = 'errors'
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        result[outcome] += 1
+                        latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        per_thread = [attempts // threads + (1 if i < attempts % threads else 0) for i in range(threads)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, per_thread))
+        elapsed = time.perf_counter() - started
+
+        final_stock = StoreInventory.objects.get(store=store, product=product).quantity
+        expected_stock = options['stock'] - result['successes'] * quantity
+        report = {
+            'vendor': connection.vendor,
+            'threads': threads,
+            'attempts': attempts,
+            **result,
+            'initial_stock': options['stock'],
+            'final_stock': final_stock,
+            'consistent': final_stock == expected_stock and final_stock >= 0,
+            'throughput_rps': round(attempts / elapsed, 1) if elapsed else None,
+            'latency': summarize_latencies(latencies),
+        }
+        self.stdout.write(json.dumps(report, ensure_ascii=False))
+
+        if not options['keep']:
+            product.delete()
+            store.delete()
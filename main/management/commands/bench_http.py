@@ -0,0 +1,143 @@
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from importlib import import_module
+from urllib.parse import urlencode
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from main.benchmark import bench_context, http_load
+from .bench_urls import current_commit
+
+SERVER_COMMANDS = {
+    'uvicorn-asgi': ['-m', 'uvicorn', 'ns.asgi:application', '--interface', 'asgi3',
+                     '--log-level', 'warning', '--no-access-log'],
+    'gunicorn': ['-m', 'gunicorn', 'ns.wsgi:application', '--log-level', 'warning'],
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер синхронных страниц под WSGI и их асинхронных версий под uvicorn (ASGI): '
+            'пропускная способность и задержки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на страницу и режим')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--workers', type=int, default=1, help='Процессов сервера; потоков gunicorn — по --concurrency')
+        parser.add_argument('--port', type=int, default=8100, help='Порт ASGI-сервера, WSGI-сервер занимает следующий')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Без входа: анонимные страницы отдаются из кэша страниц')
+        parser.add_argument('--only', nargs='*', help='Имена страниц: catalog, product-detail, search')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        for module in ('uvicorn', 'gunicorn'):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'Для замера нужен {module}: pip install {module}')
+
+        ctx = bench_context()
+        if ctx['product'] is None or ctx['user'] is None:
+            raise CommandError('Нет данных для замеров: запустите seed_bench_data')
+
+        search = urlencode({'q': ctx['query']})
+        pages = [
+            ('catalog', reverse('catalog'), reverse('async-catalog')),
+            ('product-detail', reverse('product-detail', args=[ctx['product'].id]),
+             reverse('async-product-detail', args=[ctx['product'].id])),
+            ('search', f"{reverse('search')}?{search}", f"{reverse('async-search')}?{search}"),
+        ]
+        if options['only']:
+            pages = [page for page in pages if page[0] in options['only']]
+
+        session = None
+        headers = {}
+        if not options['anonymous']:
+            session = login_session(ctx['user'])
+            headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+        asgi_port = options['port']
+        wsgi_port = options['port'] + 1
+        # Синхронные страницы меряются и под WSGI, и под ASGI: видно, что даёт сервер, а что асинхронные запросы
+        modes = [
+            ('wsgi', 'gunicorn', wsgi_port, 1),
+            ('asgi-sync', 'uvicorn-asgi', asgi_port, 1),
+            ('asgi-async', 'uvicorn-asgi', asgi_port, 2),
+        ]
+
+        results = []
+        servers = {}
+        try:
+            for mode, server, port, path_index in modes:
+                if server not in servers:
+                    servers[server] = start_server(server, port, options['workers'], options['concurrency'],
+                                                   verbose=options['verbosity'] > 1)
+                for page in pages:
+                    url = f'http://127.0.0.1:{port}{page[path_index]}'
+                    # Прогрев: кэши процесса, соединения с базой, индексы подсказок
+                    http_load(url, min(options['requests'], 20), options['concurrency'], headers)
+                    row = {'name': page[0], 'mode': mode, 'server': server,
+                           **http_load(url, options['requests'], options['concurrency'], headers)}
+                    results.append(row)
+                    self.stdout.write(
+                        f"{row['name']:<16} {row['mode']:<11} rps={row['rps']:>8} p50={row.get('p50_ms')}ms "
+                        f"p95={row.get('p95_ms')}ms p99={row.get('p99_ms')}ms errors={row['errors']}"
+                    )
+        finally:
+            for process in servers.values():
+                process.terminate()
+                process.wait(timeout=10)
+            if session is not None:
+                session.delete()
+
+        report = {
+            'meta': {
+                'commit': current_commit(),
+                'created_at': timezone.now().isoformat(),
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'workers': options['workers'],
+                'anonymous': options['anonymous'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def login_session(user):
+    # Сессия вошедшего пользователя, как её создаёт django.contrib.auth.login
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return session
+
+
+def start_server(server, port, workers, concurrency, verbose=False):
+    command = [sys.executable, *SERVER_COMMANDS[server]]
+    if server == 'gunicorn':
+        command += ['--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(concurrency)]
+    else:
+        command += ['--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)]
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR, stdout=output, stderr=output)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'{server} завершился с кодом {process.returncode}: {" ".join(command)}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise CommandError(f'{server} не начал принимать соединения на порту {port}')
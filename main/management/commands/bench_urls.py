@@ -0,0 +1,78 @@
+import json
+import subprocess
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from main.benchmark import bench_context, bench_requests, compare_results, measure_request, unbenched_routes
+
+
+class Command(BaseCommand):
+    help = 'Замеряет число SQL-запросов, время БД и полное время ответа для маршрутов ns/urls.py'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--only', nargs='*', help='Имена маршрутов для замера')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON с результатами предыдущего прогона')
+        parser.add_argument('--max-query-growth', type=int, default=None,
+                            help='Завершиться с ошибкой, если число запросов маршрута выросло больше чем на N')
+
+    def handle(self, *args, **options):
+        ctx = bench_context()
+        if ctx['product'] is None or ctx['user'] is None:
+            raise CommandError('Нет данных для замеров: запустите seed_bench_data')
+
+        client = Client(HTTP_HOST='localhost')
+        specs = bench_requests(ctx)
+        missing = unbenched_routes(specs)
+        if missing:
+            self.stderr.write(f"Маршруты без замера: {', '.join(missing)}")
+        results = []
+        for spec in specs:
+            if options['only'] and spec['name'] not in options['only']:
+                continue
+            row = measure_request(client, ctx, spec, repeats=options['repeats'], cold=options['cold'])
+            results.append(row)
+            self.stdout.write(
+                f"{row['name']:<32} {row['status']:>3} queries={row['queries']:<4} "
+                f"db={row['db_ms']:>9.2f}ms wall={row['wall_ms']:>9.2f}ms p95={row['wall_p95_ms']:>9.2f}ms"
+            )
+
+        report = {
+            'meta': {
+                'commit': current_commit(),
+                'vendor': connection.vendor,
+                'created_at': timezone.now().isoformat(),
+                'repeats': options['repeats'],
+                'cold': options['cold'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+            regressions = []
+            self.stdout.write(f"\nСравнение с {previous.get('meta', {}).get('commit', options['compare'])}:")
+            for row in compare_results(previous, report):
+                (q_old, q_new), (db_old, db_new), (wall_old, wall_new) = row['queries'], row['db_ms'], row['wall_ms']
+                self.stdout.write(
+                    f"{row['name']:<32} queries {q_old}->{q_new}  db {db_old:.2f}->{db_new:.2f}ms  "
+                    f"wall {wall_old:.2f}->{wall_new:.2f}ms"
+                )
+                if options['max_query_growth'] is not None and q_new - q_old > options['max_query_growth']:
+                    regressions.append(row['name'])
+            if regressions:
+                raise CommandError(f"Рост числа запросов: {', '.join(regressions)}")
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
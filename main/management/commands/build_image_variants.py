@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.images import build_variants, image_sources
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии фотографий товаров и брендов в WebP и исходном формате для srcset. '
+            'Уже обработанные и не изменившиеся файлы пропускаются, поэтому команду можно прерывать и '
+            'запускать повторно. Нужен пакет Pillow')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Число процессов, по умолчанию по числу ядер')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--force', action='store_true', help='Обработать заново все файлы')
+
+    def handle(self, *args, **options):
+        sources = image_sources()
+        self.stdout.write(f'Изображений в базе: {len(sources)}')
+        progress = None
+        try:
+            for progress in build_variants(
+                sources, workers=options['workers'], batch_size=options['batch_size'], force=options['force'],
+            ):
+                self.stdout.write(
+                    f"Обработано: {progress['processed']}, без изменений: {progress['skipped']}, "
+                    f"нет файла: {len(progress['missing'])}, с ошибками: {len(progress['errors'])}"
+                )
+        except RuntimeError as e:
+            raise CommandError(e)
+        if progress is None:
+            return
+        for source in progress['missing']:
+            self.stderr.write(f'Нет файла: {source}')
+        for error in progress['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Готово. Для рабочего сервера выполните collectstatic, чтобы копии попали в STATIC_ROOT'
+        ))
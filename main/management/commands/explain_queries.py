@@ -0,0 +1,117 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from main.benchmark import bench_context
+from main.moderation import pending_reviews
+from main.models import OrderStatus, ReviewLog, StoreInventory
+from main.product_page import REVIEWS_PER_PAGE, reviews_query
+from main.views import CATALOG_PER_PAGE, MODERATION_PER_PAGE, catalog_query, order_history
+
+
+def query_shapes(ctx):
+    # Запросы в том виде, в каком их строят представления: (название, QuerySet)
+    product, user = ctx['product'], ctx['user']
+    price = product.price
+    shapes = []
+    for label, params in (
+        ('catalog', {}),
+        ('catalog?sort=price_asc', {'sort': 'price_asc'}),
+        ('catalog?price_min&price_max', {'price_min': price, 'price_max': price * 2, 'sort': 'price_asc'}),
+        ('catalog?category&price_min', {'category': product.category_id, 'price_min': price, 'sort': 'price_desc'}),
+        ('catalog?brand&price_max', {'brand': product.brand_id, 'price_max': price, 'sort': 'price_asc'}),
+    ):
+        products, ordering, _ = catalog_query({key: str(value) for key, value in params.items() if value})
+        shapes.append((label, products.order_by(*ordering)[:CATALOG_PER_PAGE + 1]))
+
+    shapes += [
+        ('product-detail reviews', reviews_query(product.id)[:REVIEWS_PER_PAGE + 1]),
+        ('product stats ratings', ReviewLog.objects.filter(product_id__in=[product.id], viewable=True)
+            .values('product').order_by()),
+        ('about top reviews', ReviewLog.objects.filter(viewable=True).exclude(comment='')
+            .order_by('-grade', '-review_date')[:2]),
+        ('moderation queue', pending_reviews().order_by('id')[:MODERATION_PER_PAGE + 1]),
+        ('inventory changes', StoreInventory.objects.filter(changed_at__lte=timezone.now())
+            .order_by('changed_at', 'id')[:500]),
+    ]
+    if ctx['store'] is not None:
+        shapes.append(('checkout reserve stock', StoreInventory.objects.filter(
+            store=ctx['store'], product_id__in=[product.id],
+        )))
+    if OrderStatus.objects.filter(name='Черновик').exists():
+        shapes.append(('profile orders', order_history(user)[:10]))
+    return shapes
+
+
+def explain(queryset):
+    # Строки плана и найденные полные просмотры: [(таблица, описание)]
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            # Django пишет условие BooleanField=True в SQLite как WHERE "поле", и индекс по нему
+            # не используется как равенство; MySQL получает "поле" = 1 и использует составной индекс
+            lines = [row[3] for row in cursor.fetchall()]
+            scans = [(m.group(1), line) for line in lines if (m := re.match(r'SCAN (\w+)$', line))]
+            sorts = [line for line in lines if 'TEMP B-TREE' in line]
+            if queryset.query.high_mark is not None and not any('ORDER BY' in line for line in sorts):
+                # Просмотр в порядке rowid с LIMIT останавливается на первых строках (в MySQL это type=index)
+                scans = []
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columns = [column[0].lower() for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            lines = [
+                f"{row['table']}: type={row['type']} key={row['key']} rows={row['rows']} {row['extra'] or ''}"
+                for row in rows
+            ]
+            scans = [(row['table'], line) for row, line in zip(rows, lines) if row['type'] == 'ALL']
+            sorts = [line for row, line in zip(rows, lines) if 'filesort' in (row['extra'] or '')]
+        else:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            lines = [row[0] for row in cursor.fetchall()]
+            scans = [(m.group(1), line.strip()) for line in lines if (m := re.search(r'Seq Scan on (\w+)', line))]
+            sorts = [line.strip() for line in lines if re.search(r'\bSort\b', line)]
+    return lines, scans, sorts
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для запросов каталога, страницы товара, профиля и служебных страниц '
+            'на данных seed_bench_data и сообщает о полных просмотрах таблиц и сортировках без индекса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Не считать ошибкой полный просмотр таблиц меньше этого размера')
+        parser.add_argument('--fail', action='store_true', help='Завершиться с ошибкой при найденных просмотрах')
+
+    def handle(self, *args, **options):
+        ctx = bench_context()
+        if ctx['product'] is None or ctx['user'] is None:
+            raise CommandError('Нет данных для замеров: запустите seed_bench_data')
+
+        table_sizes = {}
+
+        def table_size(table):
+            if table not in table_sizes:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                    table_sizes[table] = cursor.fetchone()[0]
+            return table_sizes[table]
+
+        problems = 0
+        for label, queryset in query_shapes(ctx):
+            lines, scans, sorts = explain(queryset)
+            scans = [(table, line) for table, line in scans if table_size(table) >= options['min_rows']]
+            status = self.style.ERROR('FULL SCAN') if scans else self.style.SUCCESS('OK')
+            self.stdout.write(f'{label:<32} {status}')
+            for table, line in scans:
+                self.stdout.write(f'    {table} ({table_size(table)} строк): {line}')
+            for line in sorts:
+                self.stdout.write(f'    сортировка: {line}')
+            if options['verbosity'] > 1:
+                for line in lines:
+                    self.stdout.write(f'      {line}')
+            problems += bool(scans)
+
+        if problems and options['fail']:
+            raise CommandError(f'Полный просмотр таблиц в запросах: {problems}')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.catalog_io import EXPORT_COLUMNS, FORMATS, counted, detect_format, export_rows, open_text, write_rows
+
+
+class Command(BaseCommand):
+    help = 'Выгружает бренды, товары, остатки или состав в CSV или JSON Lines потоком, в формате import_catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORT_COLUMNS))
+        parser.add_argument('path', help='Файл .csv, .jsonl (можно .gz) или - для stdout')
+        parser.add_argument('--format', choices=FORMATS, help='По умолчанию определяется по расширению')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--progress-every', type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        to_stdout = options['path'] == '-'
+        # При выгрузке в stdout прогресс уходит в stderr, чтобы не смешиваться с данными
+        log = self.stderr.write if to_stdout else self.stdout.write
+
+        def report(count, rate):
+            log(f'Выгружено строк: {count}, {rate:.1f} строк/с')
+
+        columns, rows = export_rows(options['kind'], chunk_size=options['chunk_size'])
+        try:
+            f = open_text(options['path'], 'w')
+        except OSError as e:
+            raise CommandError(e)
+        with f:
+            write_rows(f, fmt, columns, counted(rows, options['progress_every'], report))
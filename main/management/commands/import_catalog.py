@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.catalog_io import FORMATS, IMPORTERS, detect_format, import_rows, open_text, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Загружает бренды, товары, остатки или состав из CSV или JSON Lines с обновлением существующих записей. '
+            'Бренды ищутся по названию, товары по названию и бренду, остатки по магазину и товару, '
+            'состав по товару и нутриенту')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help='Файл .csv, .jsonl (можно .gz) или - для stdin')
+        parser.add_argument('--format', choices=FORMATS, help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        try:
+            f = open_text(options['path'], 'r')
+        except OSError as e:
+            raise CommandError(e)
+
+        progress = None
+        with f:
+            for progress in import_rows(options['kind'], read_rows(f, fmt), batch_size=options['batch_size']):
+                self.stdout.write(
+                    f"Строк: {progress['rows']}, создано: {progress['created']}, обновлено: {progress['updated']}, "
+                    f"без изменений: {progress['unchanged']}, с ошибками: {progress['skipped']}, "
+                    f"{progress['rows_per_s']} строк/с"
+                )
+        if progress is None:
+            self.stdout.write('Файл пуст')
+            return
+        for error in progress['errors']:
+            self.stderr.write(error)
+        if progress['skipped'] > len(progress['errors']):
+            self.stderr.write(f"... и ещё {progress['skipped'] - len(progress['errors'])} ошибочных строк")
+        self.stdout.write(self.style.SUCCESS(
+            f"Импорт завершён: создано {progress['created']}, обновлено {progress['updated']}, "
+            f"без изменений {progress['unchanged']}, с ошибками {progress['skipped']}"
+        ))
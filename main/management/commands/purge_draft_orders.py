@@ -0,0 +1,19 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.cart import purge_draft_orders
+
+
+class Command(BaseCommand):
+    help = 'Удаляет черновики заказов, оставшиеся в базе от корзины до переноса её в сессию'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Удалять черновики старше этого числа дней')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        total = 0
+        for total in purge_draft_orders(before, batch_size=options['batch_size']):
+            self.stdout.write(f'Удалено черновиков: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Готово, удалено черновиков: {total}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from main.stats import rebuild_product_stats
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает сводку по товарам (рейтинг, число отзывов, остатки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        for total in rebuild_product_stats(batch_size=options['batch_size']):
+            self.stdout.write(f'Обработано товаров: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Сводка перестроена, товаров: {total}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from main.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс по названиям, описаниям, брендам и категориям товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = 0
+        for total in rebuild_search_index(batch_size=options['batch_size']):
+            self.stdout.write(f'Проиндексировано товаров: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Поисковый индекс перестроен, товаров: {total}'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from main.benchmark import seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическим каталогом для замеров производительности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--stores', type=int, default=50)
+        parser.add_argument('--users', type=int, default=1_000)
+        parser.add_argument('--orders-per-user', type=int, default=50)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--no-inventory', action='store_true', help='Не заполнять остатки по магазинам')
+        parser.add_argument('--batch-size', type=int, default=5_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # Без общей транзакции: seed_dataset фиксирует данные пачками
+        seed_dataset(
+            products=options['products'],
+            reviews=options['reviews'],
+            stores=options['stores'],
+            users=options['users'],
+            orders_per_user=options['orders_per_user'],
+            items_per_order=options['items_per_order'],
+            inventory=not options['no_inventory'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS('Синтетические данные созданы'))
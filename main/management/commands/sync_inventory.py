@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.catalog_io import (
+    FORMATS, ImportRowError, NameMap, ProductMap, detect_format, integer, moment, open_text, read_rows,
+)
+from main.inventory import apply_inventory_changes
+from main.models import Brand, Store
+from main.utils import batched
+
+
+class Command(BaseCommand):
+    help = ('Применяет изменения остатков одного магазина из CSV или JSON Lines так же, как API синхронизации: '
+            'изменения не новее записанных (по updated_at) пропускаются. Товар задаётся колонкой product_id '
+            'или колонками product и brand')
+
+    def add_arguments(self, parser):
+        parser.add_argument('store', help='id или название магазина')
+        parser.add_argument('path', help='Файл .csv, .jsonl (можно .gz) или - для stdin')
+        parser.add_argument('--format', choices=FORMATS, help='По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        store = self.get_store(options['store'])
+        fmt = detect_format(options['path'], options['format'])
+        try:
+            f = open_text(options['path'], 'r')
+        except OSError as e:
+            raise CommandError(e)
+
+        products = None
+        totals = {'created': 0, 'updated': 0, 'unchanged': 0, 'stale': 0, 'unknown': 0, 'skipped': 0}
+        with f:
+            for batch in batched(enumerate(read_rows(f, fmt), start=1), options['batch_size']):
+                changes = {}
+                for number, row in batch:
+                    try:
+                        if row.get('product_id'):
+                            product_id = integer(row, 'product_id')
+                        else:
+                            # Словарь товаров загружается, только если в файле встретились названия
+                            products = products or ProductMap(NameMap(Brand))
+                            product_id = products.resolve(row)
+                        change = (integer(row, 'quantity'), moment(row, 'updated_at'))
+                        if change[0] < 0:
+                            raise ImportRowError('quantity меньше нуля')
+                    except ImportRowError as e:
+                        totals['skipped'] += 1
+                        self.stderr.write(f'строка {number}: {e}')
+                        continue
+                    if product_id not in changes or changes[product_id][1] < change[1]:
+                        changes[product_id] = change
+
+                result = apply_inventory_changes(store, changes)
+                for key in ('created', 'updated', 'unchanged', 'stale'):
+                    totals[key] += result[key]
+                totals['unknown'] += len(result['unknown'])
+                if result['unknown']:
+                    self.stderr.write(f"Нет товаров с id: {', '.join(map(str, result['unknown']))}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Магазин {store}: создано {totals['created']}, обновлено {totals['updated']}, "
+            f"без изменений {totals['unchanged']}, устаревших {totals['stale']}, "
+            f"неизвестных товаров {totals['unknown']}, с ошибками {totals['skipped']}"
+        ))
+
+    def get_store(self, value):
+        lookup = {'pk': int(value)} if value.isdigit() else {'name': value}
+        try:
+            return Store.objects.get(**lookup)
+        except Store.DoesNotExist:
+            raise CommandError(f'Магазин {value!r} не найден')
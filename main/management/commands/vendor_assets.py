@@ -0,0 +1,74 @@
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+from urllib.request import Request, urlopen
+from django.core.management.base import BaseCommand, CommandError
+from main.assets import VENDOR_ASSETS, VENDOR_DIR
+
+STATIC_DIR = Path(__file__).resolve().parents[2] / 'static'
+# Google Fonts отдаёт CSS под браузер из User-Agent; современный браузер получает woff2
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+# Карты исходников не скачиваются, а ссылка на отсутствующий файл ломает collectstatic
+SOURCE_MAP = re.compile(r'^\s*(/\*#|//#) sourceMappingURL=.*$', re.MULTILINE)
+
+
+def fetch(url):
+    with urlopen(Request(url, headers={'User-Agent': USER_AGENT}), timeout=30) as response:
+        return response.read()
+
+
+class Command(BaseCommand):
+    help = ('Скачивает Bootstrap, FontAwesome и шрифты Google Fonts в main/static/vendor вместе с файлами, '
+            'на которые ссылается их CSS. После неё collectstatic добавляет хэши к именам и сжимает файлы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Скачать заново уже сохранённые файлы')
+
+    def handle(self, *args, **options):
+        root = STATIC_DIR / VENDOR_DIR
+        for name, url in VENDOR_ASSETS.items():
+            target = root / name
+            if target.exists() and not options['force']:
+                self.stdout.write(f'{name}: уже есть')
+                continue
+            try:
+                data = fetch(url)
+                if name.endswith(('.css', '.js')):
+                    text = SOURCE_MAP.sub('', data.decode('utf-8'))
+                    if name.endswith('.css'):
+                        text = self.vendor_css(url, text, target, root)
+                    data = text.encode('utf-8')
+            except OSError as e:
+                raise CommandError(f'{url}: {e}')
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            self.stdout.write(f'{name}: {len(data)} байт')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлы сохранены в {root}. Для рабочего сервера выполните collectstatic'
+        ))
+
+    def vendor_css(self, source_url, css, target, root):
+        # Шрифты и картинки из url(...) скачиваются рядом с CSS. Относительные пути сохраняются как есть,
+        # файлы с других доменов кладутся в files/ и ссылка в CSS заменяется на относительную.
+        def replace(match):
+            ref = match.group(2).strip()
+            if ref.startswith(('data:', '#')):
+                return match.group(0)
+            absolute = urljoin(source_url, ref)
+            if urlsplit(ref).netloc:
+                local_ref = f'files/{posixpath.basename(urlsplit(absolute).path)}'
+            else:
+                local_ref = ref.split('?')[0].split('#')[0]
+            local_path = (target.parent / local_ref).resolve()
+            if root.resolve() not in local_path.parents:
+                raise CommandError(f'{ref}: файл за пределами {root}')
+            if not local_path.exists():
+                local_path.parent.mkdir(parents=True, exist_ok=True)
+                local_path.write_bytes(fetch(absolute))
+                self.stdout.write(f'  {local_path.relative_to(root)}')
+            return f'url("{local_ref}")'
+
+        return CSS_URL.sub(replace, css)
@@ -0,0 +1,95 @@
+import json
+import logging
+import random
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .profiling import current_profile, metrics, profiling_setting, RequestProfile
+
+logger = logging.getLogger('main.profiling')
+
+
+class ProfilingMiddleware:
+    # Замеряет число и время SQL-запросов, время рендеринга шаблонов и общее время ответа.
+    # Результат уходит в заголовок Server-Timing, структурированный лог и гистограммы /metrics/.
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return profiling_setting('ENABLED') and random.random() < profiling_setting('SAMPLE_RATE')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        # SQL-запросы попадают в профиль через обёртку соединений (main.profiling.record_current_query)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+
+        self.report(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        # Запросы синхронных представлений и async_views.run_query выполняются в других потоках,
+        # профиль передаётся туда через контекст
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_profile.reset(token)
+
+        self.report(request, response, profile)
+        return response
+
+    def report(self, request, response, profile):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        total_ms = profile.elapsed() * 1000
+        db_ms = profile.db_time * 1000
+        template_ms = profile.template_time * 1000
+        queries = profile.query_count
+        duplicates = profile.duplicate_count
+        repeated = profile.repeated_statements(profiling_setting('N_PLUS_ONE_THRESHOLD'))
+
+        metrics.observe(view, total_ms, db_ms, template_ms, queries, duplicates)
+
+        if profiling_setting('SERVER_TIMING'):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={db_ms:.1f};desc="{queries} queries, {duplicates} duplicates"',
+                f'tpl;dur={template_ms:.1f}',
+                f'total;dur={total_ms:.1f}',
+            ])
+
+        if profiling_setting('LOG'):
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 2),
+                'db_ms': round(db_ms, 2),
+                'template_ms': round(template_ms, 2),
+                'queries': queries,
+                'duplicate_queries': duplicates,
+            }
+            if repeated:
+                # Один и тот же запрос много раз с разными параметрами — вероятный N+1
+                record['n_plus_one'] = [{'sql': sql[:300], 'count': count} for sql, count in repeated.items()]
+                logger.warning(json.dumps(record, ensure_ascii=False))
+            else:
+                logger.info(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q, Sum
+
+
+def fill_product_stats(apps, schema_editor):
+    Product = apps.get_model('main', 'Product')
+    ProductStats = apps.get_model('main', 'ProductStats')
+    products = Product.objects.annotate(
+        avg=Avg('reviews__grade', filter=Q(reviews__viewable=True)),
+        cnt=Count('reviews', filter=Q(reviews__viewable=True), distinct=True),
+    ).values_list('id', 'avg', 'cnt')
+    stock = dict(
+        Product.objects.annotate(qty=Sum('storeinventory__quantity')).values_list('id', 'qty')
+    )
+    ProductStats.objects.bulk_create(
+        [
+            ProductStats(product_id=pk, average_rating=avg, review_count=cnt, total_quantity=stock.get(pk) or 0)
+            for pk, avg, cnt in products.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_brand_photo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='main.product')),
+                ('average_rating', models.FloatField(null=True)),
+                ('review_count', models.IntegerField(default=0)),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(fill_product_stats, migrations.RunPython.noop),
+    ]
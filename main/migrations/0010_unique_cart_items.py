@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 02:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(model, parent):
+    # Повторяющиеся строки одного товара сливаются в самую раннюю с суммой количества
+    duplicates = (
+        model.objects.values(parent, 'product')
+        .annotate(first_id=Min('id'), total=Sum('quantity'), rows=Count('id'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates.iterator():
+        model.objects.filter(id=row['first_id']).update(quantity=row['total'])
+        model.objects.filter(**{parent: row[parent], 'product': row['product']}).exclude(id=row['first_id']).delete()
+
+
+def merge_cart_duplicates(apps, schema_editor):
+    merge_duplicates(apps.get_model('main', 'OrderItem'), 'order')
+    merge_duplicates(apps.get_model('main', 'WishlistItem'), 'wishlist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_searchterm'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_cart_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='uniq_orderitem_order_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='wishlistitem',
+            constraint=models.UniqueConstraint(fields=('wishlist', 'product'), name='uniq_wishlistitem_wishlist_product'),
+        ),
+        # Индекс уникального ограничения начинается с order и заменяет старый составной индекс
+        migrations.RemoveIndex(
+            model_name='orderitem',
+            name='idx_orderitem_order_product',
+        ),
+    ]
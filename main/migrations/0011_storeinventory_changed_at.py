@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_updated_at(apps, schema_editor):
+    # Существующие строки попадают в ленту изменений со своим прежним временем
+    StoreInventory = apps.get_model('main', 'StoreInventory')
+    StoreInventory.objects.update(changed_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_unique_cart_items'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storeinventory',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='storeinventory',
+            index=models.Index(fields=['changed_at', 'id'], name='idx_storeinv_changed'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_storeinventory_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reviewlog',
+            index=models.Index(fields=['review_date'], name='idx_reviewlog_date'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_reviewlog_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reviewlog',
+            index=models.Index(fields=['viewable', 'id'], name='idx_reviewlog_viewable_id'),
+        ),
+    ]
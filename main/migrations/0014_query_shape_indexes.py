@@ -0,0 +1,47 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_reviewlog_moderation_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'order_date', 'status'], name='idx_order_user_date_status'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='idx_product_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='idx_product_category_price'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['brand', 'price', 'id'], name='idx_product_brand_price'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewlog',
+            index=models.Index(fields=['product', 'viewable', '-review_date', '-id'], name='idx_reviewlog_product_view'),
+        ),
+        migrations.AddIndex(
+            model_name='reviewlog',
+            index=models.Index(fields=['viewable', '-grade', '-review_date'], name='idx_reviewlog_top'),
+        ),
+        # Старые одностолбцовые индексы совпадают с началом новых составных.
+        # Удаляются после создания новых: MySQL не даёт оставить внешний ключ без индекса.
+        migrations.RemoveIndex(
+            model_name='order',
+            name='idx_order_user',
+        ),
+        migrations.RemoveIndex(
+            model_name='reviewlog',
+            name='idx_reviewlog_product',
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_query_shape_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('source_mtime', models.FloatField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'width', 'format'), name='uniq_imagevariant_source_width_format')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_product_prices(apps, schema_editor):
+    # Для оформленных ранее заказов снимком становится текущая цена товара: другой истории цен нет
+    OrderItem = apps.get_model('main', 'OrderItem')
+    Product = apps.get_model('main', 'Product')
+    OrderItem.objects.filter(price__isnull=True).update(
+        price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_imagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.RunPython(copy_product_prices, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=15),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:05
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_wishlists(apps, schema_editor):
+    # Лишние списки, созданные гонкой get_or_create: товары переносятся в самый старый список пользователя,
+    # количества одинаковых товаров складываются
+    Wishlist = apps.get_model('main', 'Wishlist')
+    WishlistItem = apps.get_model('main', 'WishlistItem')
+    duplicated = (
+        Wishlist.objects.order_by().values('user_id')
+        .annotate(count=Count('id'), keep=Min('id'))
+        .filter(count__gt=1)
+    )
+    for row in duplicated:
+        extra = Wishlist.objects.filter(user_id=row['user_id']).exclude(id=row['keep'])
+        kept = {item.product_id: item for item in WishlistItem.objects.filter(wishlist_id=row['keep'])}
+        for item in WishlistItem.objects.filter(wishlist__in=extra).order_by('id'):
+            if item.product_id in kept:
+                kept[item.product_id].quantity += item.quantity
+                kept[item.product_id].save(update_fields=['quantity'])
+                item.delete()
+            else:
+                item.wishlist_id = row['keep']
+                item.save(update_fields=['wishlist'])
+                kept[item.product_id] = item
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_orderitem_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_wishlists, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user',), name='uniq_wishlist_user'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 
 class CustomUser(AbstractUser):
@@ -42,6 +44,30 @@ class OrderStatus(models.Model):
     def __str__(self):
         return self.name
 
+def money_field():
+    return models.DecimalField(max_digits=15, decimal_places=2)
+
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        # Сумма заказа считается в БД по ценам на момент оформления, без загрузки позиций и товаров
+        return self.annotate(
+            total=Coalesce(
+                Sum(F('orderitem__quantity') * F('orderitem__price'), output_field=money_field()),
+                0,
+                output_field=money_field(),
+            )
+        )
+
+class OrderItemQuerySet(models.QuerySet):
+    def with_totals(self):
+        # Сумма строки: количество на цену из снимка
+        return self.annotate(line_total=ExpressionWrapper(F('quantity') * F('price'), output_field=money_field()))
+
+    def total(self):
+        return self.aggregate(total=Coalesce(
+            Sum(F('quantity') * F('price'), output_field=money_field()), 0, output_field=money_field(),
+        ))['total']
+
 class Order(models.Model):
     user = models.ForeignKey('CustomUser', on_delete=models.CASCADE)
     status = models.ForeignKey('OrderStatus', on_delete=models.SET_NULL, null=True)
@@ -49,23 +75,30 @@ class Order(models.Model):
     comment = models.CharField(max_length=255, blank=True)
     store = models.ForeignKey('Store', on_delete=models.SET_NULL, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['order_date'], name='idx_order_date'),
-            models.Index(fields=['user'], name='idx_order_user'),
             models.Index(fields=['store'], name='idx_order_store'),
             models.Index(fields=['order_date','status'], name='idx_order_date_status'),
-            models.Index(fields=['user','status'], name='idx_order_user_status')
+            models.Index(fields=['user','status'], name='idx_order_user_status'),
+            # История заказов в профиле: заказы пользователя по дате, статус проверяется по индексу
+            models.Index(fields=['user', 'order_date', 'status'], name='idx_order_user_date_status'),
         ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey('Order', on_delete=models.CASCADE)
     product = models.ForeignKey('Product', on_delete=models.CASCADE)
     quantity = models.IntegerField()
+    # Цена товара на момент оформления: история заказов не зависит от текущей Product.price
+    price = models.DecimalField(max_digits=15, decimal_places=2)
+
+    objects = OrderItemQuerySet.as_manager()
 
     class Meta:
-        indexes = [
-            models.Index(fields=['order','product'], name='idx_orderitem_order_product'),
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='uniq_orderitem_order_product'),
         ]
 
 class ProductCategory(models.Model):
@@ -111,27 +144,85 @@ class Product(models.Model):
             models.Index(fields=['brand'], name='idx_product_brand'),
             models.Index(fields=['name'], name='idx_product_name'),
             models.Index(fields=['name', 'category'], name='idx_product_name_category'),
+            # Каталог: диапазон и сортировка по цене, в том числе внутри категории или бренда
+            models.Index(fields=['price', 'id'], name='idx_product_price'),
+            models.Index(fields=['category', 'price', 'id'], name='idx_product_category_price'),
+            models.Index(fields=['brand', 'price', 'id'], name='idx_product_brand_price'),
         ]
 
     def __str__(self):
         return self.name
 
+class ProductStats(models.Model):
+    product = models.OneToOneField('Product', on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    average_rating = models.FloatField(null=True)
+    review_count = models.IntegerField(default=0)
+    total_quantity = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Статистика {self.product_id}"
+
+class ImageVariant(models.Model):
+    # Уменьшенная копия изображения из static (Product.photo, Brand.photo), создаётся build_image_variants
+    source = models.CharField(max_length=255)
+    width = models.IntegerField()
+    height = models.IntegerField()
+    format = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    # Время изменения исходного файла на момент обработки: изменившиеся файлы обрабатываются заново
+    source_mtime = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'width', 'format'], name='uniq_imagevariant_source_width_format'),
+        ]
+
+    def __str__(self):
+        return self.path
+
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64)
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'product'], name='uniq_searchterm_term_product'),
+        ]
+        indexes = [
+            models.Index(fields=['product'], name='idx_searchterm_product'),
+        ]
+
+    def __str__(self):
+        return self.term
+
 class StoreInventory(models.Model):
     store = models.ForeignKey('Store', on_delete=models.CASCADE)
     product = models.ForeignKey('Product', on_delete=models.CASCADE)
     quantity = models.IntegerField()
+    # Время изменения остатка в магазине, по нему отбрасываются устаревшие пачки синхронизации
     updated_at = models.DateTimeField()
+    # Время записи изменения на сервере, по нему читается лента изменений
+    changed_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['store'], name='idx_storeinventory_store'),
             models.Index(fields=['product'], name='idx_storeinventory_product'),
             models.Index(fields=['store', 'product'], name='idx_storeinv_store_product'),
+            models.Index(fields=['changed_at', 'id'], name='idx_storeinv_changed'),
         ]
 
 class Wishlist(models.Model):
     user = models.ForeignKey('CustomUser', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            # Один список на пользователя: гонку двух get_or_create разрешает ограничение
+            models.UniqueConstraint(fields=['user'], name='uniq_wishlist_user'),
+        ]
+
     def __str__(self):
         return f"Wishlist #{self.id} for {self.user.username}"
 
@@ -145,6 +236,9 @@ class WishlistItem(models.Model):
             models.Index(fields=['wishlist'], name='idx_wishlistitem_wishlist'),
             models.Index(fields=['product'], name='idx_wishlistitem_product'),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['wishlist', 'product'], name='uniq_wishlistitem_wishlist_product'),
+        ]
 
 class ReviewLog(models.Model):
     user = models.ForeignKey('CustomUser', on_delete=models.CASCADE)
@@ -157,8 +251,14 @@ class ReviewLog(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['user'], name='idx_reviewlog_user'),
-            models.Index(fields=['product'], name='idx_reviewlog_product'),
             models.Index(fields=['user', 'product'], name='idx_reviewlog_user_product'),
+            # Отзывы на странице товара и сводка рейтинга: (product, viewable), новые первыми
+            models.Index(fields=['product', 'viewable', '-review_date', '-id'], name='idx_reviewlog_product_view'),
+            # Лучшие отзывы на странице «О нас»
+            models.Index(fields=['viewable', '-grade', '-review_date'], name='idx_reviewlog_top'),
+            models.Index(fields=['review_date'], name='idx_reviewlog_date'),
+            # Очередь модерации: неопубликованные отзывы по порядку id
+            models.Index(fields=['viewable', 'id'], name='idx_reviewlog_viewable_id'),
         ]
 
 class Nutrient(models.Model):
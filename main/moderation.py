@@ -0,0 +1,37 @@
+from django.db import transaction
+from .models import ReviewLog
+from .stats import defer_stats_refresh, refresh_product_stats
+
+# Модерация отзывов пачкой: статус меняется одним UPDATE, сводка рейтингов затронутых товаров
+# пересчитывается одним сгруппированным агрегатом (refresh_product_stats), а не по отзыву.
+
+
+def pending_reviews():
+    return ReviewLog.objects.filter(viewable=False)
+
+
+def set_reviews_viewable(reviews, viewable):
+    # reviews — QuerySet отзывов; возвращает число изменённых строк
+    reviews = reviews.exclude(viewable=viewable)
+    with transaction.atomic():
+        product_ids = set(reviews.values_list('product_id', flat=True))
+        # update не отправляет post_save, сводка пересчитывается здесь
+        count = reviews.update(viewable=viewable)
+        refresh_product_stats(product_ids)
+    return count
+
+
+def approve_reviews(reviews):
+    return set_reviews_viewable(reviews, True)
+
+
+def hide_reviews(reviews):
+    return set_reviews_viewable(reviews, False)
+
+
+def reject_reviews(reviews):
+    # Отклонённый отзыв удаляется, автор может написать новый.
+    # post_delete приходит на каждую строку, пересчёт сводки откладывается до конца удаления.
+    with transaction.atomic(), defer_stats_refresh():
+        _, deleted = reviews.delete()
+    return deleted.get(ReviewLog._meta.label, 0)
@@ -0,0 +1,169 @@
+import hashlib
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'main.pagination.keyset'
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    # Пагинация по ключу (sort key, id) без COUNT(*) и OFFSET.
+    # Последнее поле ordering должно быть уникальным (обычно id).
+
+    def __init__(self, queryset, ordering, per_page, totals=None):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        # None, 'cached' или 'approximate'
+        self.totals = totals if totals is not None else getattr(settings, 'LISTING_TOTALS', None)
+
+    def get_page(self, cursor=None):
+        position = self.decode_cursor(cursor)
+        if position is None:
+            direction, values = 'next', None
+        else:
+            direction, values = position
+
+        ordering = self.ordering if direction == 'next' else invert_ordering(self.ordering)
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'previous':
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if direction == 'next':
+                if has_more:
+                    next_cursor = self.encode_cursor('next', rows[-1])
+                if values is not None:
+                    previous_cursor = self.encode_cursor('previous', rows[0])
+            else:
+                next_cursor = self.encode_cursor('next', rows[-1])
+                if has_more:
+                    previous_cursor = self.encode_cursor('previous', rows[0])
+
+        return KeysetPage(rows, next_cursor, previous_cursor, self.count())
+
+    def count(self):
+        if self.totals == 'approximate' and not self.queryset.query.has_filters():
+            estimate = estimated_table_count(self.queryset.model)
+            if estimate is not None:
+                return estimate
+        if self.totals in ('cached', 'approximate'):
+            return cached_count(self.queryset)
+        return None
+
+    def encode_cursor(self, direction, obj):
+        values = [field_value(obj, field) for field in self.ordering]
+        return signing.dumps({'d': direction, 'v': values}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            return None
+        values = data.get('v')
+        if data.get('d') not in ('next', 'previous') or not isinstance(values, list) or len(values) != len(self.ordering):
+            return None
+        return data['d'], values
+
+
+def invert_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def keyset_filter(ordering, values):
+    # (a > x) OR (a = x AND b > y) OR ... с учётом направления каждого поля
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def field_value(obj, field):
+    value = getattr(obj, field.lstrip('-'))
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def cached_count(queryset, timeout=None):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{sql}|{params!r}'.encode()).hexdigest()
+    if timeout is None:
+        timeout = getattr(settings, 'LISTING_TOTALS_TIMEOUT', 300)
+    return cache.get_or_set(f'listing-count:{digest}', queryset.count, timeout)
+
+
+class EstimatedCountPaginator(Paginator):
+    # Постраничный вывод админки: для таблицы без фильтров число строк берётся из статистики СУБД,
+    # отфильтрованные списки считаются обычным COUNT(*) по индексу фильтра
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.has_filters():
+            estimate = estimated_table_count(self.object_list.model)
+            if estimate is not None:
+                return estimate
+        return super().count
+
+
+def estimated_table_count(model):
+    # Оценка числа строк по статистике СУБД, без сканирования таблицы
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
@@ -0,0 +1,92 @@
+import math
+from django.shortcuts import get_object_or_404
+from .models import Product, ProductComposition, ProductStats, ReviewLog
+
+REVIEWS_PER_PAGE = 10
+
+
+def parse_page(value):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def get_product(pk):
+    return get_object_or_404(Product.objects.select_related('brand', 'category', 'stats'), pk=pk)
+
+
+def load_composition(pk):
+    return list(ProductComposition.objects.filter(product_id=pk).select_related('nutrient'))
+
+
+def reviews_query(pk):
+    # Опубликованные отзывы товара, новые первыми (индекс idx_reviewlog_product_view)
+    return (
+        ReviewLog.objects.filter(product_id=pk, viewable=True)
+        .select_related('user')
+        .order_by('-review_date', '-id')
+    )
+
+
+def reviews_num_pages(product):
+    try:
+        review_count = product.stats.review_count
+    except ProductStats.DoesNotExist:
+        review_count = 0
+    return max(math.ceil(review_count / REVIEWS_PER_PAGE), 1)
+
+
+def clamp_reviews_page(product, reviews_page):
+    # Номер страницы за последней заменяется последней, как в Paginator.get_page:
+    # иначе огромный ?reviews_page= даёт OFFSET, который база не принимает
+    return min(reviews_page, reviews_num_pages(product))
+
+
+def load_reviews(pk, reviews_page):
+    # Лишняя строка показывает, есть ли следующая страница, без COUNT(*)
+    offset = (reviews_page - 1) * REVIEWS_PER_PAGE
+    return list(reviews_query(pk)[offset:offset + REVIEWS_PER_PAGE + 1])
+
+
+def load_user_review(user, pk):
+    if not user.is_authenticated:
+        return None
+    return ReviewLog.objects.filter(product_id=pk, user=user).first()
+
+
+def build_product_page(product, composition, reviews, user_review, reviews_page):
+    try:
+        stats = product.stats
+    except ProductStats.DoesNotExist:
+        stats = ProductStats(product=product)
+
+    return {
+        'product': product,
+        'average_rating': stats.average_rating or 0,
+        'total_quantity': stats.total_quantity,
+        'composition': composition,
+        'reviews': reviews[:REVIEWS_PER_PAGE],
+        'review_count': stats.review_count,
+        'reviews_page': reviews_page,
+        'reviews_num_pages': reviews_num_pages(product),
+        'has_more_reviews': len(reviews) > REVIEWS_PER_PAGE,
+        'user_review': user_review,
+        'has_review': user_review is not None,
+    }
+
+
+def load_product_page(user, pk, reviews_page=1):
+    # Все данные страницы товара за фиксированное число запросов:
+    # товар с брендом, категорией и сводкой, состав, страница отзывов и отзыв текущего пользователя.
+    # Запросы не зависят друг от друга, асинхронная версия страницы выполняет их параллельно
+    # (страницу отзывов дальше первой — после товара, когда известно число страниц).
+    product = get_product(pk)
+    reviews_page = clamp_reviews_page(product, reviews_page)
+    return build_product_page(
+        product,
+        load_composition(pk),
+        load_reviews(pk, reviews_page),
+        load_user_review(user, pk),
+        reviews_page,
+    )
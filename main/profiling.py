@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from django.conf import settings
+
+# Профиль текущего запроса: заполняется обёрткой SQL и шаблонизатором
+current_profile = ContextVar('current_profile', default=None)
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Доля профилируемых запросов, от 0 до 1
+    'SAMPLE_RATE': 0.1,
+    # Сколько одинаковых по тексту запросов с разными параметрами считать признаком N+1
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SERVER_TIMING': True,
+    'LOG': False,
+}
+DURATION_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def profiling_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+        self.executions = Counter()
+        # Асинхронные представления выполняют запросы одного профиля из нескольких потоков
+        self._lock = threading.Lock()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.db_time += elapsed
+                self.statements[sql] += 1
+                try:
+                    self.executions[(sql, repr(params))] += 1
+                except Exception:
+                    pass
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicate_count(self):
+        # Запросы, повторённые с теми же параметрами
+        return sum(count - 1 for count in self.executions.values() if count > 1)
+
+    def repeated_statements(self, threshold):
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def record_current_query(execute, sql, params, many, context):
+    # Обёртка стоит на каждом соединении постоянно и пишет запрос в профиль из контекста.
+    # Контекст переходит в потоки sync_to_async, поэтому под ASGI учитываются и синхронные представления
+    # (поток thread_sensitive), и запросы рабочих потоков async_views.run_query
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.record_query(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    # Получатель connection_created: соединения открываются в том потоке, где выполняются их запросы
+    if record_current_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_current_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    # Метрики в памяти процесса по именам представлений
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.durations = {}
+        self.totals = {}
+
+    def observe(self, view, total_ms, db_ms, template_ms, queries, duplicates):
+        with self._lock:
+            if view not in self.durations:
+                self.durations[view] = Histogram(DURATION_BUCKETS_MS)
+                self.totals[view] = Counter()
+            self.durations[view].observe(total_ms)
+            totals = self.totals[view]
+            totals['db_ms'] += db_ms
+            totals['template_ms'] += template_ms
+            totals['queries'] += queries
+            totals['duplicate_queries'] += duplicates
+
+    def render_prometheus(self):
+        lines = ['# TYPE ns_request_duration_ms histogram']
+        with self._lock:
+            for view, histogram in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'ns_request_duration_ms_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'ns_request_duration_ms_sum{{view="{view}"}} {histogram.sum:.3f}')
+                lines.append(f'ns_request_duration_ms_count{{view="{view}"}} {histogram.count}')
+            for name in ('db_ms', 'template_ms', 'queries', 'duplicate_queries'):
+                lines.append(f'# TYPE ns_request_{name}_total counter')
+                for view, totals in sorted(self.totals.items()):
+                    value = totals[name]
+                    value = f'{value:.3f}' if isinstance(value, float) else value
+                    lines.append(f'ns_request_{name}_total{{view="{view}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
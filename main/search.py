@@ -0,0 +1,199 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from django.db import transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+from .models import Product, SearchTerm
+
+# Вес вхождения термина в зависимости от поля товара
+FIELD_WEIGHTS = (
+    ('name', 3),
+    ('brand', 2),
+    ('category', 2),
+    ('description', 1),
+)
+MAX_TERM_LENGTH = 64
+
+TOKEN_RE = re.compile(r'[0-9a-zа-яё]+')
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    (('в', 'вши', 'вшись'), True),
+    (('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'), False),
+)
+ADJECTIVE = ((
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+), False),
+PARTICIPLE = (
+    (('ем', 'нн', 'вш', 'ющ', 'щ'), True),
+    (('ивш', 'ывш', 'ующ'), False),
+)
+REFLEXIVE = (('ся', 'сь'), False),
+VERB = (
+    (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'), True),
+    (('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+      'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'), False),
+)
+NOUN = ((
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+), False),
+SUPERLATIVE = (('ейш', 'ейше'), False),
+DERIVATIONAL = ('ост', 'ость')
+
+
+def strip_ending(word, groups):
+    # Отрезает самое длинное подходящее окончание; None, если ничего не найдено
+    best = None
+    for endings, after_a_ya in groups:
+        for ending in endings:
+            if not word.endswith(ending) or (best and len(ending) <= len(best)):
+                continue
+            if after_a_ya and not word[:-len(ending)].endswith(('а', 'я')):
+                continue
+            best = ending
+    return word[:-len(best)] if best else None
+
+
+def region_start(word, start=0):
+    # Начало области после первого сочетания «гласная + согласная», начиная с позиции start
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    # Стеммер Портера (Snowball) для русского языка; слова в каталоге повторяются, поэтому результат кэшируется
+    word = word.lower().replace('ё', 'е')
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in VOWELS), None)
+    if rv_start is None:
+        return word
+    r2_start = region_start(word, region_start(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1
+    stripped = strip_ending(rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        rv = stripped
+    else:
+        stripped = strip_ending(rv, REFLEXIVE)
+        if stripped is not None:
+            rv = stripped
+        adjective = strip_ending(rv, ADJECTIVE)
+        if adjective is not None:
+            participle = strip_ending(adjective, PARTICIPLE)
+            rv = participle if participle is not None else adjective
+        else:
+            for groups in (VERB, NOUN):
+                stripped = strip_ending(rv, groups)
+                if stripped is not None:
+                    rv = stripped
+                    break
+
+    # Шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательные окончания только в R2
+    r2 = max(r2_start - rv_start, 0)
+    for ending in sorted(DERIVATIONAL, key=len, reverse=True):
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2:
+            rv = rv[:-len(ending)]
+            break
+
+    # Шаг 4
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        stripped = strip_ending(rv, SUPERLATIVE)
+        if stripped is not None:
+            rv = stripped[:-1] if stripped.endswith('нн') else stripped
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def normalize(text):
+    return [stem(token)[:MAX_TERM_LENGTH] for token in tokenize(text)]
+
+
+def product_terms(product):
+    fields = {
+        'name': product.name,
+        'brand': product.brand.name if product.brand else '',
+        'category': product.category.name if product.category else '',
+        'description': product.description,
+    }
+    weights = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in normalize(fields[field]):
+            weights[term] += weight
+    return weights
+
+
+def index_products(product_ids):
+    # Инкрементальное обновление индекса для набора товаров
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    products = Product.objects.filter(id__in=product_ids).select_related('brand', 'category')
+    rows = [
+        SearchTerm(term=term, product_id=product.id, weight=weight)
+        for product in products
+        for term, weight in product_terms(product).items()
+    ]
+    with transaction.atomic():
+        SearchTerm.objects.filter(product_id__in=product_ids).delete()
+        SearchTerm.objects.bulk_create(rows, batch_size=1000)
+
+
+def rebuild_search_index(batch_size=500):
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Product.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        index_products(ids)
+        total += len(ids)
+        last_id = ids[-1]
+        yield total
+
+
+def search_products(query, queryset=None):
+    # Все слова запроса должны найтись в индексе; последнее слово ищется по префиксу,
+    # чтобы запрос работал по мере набора. Релевантность — сумма весов совпавших терминов.
+    terms = normalize(query)
+    if queryset is None:
+        queryset = Product.objects.all()
+    if not terms:
+        return queryset.none()
+
+    term_filters = [Q(search_terms__term=term) for term in terms[:-1]]
+    term_filters.append(Q(search_terms__term__startswith=terms[-1]))
+
+    any_term = Q()
+    for term_filter in term_filters:
+        any_term |= term_filter
+
+    hits = {
+        f'hit_{i}': Max(Case(When(term_filter, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        for i, term_filter in enumerate(term_filters)
+    }
+    return (
+        queryset.filter(any_term)
+        .annotate(rank=Sum('search_terms__weight'), **hits)
+        .filter(**{name: 1 for name in hits})
+    )
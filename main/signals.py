@@ -0,0 +1,117 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Brand, Country, Nutrient, Product, ProductCategory, ProductComposition, ReviewLog, StoreInventory
+from .caching import invalidate_pages, invalidate_products
+from .cart import SessionCart, merge_draft_orders
+from .facets import facet_index
+from .lookups import LOOKUP_TABLES
+from .search import index_products
+from .suggest import SOURCE_KINDS, suggest_index
+from .stats import product_stats_refreshed, refresh_product_stats
+
+
+def origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def deleted_with_product(origin):
+    # При каскадном удалении товара пересчитывать его сводку не нужно
+    return issubclass(origin_model(origin), Product)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    if created:
+        refresh_product_stats([instance.id])
+    index_products([instance.id])
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, created, **kwargs):
+    if not created:
+        product_ids = list(instance.product_set.values_list('id', flat=True))
+        index_products(product_ids)
+        # Могла измениться страна бренда
+        facet_index.refresh(product_ids)
+
+
+@receiver(post_save, sender=ProductCategory)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=ReviewLog)
+@receiver(post_save, sender=StoreInventory)
+def product_stats_source_saved(sender, instance, **kwargs):
+    refresh_product_stats([instance.product_id])
+
+
+@receiver(post_delete, sender=ReviewLog)
+@receiver(post_delete, sender=StoreInventory)
+def product_stats_source_deleted(sender, instance, origin=None, **kwargs):
+    if origin is not None and deleted_with_product(origin):
+        return
+    refresh_product_stats([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=ProductCategory)
+def suggest_source_changed(sender, instance, **kwargs):
+    suggest_index.refresh(SOURCE_KINDS[sender], [instance.id])
+
+
+def lookup_table_changed(sender, **kwargs):
+    LOOKUP_TABLES[sender].invalidate()
+    invalidate_pages()
+
+
+for model in LOOKUP_TABLES:
+    post_save.connect(lookup_table_changed, sender=model, dispatch_uid=f'lookup-save-{model._meta.label_lower}')
+    post_delete.connect(lookup_table_changed, sender=model, dispatch_uid=f'lookup-delete-{model._meta.label_lower}')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_pages_changed(sender, instance, **kwargs):
+    invalidate_products([instance.id])
+
+
+@receiver(product_stats_refreshed)
+def product_stats_changed(sender, product_ids, **kwargs):
+    invalidate_products(product_ids)
+    facet_index.refresh(product_ids)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_facets_changed(sender, instance, created=False, **kwargs):
+    # Новый товар попадает в индекс фасетов вместе с пересчётом сводки
+    if not created:
+        facet_index.refresh([instance.id])
+
+
+@receiver([post_save, post_delete], sender=ProductComposition)
+def composition_changed(sender, instance, origin=None, **kwargs):
+    # Каскадное удаление вместе с товаром или веществом обрабатывают их собственные сигналы
+    if origin is not None and not issubclass(origin_model(origin), ProductComposition):
+        return
+    invalidate_products([instance.product_id])
+    facet_index.refresh([instance.product_id])
+
+
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=Nutrient)
+def facet_value_deleted(sender, **kwargs):
+    # Ссылки на удалённую запись обнуляются или удаляются запросом без сигналов по товарам
+    facet_index.invalidate()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    # Анонимная корзина переживает вход вместе с сессией, к ней добавляются старые черновики из базы
+    if request is not None and hasattr(request, 'session'):
+        merge_draft_orders(SessionCart(request.session), user)
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import connection
+from django.db.models import Avg, Count, Sum
+from django.dispatch import Signal
+from .models import Product, ProductStats, ReviewLog, StoreInventory
+
+STATS_FIELDS = ['average_rating', 'review_count', 'total_quantity', 'updated_at']
+
+# Отправляется после пересчёта сводки, аргумент product_ids
+product_stats_refreshed = Signal()
+
+# Товары, пересчёт которых отложен до выхода из defer_stats_refresh
+deferred_product_ids = ContextVar('deferred_product_ids', default=None)
+
+
+@contextmanager
+def defer_stats_refresh():
+    # Пересчёты внутри блока (например, из сигналов при удалении по одной строке)
+    # собираются и выполняются один раз на выходе
+    if deferred_product_ids.get() is not None:
+        yield
+        return
+    product_ids = set()
+    token = deferred_product_ids.set(product_ids)
+    try:
+        yield
+    finally:
+        deferred_product_ids.reset(token)
+    refresh_product_stats(product_ids)
+
+
+def refresh_product_stats(product_ids):
+    # Пересчёт сводки по набору товаров: два сгруппированных агрегата и один upsert
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    deferred = deferred_product_ids.get()
+    if deferred is not None:
+        deferred.update(product_ids)
+        return
+
+    ratings = {
+        row['product']: row
+        for row in ReviewLog.objects.filter(product_id__in=product_ids, viewable=True)
+        .values('product')
+        .annotate(avg=Avg('grade'), cnt=Count('id'))
+    }
+    stock = dict(
+        StoreInventory.objects.filter(product_id__in=product_ids)
+        .values('product')
+        .annotate(qty=Sum('quantity'))
+        .values_list('product', 'qty')
+    )
+
+    # Товар мог быть удалён к моменту пересчёта
+    existing = Product.objects.filter(id__in=product_ids).values_list('id', flat=True)
+    rows = []
+    for product_id in existing:
+        rating = ratings.get(product_id)
+        rows.append(ProductStats(
+            product_id=product_id,
+            average_rating=rating['avg'] if rating else None,
+            review_count=rating['cnt'] if rating else 0,
+            total_quantity=stock.get(product_id) or 0,
+        ))
+
+    upsert_product_stats(rows)
+    product_stats_refreshed.send(sender=ProductStats, product_ids=product_ids)
+
+
+def upsert_product_stats(rows):
+    if not rows:
+        return
+    # MySQL не принимает unique_fields в ON DUPLICATE KEY UPDATE
+    unique_fields = ['product'] if connection.features.supports_update_conflicts_with_target else None
+    ProductStats.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=STATS_FIELDS,
+    )
+
+
+def rebuild_product_stats(batch_size=1000):
+    # Полная перестройка сводки пачками по id товаров
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Product.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        refresh_product_stats(ids)
+        total += len(ids)
+        last_id = ids[-1]
+        yield total
@@ -0,0 +1,23 @@
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from .assets import COMPRESSIBLE_EXTENSIONS, compress_file
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # collectstatic пишет копии файлов с хэшем содержимого в имени и заранее сжатые .gz/.br рядом с ними
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Промежуточные проходы обработки CSS дают разные имена, сжимаются только итоговые
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS):
+                compress_file(self.path(name))
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Файла нет среди собранной статики (фото товаров из базы, запуск без collectstatic):
+            # ссылка без хэша вместо ошибки рендеринга страницы
+            return name
@@ -0,0 +1,163 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from urllib.parse import urlencode
+from django.core.cache import cache
+from django.urls import reverse
+from .models import Brand, Product, ProductCategory
+
+WORD_START_RE = re.compile(r'(?:^|(?<=[\s\-/(«"]))\w', re.UNICODE)
+
+# Порядок вывода групп подсказок
+KIND_ORDER = {'category': 0, 'brand': 1, 'product': 2}
+SOURCES = {'category': ProductCategory, 'brand': Brand, 'product': Product}
+SOURCE_KINDS = {model: kind for kind, model in SOURCES.items()}
+
+VERSION_KEY = 'suggest:version'
+CHANGES_PREFIX = 'suggest:changes:'
+CHANGES_TIMEOUT = 3600
+# Если процесс отстал больше чем на столько изменений, индекс строится заново
+MAX_PENDING_CHANGES = 200
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().replace('ё', 'е').split())
+
+
+class PrefixIndex:
+    # Отсортированный массив ключей в памяти процесса: поиск по префиксу через bisect.
+    # Ключ строится для каждого слова названия, чтобы «whey» находил «Gold Standard Whey».
+    # Как и у индекса фасетов, изменения записываются в общий кэш журналом: номер версии и список
+    # изменённых записей. Процесс, увидевший новую версию, заменяет только их; без журнала строит индекс заново.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def bump(self):
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, time.time_ns(), None)
+            return None
+
+    def invalidate(self):
+        # Полная перестройка во всех процессах: у новой версии нет записи в журнале
+        self.bump()
+
+    def refresh(self, kind, pks):
+        # Записи перечитываются при следующем обращении к индексу в каждом процессе
+        changes = sorted({(kind, pk) for pk in pks})
+        if not changes:
+            return
+        version = self.bump()
+        if version is not None:
+            cache.set(f'{CHANGES_PREFIX}{version}', changes, CHANGES_TIMEOUT)
+
+    def load_entries(self, changes=None):
+        # (вид, id, название, адрес) всех записей или только изменённых
+        catalog_url = reverse('catalog')
+        for kind, model in SOURCES.items():
+            rows = model.objects.order_by()
+            if changes is not None:
+                pks = [pk for changed_kind, pk in changes if changed_kind == kind]
+                if not pks:
+                    continue
+                rows = rows.filter(id__in=pks)
+            for pk, name in rows.values_list('id', 'name').iterator(chunk_size=2000):
+                if kind == 'product':
+                    url = reverse('product-detail', args=[pk])
+                else:
+                    url = f"{catalog_url}?{urlencode({kind: pk})}"
+                yield kind, pk, name, url
+
+    def entry_pairs(self, name, position):
+        # (ключ, совпадение не с начала названия, позиция) для каждого слова
+        key = normalize(name)
+        return [(key[match.start():], match.start() > 0, position) for match in WORD_START_RE.finditer(key)]
+
+    def build(self, version):
+        positions, entries, pairs = {}, [], []
+        for kind, pk, name, url in self.load_entries():
+            position = positions[kind, pk] = len(entries)
+            entries.append((kind, name, url))
+            pairs += self.entry_pairs(name, position)
+        pairs.sort()
+        return {'version': version, 'positions': positions, 'entries': entries, 'pairs': pairs}
+
+    def apply(self, data, version, changes):
+        # Новый снимок: пары изменённых записей удаляются и вставляются заново на свои места
+        positions, entries, pairs = dict(data['positions']), list(data['entries']), list(data['pairs'])
+        for change in changes:
+            position = positions.get(change)
+            if position is None or entries[position] is None:
+                continue
+            for pair in self.entry_pairs(entries[position][1], position):
+                i = bisect_left(pairs, pair)
+                if i < len(pairs) and pairs[i] == pair:
+                    del pairs[i]
+            entries[position] = None
+        for kind, pk, name, url in self.load_entries(changes):
+            position = positions.get((kind, pk))
+            if position is None:
+                position = positions[kind, pk] = len(entries)
+                entries.append(None)
+            entries[position] = (kind, name, url)
+            for pair in self.entry_pairs(name, position):
+                insort(pairs, pair)
+        return {'version': version, 'positions': positions, 'entries': entries, 'pairs': pairs}
+
+    def pending_changes(self, since, version):
+        # Изменённые записи между версиями или None, если журнал неполон
+        if version < since or version - since > MAX_PENDING_CHANGES:
+            return None
+        keys = [f'{CHANGES_PREFIX}{number}' for number in range(since + 1, version + 1)]
+        found = cache.get_many(keys)
+        if len(found) != len(keys):
+            return None
+        return {tuple(change) for key in keys for change in found[key]}
+
+    def data(self):
+        version = self.version()
+        data = self._data
+        if data is not None and data['version'] == version:
+            return data
+        with self._lock:
+            data = self._data
+            if data is None or data['version'] != version:
+                changes = self.pending_changes(data['version'], version) if data is not None else None
+                data = self._data = self.build(version) if changes is None else self.apply(data, version, changes)
+        return data
+
+    def suggest(self, query, limit=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        data = self.data()
+        pairs, entries = data['pairs'], data['entries']
+
+        found = {}
+        i = bisect_left(pairs, (prefix,))
+        # Просматриваем ограниченное окно, чтобы время ответа не зависело от размера каталога
+        while i < len(pairs) and len(found) < limit * 3 and pairs[i][0].startswith(prefix):
+            _, in_middle, position = pairs[i]
+            # Совпадение с начала названия ранжируется выше совпадения с середины
+            found[position] = min(found.get(position, True), in_middle)
+            i += 1
+
+        ranked = sorted(found, key=lambda p: (found[p], KIND_ORDER[entries[p][0]], entries[p][1]))
+        return [
+            {'kind': entries[p][0], 'label': entries[p][1], 'url': entries[p][2]}
+            for p in ranked[:limit]
+        ]
+
+
+suggest_index = PrefixIndex()
@@ -0,0 +1,8 @@
+from django import template
+from main.assets import vendor_asset_url
+
+register = template.Library()
+
+@register.simple_tag
+def vendor_asset(name):
+    return vendor_asset_url(name)
@@ -0,0 +1,24 @@
+from django import template
+from django.forms.utils import flatatt
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+register = template.Library()
+
+def srcset(variants):
+    return ', '.join(f'{static(variant.path)} {variant.width}w' for variant in variants)
+
+@register.simple_tag
+def responsive_img(source, variants, sizes='100vw', **attrs):
+    # <picture> с WebP и запасным форматом из копий build_image_variants; без копий — исходный файл
+    if not variants:
+        return format_html('<img src="{}"{}>', static(source), flatatt(attrs))
+    webp = [variant for variant in variants if variant.format == 'webp']
+    fallback = [variant for variant in variants if variant.format != 'webp'] or webp
+    default = fallback[len(fallback) // 2]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}"{}></picture>',
+        srcset(webp), sizes, static(default.path), srcset(fallback), sizes, default.width, default.height,
+        flatatt(attrs),
+    )
@@ -1,6 +0,0 @@
-from django import template
-register = template.Library()
-
-@register.filter
-def multiply(value, arg):
-    return value * arg
@@ -1,3 +1,1121 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import Http404, QueryDict
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import assets
+from .benchmark import bench_context, bench_requests, measure_request, seed_dataset, unbenched_routes
+from .cart import CART_SESSION_KEY
+from .catalog_io import detect_format, import_rows, open_text, read_rows
+from .checks import vendor_assets_check
+from .facets import catalog_facets, facet_index
+from .images import Image, build_variants, image_sources, process_image
+from .management.commands.explain_queries import explain, query_shapes
+from .models import (
+    Brand, Country, CustomUser, ImageVariant, Nutrient, Order, OrderItem, OrderStatus, Product, ProductCategory, ProductComposition,
+    ProductStats, ReviewLog, Store, StoreInventory, Wishlist, WishlistItem,
+)
+from .pagination import CURSOR_SALT, EstimatedCountPaginator, KeysetPaginator
+from .search import search_products, stem
+from .stats import defer_stats_refresh, product_stats_refreshed, rebuild_product_stats, refresh_product_stats
+from .suggest import PrefixIndex
+from .views import get_user_wishlist, parse_cart_quantities
 
-# Create your tests here.
+
+class ProductDetailQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        brand = Brand.objects.create(name='Maxler')
+        category = ProductCategory.objects.create(name='Протеин')
+        cls.product = Product.objects.create(name='Whey', brand=brand, category=category, price=1990)
+        nutrient = Nutrient.objects.create(name='Белок')
+        ProductComposition.objects.create(product=cls.product, nutrient=nutrient, amount=24)
+        cls.url = reverse('product-detail', args=[cls.product.id])
+
+    def setUp(self):
+        cache.clear()
+
+    def add_reviews(self, count):
+        for i in range(count):
+            author = CustomUser.objects.create(username=f'author{ReviewLog.objects.count()}')
+            ReviewLog.objects.create(user=author, product=self.product, grade=i % 5 + 1, comment='Отзыв')
+
+    def test_anonymous_page_queries(self):
+        self.add_reviews(3)
+        # товар, состав, отзывы
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['reviews']), 3)
+
+    def test_authenticated_page_queries(self):
+        self.add_reviews(3)
+        self.client.force_login(self.user)
+        # пользователь, товар, состав, отзывы, отзыв пользователя; сессия читается из кэша
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['has_review'])
+
+    def test_queries_do_not_grow_with_reviews(self):
+        self.add_reviews(25)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['reviews']), 10)
+        self.assertTrue(response.context['has_more_reviews'])
+
+        cache.clear()
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'reviews_page': 3})
+        self.assertEqual(len(response.context['reviews']), 5)
+        self.assertFalse(response.context['has_more_reviews'])
+
+    def test_page_past_the_end_shows_last_page(self):
+        self.add_reviews(25)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'reviews_page': '9' * 30})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['reviews_page'], 3)
+        self.assertEqual(len(response.context['reviews']), 5)
+
+    def test_rating_and_review_count_from_stats(self):
+        self.add_reviews(2)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['review_count'], 2)
+        self.assertEqual(response.context['average_rating'], 1.5)
+
+    def test_existing_review_is_reused(self):
+        ReviewLog.objects.create(user=self.user, product=self.product, grade=5)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertTrue(response.context['has_review'])
+        self.assertIsNone(response.context['review_form'])
+
+
+class ConcurrentIncrementTests(TransactionTestCase):
+    THREADS = 8
+    CLICKS = 5
+
+    def setUp(self):
+        # Разделяемая SQLite-база в памяти блокирует таблицы целиком и зависает на параллельной записи
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('нужна файловая база или MySQL')
+        cache.clear()
+        self.user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        self.product = Product.objects.create(name='Whey', price=1990)
+
+    def click_concurrently(self, url, prepare=None):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def worker():
+            client = Client()
+            try:
+                if prepare is None:
+                    client.force_login(self.user)
+                else:
+                    prepare(client)
+                barrier.wait(timeout=30)
+                for _ in range(self.CLICKS):
+                    response = client.post(url)
+                    if response.status_code != 302:
+                        errors.append(response.status_code)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_add_to_wishlist_keeps_every_click(self):
+        Wishlist.objects.create(user=self.user)
+        self.click_concurrently(reverse('add-to-wishlist', args=[self.product.id]))
+        item = WishlistItem.objects.get(product=self.product)
+        self.assertEqual(item.quantity, self.THREADS * self.CLICKS)
+
+    def test_first_wishlist_clicks_create_one_wishlist(self):
+        # Списка ещё нет: параллельные get_or_create не должны создать второй
+        self.click_concurrently(reverse('add-to-wishlist', args=[self.product.id]))
+        wishlist = Wishlist.objects.get(user=self.user)
+        self.assertEqual(wishlist.wishlistitem_set.get().quantity, self.THREADS * self.CLICKS)
+
+    def test_add_to_cart_keeps_every_click(self):
+        # Все потоки кликают в одной сессии: корзина в ней не должна терять изменения
+        url = reverse('add-to-cart', args=[self.product.id])
+        first = Client()
+        first.post(url)
+        session_key = first.cookies[settings.SESSION_COOKIE_NAME].value
+        self.click_concurrently(url, lambda client: client.cookies.load({settings.SESSION_COOKIE_NAME: session_key}))
+        session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        self.assertEqual(session[CART_SESSION_KEY], {str(self.product.id): self.THREADS * self.CLICKS + 1})
+
+
+class WishlistTests(TestCase):
+    def test_one_wishlist_per_user(self):
+        user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        wishlist = get_user_wishlist(user)
+        self.assertEqual(get_user_wishlist(user), wishlist)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Wishlist.objects.create(user=user)
+
+
+@override_settings(METRICS_TOKEN='metrics-token')
+class MetricsAccessTests(TestCase):
+    def test_requires_staff_or_token(self):
+        url = reverse('metrics')
+        # Тестовый клиент приходит с 127.0.0.1, как и все запросы через обратный прокси
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 404)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer metrics-token'}).status_code, 200)
+        self.client.force_login(CustomUser.objects.create_user('admin', password='secret', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class SessionCartTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        cls.draft = OrderStatus.objects.create(name='Черновик')
+        OrderStatus.objects.create(name='В обработке')
+        cls.store = Store.objects.create(name='Центр', address='Ленина, 1', phone='1', open_hours='9-21')
+        cls.whey = Product.objects.create(name='Whey', price=1990)
+        cls.bcaa = Product.objects.create(name='BCAA', price=990)
+        StoreInventory.objects.create(store=cls.store, product=cls.whey, quantity=10, updated_at=timezone.now())
+        StoreInventory.objects.create(store=cls.store, product=cls.bcaa, quantity=10, updated_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_cart_does_not_touch_orders(self):
+        self.client.post(reverse('add-to-cart', args=[self.whey.id]))
+        self.client.post(reverse('add-to-cart', args=[self.whey.id]))
+        self.client.post(reverse('add-to-cart', args=[self.bcaa.id]))
+        self.client.post(reverse('update-cart'), {f'quantity_{self.bcaa.id}': '0'})
+        self.assertEqual(self.client.session[CART_SESSION_KEY], {str(self.whey.id): 2})
+        self.assertFalse(Order.objects.exists())
+
+    def test_parse_cart_quantities(self):
+        data = QueryDict(mutable=True)
+        data.update({'quantity_1': '3', 'quantity_2': '0', 'quantity_3': '', 'csrfmiddlewaretoken': 'x'})
+        self.assertEqual(parse_cart_quantities(data), ({1: 3, 2: 0}, False))
+        for bad in ({'quantity_1': '-1'}, {'quantity_1': 'два'}, {'quantity_x': '1'}, {'quantity_1': '1.5'}):
+            with self.subTest(bad):
+                self.assertTrue(parse_cart_quantities(bad)[1])
+
+    def test_invalid_quantity_leaves_cart_unchanged(self):
+        self.client.post(reverse('add-to-cart', args=[self.whey.id]))
+        self.client.post(reverse('add-to-cart', args=[self.bcaa.id]))
+        response = self.client.post(reverse('update-cart'), {
+            f'quantity_{self.whey.id}': '5', f'quantity_{self.bcaa.id}': '-2',
+        })
+        self.assertRedirects(response, reverse('cart'))
+        self.assertEqual(self.client.session[CART_SESSION_KEY], {str(self.whey.id): 1, str(self.bcaa.id): 1})
+
+    def test_login_merges_draft_order_and_checkout_creates_order(self):
+        draft = Order.objects.create(user=self.user, status=self.draft)
+        OrderItem.objects.create(order=draft, product=self.bcaa, quantity=3, price=self.bcaa.price)
+        self.client.post(reverse('add-to-cart', args=[self.whey.id]))
+
+        self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret'})
+        self.assertFalse(Order.objects.filter(id=draft.id).exists())
+        self.assertEqual(
+            self.client.session[CART_SESSION_KEY],
+            {str(self.whey.id): 1, str(self.bcaa.id): 3},
+        )
+
+        response = self.client.post(reverse('checkout'), {'store_id': self.store.id})
+        self.assertRedirects(response, reverse('profile'))
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.status.name, 'В обработке')
+        self.assertEqual(
+            dict(order.orderitem_set.values_list('product_id', 'quantity')),
+            {self.whey.id: 1, self.bcaa.id: 3},
+        )
+        self.assertNotIn(CART_SESSION_KEY, self.client.session)
+
+        # Заказ хранит цены на момент оформления, суммы считаются в БД
+        Product.objects.filter(pk=self.whey.pk).update(price=1)
+        response = self.client.get(reverse('order-detail', args=[order.id]))
+        self.assertEqual(response.context['total_price'], 1990 + 990 * 3)
+        self.assertEqual(
+            {item.product_id: item.line_total for item in response.context['items']},
+            {self.whey.id: 1990, self.bcaa.id: 990 * 3},
+        )
+        self.assertEqual(Order.objects.with_totals().get(pk=order.pk).total, 1990 + 990 * 3)
+
+
+class ProfileQueriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        OrderStatus.objects.create(name='Черновик')
+        cls.status = OrderStatus.objects.create(name='В обработке')
+        cls.store = Store.objects.create(name='Центр', address='Ленина, 1', phone='1', open_hours='9-21')
+        cls.products = [Product.objects.create(name=f'Товар {i}', price=100 * (i + 1)) for i in range(3)]
+        wishlist = Wishlist.objects.create(user=cls.user)
+        for product in cls.products:
+            WishlistItem.objects.create(wishlist=wishlist, product=product, quantity=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, status=self.status, store=self.store)
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product=product, quantity=2, price=product.price) for product in self.products
+            )
+
+    def test_queries_do_not_grow_with_orders(self):
+        # Справочник статусов загружается первым запросом и дальше берётся из памяти процесса
+        self.client.get(reverse('profile'))
+        # пользователь, список желаний, его товары, число заказов, страница заказов с суммами
+        for count in (1, 15):
+            with self.subTest(orders=count):
+                Order.objects.all().delete()
+                self.add_orders(count)
+                with self.assertNumQueries(5):
+                    response = self.client.get(reverse('profile'))
+                orders = response.context['orders']
+                self.assertEqual(len(orders), min(count, 10))
+                self.assertEqual(orders[0].total, (100 + 200 + 300) * 2)
+
+
+class CheckoutStockTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        OrderStatus.objects.create(name='Черновик')
+        OrderStatus.objects.create(name='В обработке')
+        cls.store = Store.objects.create(name='Центр', address='Ленина, 1', phone='1', open_hours='9-21')
+        cls.whey = Product.objects.create(name='Whey', price=1990)
+        cls.bcaa = Product.objects.create(name='BCAA', price=990)
+        StoreInventory.objects.create(store=cls.store, product=cls.whey, quantity=5, updated_at=timezone.now())
+        StoreInventory.objects.create(store=cls.store, product=cls.bcaa, quantity=1, updated_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def checkout(self, quantities):
+        for product, quantity in quantities.items():
+            for _ in range(quantity):
+                self.client.post(reverse('add-to-cart', args=[product.id]))
+        return self.client.post(reverse('checkout'), {'store_id': self.store.id})
+
+    def stock(self):
+        return dict(StoreInventory.objects.values_list('product_id', 'quantity'))
+
+    def test_shortage_keeps_stock_and_cart(self):
+        response = self.checkout({self.whey: 2, self.bcaa: 2})
+        self.assertRedirects(response, reverse('cart'))
+        message, = [message for message in get_messages(response.wsgi_request) if message.level_tag == 'error']
+        self.assertIn('BCAA (в наличии: 1)', str(message))
+        self.assertNotIn('Whey', str(message))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), {self.whey.id: 5, self.bcaa.id: 1})
+        self.assertEqual(self.client.session[CART_SESSION_KEY], {str(self.whey.id): 2, str(self.bcaa.id): 2})
+
+    def test_checkout_takes_stock(self):
+        response = self.checkout({self.whey: 2, self.bcaa: 1})
+        self.assertRedirects(response, reverse('profile'))
+        self.assertEqual(self.stock(), {self.whey.id: 3, self.bcaa.id: 0})
+        self.assertEqual(ProductStats.objects.get(product=self.whey).total_quantity, 3)
+
+
+@override_settings(INVENTORY_SYNC_TOKENS={'store-token': 1}, INVENTORY_FEED_DELAY=0)
+class InventorySyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = Store.objects.create(id=1, name='Центр', address='Ленина, 1', phone='1', open_hours='9-21')
+        cls.whey = Product.objects.create(name='Whey', price=1990)
+        cls.bcaa = Product.objects.create(name='BCAA', price=990)
+        cls.synced = timezone.now() - timedelta(hours=1)
+        StoreInventory.objects.create(store=cls.store, product=cls.whey, quantity=10, updated_at=cls.synced)
+        cls.url = reverse('inventory-sync', args=[cls.store.id])
+
+    def push(self, items, token='store-token'):
+        return self.client.post(
+            self.url, json.dumps({'items': items}), content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    def test_batch_upserts_and_skips_stale(self):
+        newer = (self.synced + timedelta(minutes=5)).isoformat()
+        older = (self.synced - timedelta(minutes=5)).isoformat()
+        response = self.push([
+            {'product_id': self.whey.id, 'quantity': 7, 'updated_at': newer},
+            {'product_id': self.bcaa.id, 'quantity': 3, 'updated_at': newer},
+            {'product_id': self.bcaa.id + 100, 'quantity': 1, 'updated_at': newer},
+        ])
+        self.assertEqual(response.json(), {
+            'created': 1, 'updated': 1, 'unchanged': 0, 'stale': 0, 'unknown': [self.bcaa.id + 100],
+        })
+        response = self.push([{'product_id': self.whey.id, 'quantity': 99, 'updated_at': older}])
+        self.assertEqual(response.json()['stale'], 1)
+        self.assertEqual(
+            dict(StoreInventory.objects.values_list('product_id', 'quantity')),
+            {self.whey.id: 7, self.bcaa.id: 3},
+        )
+        self.assertEqual(self.whey.stats.total_quantity, 7)
+
+    def test_token_and_payload_are_checked(self):
+        self.assertEqual(self.push([], token='wrong').status_code, 401)
+        self.assertEqual(self.push([{'product_id': self.whey.id, 'quantity': -1}]).status_code, 400)
+
+    def test_changes_feed_resumes_from_cursor(self):
+        self.push([{'product_id': self.bcaa.id, 'quantity': 3, 'updated_at': timezone.now().isoformat()}])
+        headers = {'Authorization': 'Bearer store-token'}
+        first = self.client.get(reverse('inventory-changes'), {'limit': 1}, headers=headers).json()
+        self.assertEqual([row['product_id'] for row in first['results']], [self.whey.id])
+        self.assertTrue(first['has_more'])
+        second = self.client.get(reverse('inventory-changes'), {**first['next'], 'limit': 1}, headers=headers).json()
+        self.assertEqual([row['product_id'] for row in second['results']], [self.bcaa.id])
+        third = self.client.get(reverse('inventory-changes'), {**second['next'], 'limit': 1}, headers=headers).json()
+        self.assertEqual(third['results'], [])
+        self.assertEqual(third['next'], second['next'])
+
+    def test_changes_feed_rejects_empty_limit(self):
+        headers = {'Authorization': 'Bearer store-token'}
+        for limit in (0, -5):
+            with self.subTest(limit=limit):
+                response = self.client.get(reverse('inventory-changes'), {'limit': limit}, headers=headers)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('errors', response.json())
+
+    def test_changes_feed_needs_token_or_staff(self):
+        # Тестовый клиент приходит с 127.0.0.1: адрес сам по себе доступа не даёт
+        self.assertEqual(self.client.get(reverse('inventory-changes')).status_code, 404)
+        staff = CustomUser.objects.create_user('staff', password='secret', phone='9990000005', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('inventory-changes'), {'store': self.store.id})
+        self.assertEqual([row['product_id'] for row in response.json()['results']], [self.whey.id])
+
+
+class ReviewModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = CustomUser.objects.create_superuser('moderator', password='secret', phone='9990000001')
+        cls.products = [Product.objects.create(name=f'Товар {i}', price=100) for i in range(3)]
+        for i in range(9):
+            author = CustomUser.objects.create(username=f'author{i}')
+            ReviewLog.objects.create(user=author, product=cls.products[i % 3], grade=5, viewable=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.moderator)
+
+    def test_queue_approves_and_rejects_in_bulk(self):
+        response = self.client.get(reverse('moderation-queue'))
+        self.assertEqual(len(response.context['page_obj']), 9)
+
+        approve = ReviewLog.objects.filter(product__in=self.products[:2]).values_list('id', flat=True)
+        # Сводка по обоим товарам пересчитывается сгруппированными запросами, а не по отзыву
+        with self.assertNumQueries(10):
+            self.client.post(reverse('moderation-queue'), {'action': 'approve', 'review_ids': list(approve)})
+        self.assertEqual(ProductStats.objects.get(product=self.products[0]).review_count, 3)
+        self.assertEqual(ProductStats.objects.get(product=self.products[1]).review_count, 3)
+
+        reject = ReviewLog.objects.filter(product=self.products[2]).values_list('id', flat=True)
+        self.client.post(reverse('moderation-queue'), {'action': 'reject', 'review_ids': list(reject)})
+        self.assertFalse(ReviewLog.objects.filter(viewable=False).exists())
+        self.assertEqual(ProductStats.objects.get(product=self.products[2]).review_count, 0)
+
+
+class CatalogFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usa, cls.russia = Country.objects.create(name='США'), Country.objects.create(name='Россия')
+        cls.maxler = Brand.objects.create(name='Maxler', country=cls.usa)
+        cls.geneticlab = Brand.objects.create(name='Geneticlab', country=cls.russia)
+        cls.protein = ProductCategory.objects.create(name='Протеин')
+        cls.bcaa = ProductCategory.objects.create(name='BCAA')
+        cls.whey = Product.objects.create(name='Whey', price=1990, brand=cls.maxler, category=cls.protein)
+        cls.casein = Product.objects.create(name='Casein', price=2490, brand=cls.geneticlab, category=cls.protein)
+        cls.amino = Product.objects.create(name='Amino', price=990, brand=cls.maxler, category=cls.bcaa)
+        leucine = Nutrient.objects.create(name='Лейцин')
+        ProductComposition.objects.create(product=cls.amino, nutrient=leucine, amount=2)
+        store = Store.objects.create(name='Центральный')
+        StoreInventory.objects.create(store=store, product=cls.whey, quantity=5, updated_at=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_exclude_own_facet(self):
+        response = self.client.get(reverse('catalog'), {'brand': [self.maxler.id], 'category': [self.protein.id]})
+        self.assertEqual([product.id for product in response.context['page_obj']], [self.whey.id])
+        facets = response.context['facets']
+        counts = {
+            group['name']: {option['label']: option['count'] for option in group['options']}
+            for group in facets['groups']
+        }
+        self.assertEqual(facets['total'], 1)
+        # Соседние бренды показывают, сколько товаров добавит их выбор внутри выбранной категории
+        self.assertEqual(counts['brand'], {'Maxler': 1, 'Geneticlab': 1})
+        self.assertEqual(counts['category'], {'Протеин': 1, 'BCAA': 1})
+        self.assertEqual(counts['stock'], {'В наличии': 1})
+
+        response = self.client.get(reverse('catalog'), {'brand': [self.maxler.id, self.geneticlab.id], 'nutrient': 'x'})
+        self.assertEqual(response.context['facets']['total'], 3)
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_index_is_refreshed_incrementally(self):
+        self.assertEqual(catalog_facets({'stock': [1]})['total'], 1)
+        # Свежий индекс не обращается к базе
+        with self.assertNumQueries(0):
+            catalog_facets({'country': [self.usa.id]})
+        version = facet_index.version()
+
+        StoreInventory.objects.create(
+            store=Store.objects.get(), product=self.casein, quantity=1, updated_at=timezone.now(),
+        )
+        self.casein.price = 500
+        self.casein.save()
+        # Перечитываются только изменённые товары из журнала: товары и состав — по одному запросу
+        self.assertEqual(facet_index.pending_changes(version, facet_index.version()), {self.casein.id})
+        with self.assertNumQueries(2):
+            facets = catalog_facets({'stock': [1]}, price_max=1000)
+        self.assertEqual(facets['total'], 1)
+        self.assertEqual(catalog_facets({'stock': [1]})['total'], 2)
+
+        self.casein.delete()
+        self.assertEqual(catalog_facets({})['total'], 2)
+        self.assertEqual(facet_index.counts({'brand': [self.geneticlab.id]})[1], 0)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Одинаковые цены с копейками: порядок внутри цены задаёт id, курсор хранит Decimal строкой
+        prices = ['10.10', '10.10', '10.10', '10.20', '10.20', '99.99', '100.00']
+        cls.products = [Product.objects.create(name=f'Товар {i}', price=Decimal(price)) for i, price in enumerate(prices)]
+
+    def paginator(self):
+        return KeysetPaginator(Product.objects.all(), ('price', 'id'), 3)
+
+    def test_walks_forward_and_back_across_equal_prices(self):
+        paginator = self.paginator()
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append([product.id for product in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        expected = [product.id for product in sorted(self.products, key=lambda p: (p.price, p.id))]
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages), 3)
+        # Назад со страницы, начавшейся внутри группы одинаковых цен
+        previous = paginator.get_page(page.previous_cursor)
+        self.assertEqual([product.id for product in previous], pages[1])
+        self.assertTrue(previous.has_next() and previous.has_previous())
+        self.assertEqual(signing.loads(previous.next_cursor, salt=CURSOR_SALT)['v'], ['99.99', pages[1][-1]])
+
+    def test_tampered_cursor_starts_from_first_page(self):
+        paginator = self.paginator()
+        first = [product.id for product in paginator.get_page()]
+        cursor = paginator.get_page().next_cursor
+        forged = signing.dumps({'d': 'next', 'v': ['0', 0, 'лишнее']}, salt=CURSOR_SALT, compress=True)
+        for bad in (cursor[:-2] + 'xx', 'не курсор', forged, signing.dumps({'d': 'next', 'v': ['0', 0]})):
+            with self.subTest(bad):
+                page = paginator.get_page(bad)
+                self.assertEqual([product.id for product in page], first)
+                self.assertFalse(page.has_previous())
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Maxler')
+        for i in range(3):
+            Product.objects.create(name=f'Товар {i}', price=100, brand=cls.brand if i else None)
+
+    def test_unfiltered_list_uses_estimate(self):
+        with mock.patch('main.pagination.estimated_table_count', return_value=12345) as estimate:
+            self.assertEqual(EstimatedCountPaginator(Product.objects.order_by('id'), 10).count, 12345)
+            estimate.assert_called_once_with(Product)
+            self.assertEqual(EstimatedCountPaginator(Product.objects.filter(brand=self.brand).order_by('id'), 10).count, 2)
+        # SQLite не даёт оценки: считается COUNT(*)
+        self.assertEqual(EstimatedCountPaginator(Product.objects.order_by('id'), 10).count, 3)
+
+    def test_admin_changelist_skips_full_count(self):
+        self.client.force_login(CustomUser.objects.create_superuser('admin', password='secret'))
+        with mock.patch('main.pagination.estimated_table_count', return_value=12345), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:main_product_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 12345)
+        counts = [query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql'] and 'main_product' in query['sql']]
+        self.assertEqual(counts, [])
+
+
+# SQLite без ANALYZE считает таблицы большими и выбирает индекс даже на нескольких строках;
+# MySQL на таких данных предпочитает полный просмотр, поэтому планы проверяются только в SQLite
+@skipUnless(connection.vendor == 'sqlite', 'планы запросов проверяются на SQLite')
+class QueryShapeIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        OrderStatus.objects.create(name='Черновик')
+        status = OrderStatus.objects.create(name='В обработке')
+        category = ProductCategory.objects.create(name='Протеины')
+        brand = Brand.objects.create(name='Optimum')
+        store = Store.objects.create(name='Центр', address='Ленина, 1', phone='1', open_hours='9-21')
+        product = Product.objects.create(name='Протеин Whey', price=1990, category=category, brand=brand)
+        user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        StoreInventory.objects.create(store=store, product=product, quantity=5, updated_at=timezone.now())
+        Order.objects.create(user=user, status=status, store=store)
+
+    def test_view_queries_use_indexes(self):
+        plans = {label: explain(queryset) for label, queryset in query_shapes(bench_context())}
+        for label in ('catalog?sort=price_asc', 'catalog?price_min&price_max', 'catalog?category&price_min',
+                      'catalog?brand&price_max', 'product-detail reviews', 'product stats ratings',
+                      'moderation queue', 'inventory changes', 'checkout reserve stock', 'profile orders'):
+            with self.subTest(label):
+                _, scans, _ = plans[label]
+                self.assertEqual(scans, [])
+        # Выдача каталога по цене идёт в порядке составного индекса, без отдельной сортировки
+        for label in ('catalog?sort=price_asc', 'catalog?category&price_min', 'catalog?brand&price_max'):
+            with self.subTest(label):
+                _, _, sorts = plans[label]
+                self.assertEqual(sorts, [])
+
+
+class ProductStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Whey', price=1990)
+        cls.stores = [Store.objects.create(name=f'Магазин {i}') for i in range(2)]
+        cls.authors = [CustomUser.objects.create(username=f'author{i}') for i in range(3)]
+
+    def stats(self):
+        stats = ProductStats.objects.get(product=self.product)
+        return stats.average_rating, stats.review_count, stats.total_quantity
+
+    def test_reviews_and_inventory_update_stats(self):
+        self.assertEqual(self.stats(), (None, 0, 0))
+        ReviewLog.objects.create(user=self.authors[0], product=self.product, grade=5)
+        review = ReviewLog.objects.create(user=self.authors[1], product=self.product, grade=2)
+        # Скрытые отзывы в рейтинг не входят
+        ReviewLog.objects.create(user=self.authors[2], product=self.product, grade=1, viewable=False)
+        for store, quantity in zip(self.stores, (3, 4)):
+            StoreInventory.objects.create(store=store, product=self.product, quantity=quantity, updated_at=timezone.now())
+        self.assertEqual(self.stats(), (3.5, 2, 7))
+        review.delete()
+        StoreInventory.objects.filter(store=self.stores[0]).delete()
+        self.assertEqual(self.stats(), (5, 1, 4))
+
+    def test_rebuild_repairs_drift_and_deferred_refresh_runs_once(self):
+        ReviewLog.objects.create(user=self.authors[0], product=self.product, grade=4)
+        ProductStats.objects.update(average_rating=None, review_count=0)
+        *_, total = rebuild_product_stats()
+        self.assertEqual(total, Product.objects.count())
+        self.assertEqual(self.stats()[:2], (4, 1))
+
+        refreshed = []
+
+        def receiver(sender, product_ids, **kwargs):
+            refreshed.append(set(product_ids))
+
+        product_stats_refreshed.connect(receiver)
+        self.addCleanup(product_stats_refreshed.disconnect, receiver)
+        other = Product.objects.create(name='BCAA', price=990)
+        refreshed.clear()
+        with defer_stats_refresh():
+            refresh_product_stats([self.product.id])
+            refresh_product_stats([other.id])
+            self.assertEqual(refreshed, [])
+        self.assertEqual(refreshed, [{self.product.id, other.id}])
+
+
+class CatalogIOTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Maxler')
+        category = ProductCategory.objects.create(name='Протеин')
+        for i in range(3):
+            Product.objects.create(name=f'Whey {i}', brand=brand, category=category, price=1000 + i, description='Вкус: "ваниль", 2 кг')
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def export(self, name):
+        path = os.path.join(self.tmp.name, name)
+        call_command('export_catalog', 'products', path, stdout=io.StringIO())
+        return path
+
+    def import_file(self, path):
+        fmt = detect_format(path)
+        with open_text(path, 'r') as f:
+            *_, progress = import_rows('products', read_rows(f, fmt), batch_size=2)
+        return progress
+
+    def test_round_trip(self):
+        for name in ('products.csv', 'products.jsonl.gz'):
+            with self.subTest(name):
+                path = self.export(name)
+                Product.objects.filter(name='Whey 0').update(price=1)
+                Product.objects.filter(name='Whey 2').delete()
+                progress = self.import_file(path)
+                self.assertEqual(
+                    {key: progress[key] for key in ('rows', 'created', 'updated', 'unchanged', 'skipped')},
+                    {'rows': 3, 'created': 1, 'updated': 1, 'unchanged': 1, 'skipped': 0},
+                )
+                self.assertEqual(
+                    list(Product.objects.order_by('name').values_list('name', 'price', 'description')),
+                    [(f'Whey {i}', 1000 + i, 'Вкус: "ваниль", 2 кг') for i in range(3)],
+                )
+                # Повторный импорт ничего не меняет
+                self.assertEqual(self.import_file(path)['unchanged'], 3)
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        rows = [
+            {'name': 'Casein', 'brand': 'Maxler', 'price': '1500'},
+            {'name': '', 'brand': 'Maxler', 'price': '1500'},
+            {'name': 'BCAA', 'brand': 'Maxler', 'price': 'дорого'},
+        ]
+        *_, progress = import_rows('products', rows)
+        self.assertEqual((progress['created'], progress['skipped']), (1, 2))
+        self.assertEqual(progress['errors'], [
+            'строка 2: не заполнено поле name',
+            "строка 3: price: не число 'дорого'",
+        ])
+        self.assertTrue(Product.objects.filter(name='Casein', price=1500).exists())
+
+    def test_prices_the_db_cannot_store_are_skipped(self):
+        bad = ('NaN', '-Infinity', '-5', '10000000000000', '9999999999999.999')
+        rows = [{'name': 'Casein', 'brand': 'Maxler', 'price': '1500.555'}]
+        rows += [{'name': f'BCAA {price}', 'brand': 'Maxler', 'price': price} for price in bad]
+        rows += [{'name': 'Gainer', 'brand': 'Maxler', 'price': '9999999999999.99'}]
+        *_, progress = import_rows('products', rows, batch_size=2)
+        self.assertEqual((progress['created'], progress['skipped']), (2, len(bad)))
+        self.assertEqual(progress['errors'], [
+            f'строка {line}: price: недопустимое значение {price!r}' for line, price in enumerate(bad, start=2)
+        ])
+        self.assertEqual(
+            dict(Product.objects.filter(name__in=['Casein', 'Gainer']).values_list('name', 'price')),
+            {'Casein': Decimal('1500.56'), 'Gainer': Decimal('9999999999999.99')},
+        )
+
+    def test_import_from_stdin_keeps_it_open(self):
+        path = self.export('products.jsonl')
+        Product.objects.all().delete()
+        with open(path, encoding='utf-8') as stdin, mock.patch('sys.stdin', stdin):
+            call_command('import_catalog', 'products', '-', format='jsonl', stdout=io.StringIO())
+            self.assertFalse(stdin.closed)
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ProductCategory.objects.create(name='Батончики')
+        cls.bar = Product.objects.create(name='Протеиновый батончик', price=150, category=cls.category)
+        cls.shake = Product.objects.create(name='Коктейль', price=300, description='Много протеина и батончиков')
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query):
+        return list(search_products(query).order_by('-rank', '-id').values_list('name', flat=True))
+
+    def test_stem_russian_inflections(self):
+        self.assertEqual({stem(word) for word in ('протеин', 'протеина', 'протеинов')}, {'протеин'})
+        self.assertEqual({stem(word) for word in ('батончик', 'батончики', 'батончиков')}, {'батончик'})
+        self.assertEqual(stem('сывороточного'), stem('сывороточный'))
+
+    def test_name_ranks_above_description(self):
+        # Название весит 3, категория 2, описание 1
+        self.assertEqual(self.found('батончиками'), ['Протеиновый батончик', 'Коктейль'])
+        self.assertEqual(self.found('коктейли'), ['Коктейль'])
+        self.assertEqual(self.found('коктейль батон'), ['Коктейль'])
+
+    def test_index_follows_product_save(self):
+        self.shake.name = 'Гейнер'
+        self.shake.save()
+        self.assertEqual(self.found('коктейль'), [])
+        self.assertEqual(self.found('гейнеры'), ['Гейнер'])
+        self.category.name = 'Сладости'
+        self.category.save()
+        self.assertEqual(self.found('сладость'), ['Протеиновый батончик'])
+
+    def test_pages_of_equal_rank_do_not_repeat(self):
+        twins = [Product.objects.create(name=f'Креатин {i}', price=500) for i in range(7)]
+        url = reverse('search')
+        seen, cursor = [], None
+        while True:
+            page = self.client.get(url, {'q': 'креатин', 'cursor': cursor or ''}).context['page_obj']
+            seen += [product.id for product in page]
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [product.id for product in reversed(twins)])
+        previous = self.client.get(url, {'q': 'креатин', 'cursor': page.previous_cursor}).context['page_obj']
+        self.assertEqual([product.id for product in previous], seen[3:6])
+
+
+class SuggestIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.brand = Brand.objects.create(name='Optimum Nutrition')
+        self.whey = Product.objects.create(name='Gold Standard Whey', price=4990, brand=self.brand)
+        Product.objects.create(name='Whey Isolate', price=3990)
+
+    def labels(self, index, query):
+        return [row['label'] for row in index.suggest(query)]
+
+    def test_prefix_matches_start_of_name_first(self):
+        self.assertEqual(self.labels(PrefixIndex(), 'whe'), ['Whey Isolate', 'Gold Standard Whey'])
+        self.assertEqual(self.labels(PrefixIndex(), 'nutr'), ['Optimum Nutrition'])
+
+    def test_other_process_applies_saved_changes(self):
+        # Отдельный экземпляр — как индекс в другом процессе: о правках он узнаёт только из общего кэша
+        index = PrefixIndex()
+        self.assertEqual(self.labels(index, 'gold'), ['Gold Standard Whey'])
+        self.whey.name = 'Platinum Whey'
+        self.whey.save()
+        Product.objects.create(name='Gold Casein', price=2990)
+        # Перечитываются только изменённые товары, а не весь каталог
+        with self.assertNumQueries(1):
+            self.assertEqual(self.labels(index, 'gold'), ['Gold Casein'])
+        self.assertEqual(self.labels(index, 'plat'), ['Platinum Whey'])
+        self.brand.delete()
+        self.assertEqual(self.labels(index, 'optimum'), [])
+
+    def test_invalidate_rebuilds_everywhere(self):
+        index = PrefixIndex()
+        self.labels(index, 'whey')
+        Product.objects.filter(id=self.whey.id).update(name='Casein')
+        PrefixIndex().invalidate()
+        self.assertEqual(self.labels(index, 'whey'), ['Whey Isolate'])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Maxler')
+        cls.product = Product.objects.create(name='Whey', price=1990, brand=cls.brand)
+        cls.other = Product.objects.create(name='BCAA', price=990, brand=cls.brand)
+        cls.store = Store.objects.create(name='Центральный')
+        cls.author = CustomUser.objects.create(username='author')
+
+    def setUp(self):
+        cache.clear()
+
+    def assertRevalidates(self, url, change):
+        # Первый ответ выдаёт CSRF-cookie, она входит в ETag
+        self.client.get(url)
+        first = self.client.get(url)
+        etag = first['ETag']
+        # Данные не менялись: 304 без запросов к базе и рендеринга
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_product_page_changes_with_reviews_inventory_and_lookups(self):
+        url = reverse('product-detail', args=[self.product.id])
+        review = ReviewLog.objects.create(
+            user=self.author, product=self.product, grade=5, comment='Отлично', viewable=False,
+        )
+
+        def approve():
+            review.viewable = True
+            review.save()
+
+        def change_price():
+            self.product.price = 1490
+            self.product.save()
+
+        def rename_brand():
+            self.brand.name = 'Maxler Pro'
+            self.brand.save()
+
+        changes = {
+            'review': approve,
+            'inventory': lambda: StoreInventory.objects.create(
+                store=self.store, product=self.product, quantity=3, updated_at=timezone.now(),
+            ),
+            'price': change_price,
+            'brand': rename_brand,
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                self.assertRevalidates(url, change)
+        self.assertContains(self.client.get(url), 'Отлично')
+
+    def test_catalog_changes_with_any_product(self):
+        url = reverse('catalog')
+        self.assertRevalidates(url, lambda: StoreInventory.objects.create(
+            store=self.store, product=self.other, quantity=1, updated_at=timezone.now(),
+        ))
+        # Страница с другими параметрами имеет свой ETag
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, {'sort': 'price_asc'})['ETag'], etag)
+
+    def test_changes_to_other_products_keep_product_page(self):
+        url = reverse('product-detail', args=[self.product.id])
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.other.price = 500
+        self.other.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Авторизованные пользователи получают страницу целиком
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_product_change_keeps_cached_pages_of_other_products(self):
+        urls = {
+            'product': reverse('product-detail', args=[self.product.id]),
+            'other': reverse('product-detail', args=[self.other.id]),
+            'catalog': reverse('catalog'),
+            'contacts': reverse('contacts'),
+        }
+        for url in urls.values():
+            self.client.get(url)
+        self.other.price = 500
+        self.other.save()
+        cached = {name: self.client.get(url)['X-Page-Cache'] for name, url in urls.items()}
+        self.assertEqual(cached, {'product': 'hit', 'other': 'miss', 'catalog': 'miss', 'contacts': 'hit'})
+        self.assertContains(self.client.get(urls['other']), '500')
+
+
+class ResponsiveImageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Whey', price=1990, photo='images/whey.jpg')
+        Product.objects.create(name='BCAA', price=990, photo='images/bcaa.jpg')
+
+    def test_catalog_uses_variants_when_present(self):
+        for width in (240, 480):
+            for fmt in ('webp', 'jpg'):
+                ImageVariant.objects.create(
+                    source=self.product.photo, width=width, height=width, format=fmt,
+                    path=f'variants/images/whey-{width}w.{fmt}', source_mtime=0,
+                )
+        content = self.client.get(reverse('catalog')).content.decode()
+        self.assertIn('srcset="/static/main/variants/images/whey-240w.webp 240w, '
+                      '/static/main/variants/images/whey-480w.webp 480w"', content)
+        # Товар без копий показывает исходный файл
+        self.assertIn('<img src="/static/main/images/bcaa.jpg"', content)
+
+    def test_about_page_uses_brand_variants(self):
+        for pk, name in ((1, 'Fitness Formula'), (2, 'Just Fit'), (6, 'Maxler')):
+            Brand.objects.create(id=pk, name=name, photo=f'images/brand{pk}.png')
+        for width in (240, 480):
+            ImageVariant.objects.create(
+                source='images/brand6.png', width=width, height=width // 2, format='webp',
+                path=f'variants/images/brand6-{width}w.webp', source_mtime=0,
+            )
+        content = self.client.get(reverse('about')).content.decode()
+        self.assertIn('srcset="/static/main/variants/images/brand6-240w.webp 240w, '
+                      '/static/main/variants/images/brand6-480w.webp 480w"', content)
+        self.assertIn('<img src="/static/main/images/brand1.png"', content)
+
+
+@skipUnless(Image, 'нужен пакет Pillow')
+class ImageVariantBuildTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.static = tempfile.TemporaryDirectory()
+        self.variants = tempfile.TemporaryDirectory()
+        self.addCleanup(self.static.cleanup)
+        self.addCleanup(self.variants.cleanup)
+        os.makedirs(os.path.join(self.static.name, 'images'))
+        Image.new('RGB', (600, 300), 'red').save(os.path.join(self.static.name, 'images', 'whey.jpg'))
+        Image.new('RGBA', (200, 100), (0, 0, 0, 0)).save(os.path.join(self.static.name, 'images', 'logo.png'))
+
+    def test_process_image_resizes_without_upscaling(self):
+        path = os.path.join(self.static.name, 'images', 'whey.jpg')
+        source, mtime, variants, error = process_image(('images/whey.jpg', path, 1.0, self.variants.name, (240, 960)))
+        self.assertIsNone(error)
+        self.assertEqual([(width, height, fmt) for width, height, fmt, _ in variants], [
+            (240, 120, 'webp'), (240, 120, 'jpg'), (600, 300, 'webp'), (600, 300, 'jpg'),
+        ])
+        with Image.open(os.path.join(self.variants.name, 'variants/images/whey-240w.webp')) as image:
+            self.assertEqual(image.size, (240, 120))
+
+    def test_build_variants_for_products_and_brands(self):
+        Product.objects.create(name='Whey', price=1990, photo='images/whey.jpg')
+        Brand.objects.create(name='Maxler', photo='images/logo.png')
+        Brand.objects.create(name='Без файла', photo='images/missing.png')
+        with self.settings(
+            STATICFILES_DIRS=[self.static.name], IMAGE_VARIANTS_ROOT=self.variants.name, IMAGE_VARIANT_WIDTHS=(100,),
+        ):
+            *_, progress = build_variants(image_sources(), workers=1)
+            self.assertEqual((progress['processed'], progress['missing'], progress['errors']), (2, ['images/missing.png'], []))
+            # Повторный запуск пропускает обработанные файлы
+            *_, progress = build_variants(image_sources(), workers=1)
+            self.assertEqual(progress['skipped'], 2)
+        self.assertEqual(
+            set(ImageVariant.objects.values_list('source', 'width', 'height', 'format')),
+            {('images/whey.jpg', 100, 50, 'webp'), ('images/whey.jpg', 100, 50, 'jpg'),
+             ('images/logo.png', 100, 50, 'webp'), ('images/logo.png', 100, 50, 'png')},
+        )
+
+
+class StaticAssetTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(assets._local_urls.clear)
+        self.root = Path(self.tmp.name)
+
+    def test_vendor_asset_switches_to_local_copy_without_restart(self):
+        with self.settings(STATICFILES_DIRS=[self.tmp.name]):
+            self.assertEqual(assets.vendor_asset_url('bootstrap.css'), assets.VENDOR_ASSETS['bootstrap.css'])
+            self.assertEqual(vendor_assets_check(None)[0].id, 'main.W001')
+            for name in assets.VENDOR_ASSETS:
+                (self.root / 'vendor' / name).parent.mkdir(parents=True, exist_ok=True)
+                (self.root / 'vendor' / name).write_text('body{}')
+            self.assertEqual(assets.vendor_asset_url('bootstrap.css'), '/static/main/vendor/bootstrap.css')
+            self.assertEqual(vendor_assets_check(None), [])
+
+    def test_serves_precompressed_files(self):
+        (self.root / 'styles.0123456789ab.css').write_text('.card { color: red; }\n' * 200)
+        (self.root / 'photo.png').write_bytes(os.urandom(64))
+        written = assets.compress_file(str(self.root / 'styles.0123456789ab.css'))
+        self.assertIn(str(self.root / 'styles.0123456789ab.css.gz'), written)
+        # Несжимаемый файл остаётся без копий
+        self.assertEqual(assets.compress_file(str(self.root / 'photo.png')), [])
+
+        factory = RequestFactory()
+        with self.settings(STATIC_ROOT=self.tmp.name):
+            response = assets.serve_static(factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br'), 'styles.0123456789ab.css')
+            self.assertEqual(response['Content-Encoding'], 'br' if assets.brotli else 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertEqual(response['Cache-Control'], assets.IMMUTABLE_CACHE_CONTROL)
+            response.close()
+            response = assets.serve_static(factory.get('/'), 'photo.png')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(response['Cache-Control'], assets.MUTABLE_CACHE_CONTROL)
+            response.close()
+            with self.assertRaises(Http404):
+                assets.serve_static(factory.get('/'), '../secret.txt')
+
+
+class BenchUrlsTests(TransactionTestCase):
+    # Асинхронные страницы читают данные из рабочих потоков: данные фиксируются, как в AsyncProductPageTests
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Протеин Whey', price=1990)
+        self.user = CustomUser.objects.create_user('buyer', password='secret', phone='9990000000')
+        self.ctx = {'product': self.product, 'user': self.user, 'order': None, 'store': None, 'query': 'whey'}
+
+    def test_every_named_route_is_benched(self):
+        self.assertEqual(unbenched_routes(bench_requests(self.ctx)), [])
+
+    def test_async_page_queries_are_counted(self):
+        rows = {
+            name: measure_request(Client(), self.ctx, {'name': name, 'method': 'get', 'kwargs': {'pk': self.product.id}},
+                                  repeats=1, cold=True)
+            for name in ('product-detail', 'async-product-detail')
+        }
+        self.assertEqual(rows['product-detail']['status'], 200)
+        self.assertGreater(rows['product-detail']['queries'], 0)
+        self.assertEqual(rows['async-product-detail']['queries'], rows['product-detail']['queries'])
+
+    def test_query_growth_fails_the_command(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'before.json')
+        call_command('bench_urls', only=['metrics'], repeats=0, output=path, stdout=io.StringIO())
+        with open(path, encoding='utf-8') as f:
+            report = json.load(f)
+        report['results'][0]['queries'] -= 1
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'metrics'):
+            call_command('bench_urls', only=['metrics'], repeats=0, compare=path, max_query_growth=0,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+
+class SeedDatasetTests(TestCase):
+    def test_caches_are_reset_after_commit(self):
+        with mock.patch.object(facet_index, 'invalidate') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                seed_dataset(products=4, reviews=6, stores=2, users=3, orders_per_user=2, items_per_order=1,
+                             batch_size=2, log=lambda message: None)
+                invalidate.assert_not_called()
+            invalidate.assert_called_once()
+        self.assertEqual(Product.objects.filter(name__startswith='bench ').count(), 4)
+        self.assertEqual(ProductStats.objects.count(), 4)
+        self.assertEqual(StoreInventory.objects.count(), 8)
+
+
+class AsyncProductPageTests(TransactionTestCase):
+    # Асинхронная страница читает данные из рабочих потоков на отдельных соединениях,
+    # поэтому данные должны быть зафиксированы: TestCase держал бы их в незакрытой транзакции
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Whey', price=1990)
+        nutrient = Nutrient.objects.create(name='Белок')
+        ProductComposition.objects.create(product=self.product, nutrient=nutrient, amount=24)
+        for i in range(12):
+            author = CustomUser.objects.create(username=f'author{i}')
+            ReviewLog.objects.create(user=author, product=self.product, grade=i % 5 + 1, comment='Отзыв')
+
+    async def test_async_page_matches_sync(self):
+        sync = await self.async_client.get(reverse('product-detail', args=[self.product.id]), {'reviews_page': 2})
+        cache.clear()
+        response = await self.async_client.get(
+            reverse('async-product-detail', args=[self.product.id]), {'reviews_page': 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        for key in ('review_count', 'average_rating', 'reviews_num_pages', 'has_more_reviews', 'has_review'):
+            self.assertEqual(response.context[key], sync.context[key], key)
+        self.assertEqual(response.context['reviews'], sync.context['reviews'])
+        self.assertEqual(response.context['composition'], sync.context['composition'])
+
+    async def test_async_page_past_the_end_shows_last_page(self):
+        response = await self.async_client.get(
+            reverse('async-product-detail', args=[self.product.id]), {'reviews_page': '9' * 30},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['reviews_page'], 2)
+        self.assertEqual(len(response.context['reviews']), 2)
+
+    @override_settings(PROFILING={'ENABLED': True, 'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True, 'LOG': False})
+    async def test_profiling_counts_queries_under_asgi(self):
+        # Синхронное представление под ASGI выполняется в потоке sync_to_async, асинхронное — в пуле run_query
+        for name in ('product-detail', 'async-product-detail'):
+            cache.clear()
+            response = await self.async_client.get(reverse(name, args=[self.product.id]))
+            queries = int(re.search(r'desc="(\d+) queries', response['Server-Timing']).group(1))
+            self.assertGreater(queries, 0, name)
+
+    async def test_missing_product_is_404(self):
+        response = await self.async_client.get(reverse('async-product-detail', args=[self.product.id + 1]))
+        self.assertEqual(response.status_code, 404)
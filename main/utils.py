@@ -0,0 +1,10 @@
+def batched(iterable, size):
+    # Списки по size элементов из любого итерируемого объекта; itertools.batched есть только с Python 3.12
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
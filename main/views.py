@@ -1,124 +1,162 @@
+import copy
+import hmac
+import json
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
-from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.core.paginator import Paginator
-from django.db.models import Avg, Sum, Q
-from django.http import HttpResponseNotAllowed
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.csrf import csrf_exempt
 from urllib.parse import urlencode
-from .models import Product, ProductCategory, Brand, ReviewLog, StoreInventory, ProductComposition, WishlistItem, Wishlist, Order, OrderItem, OrderStatus, Store
+from .models import Product, ReviewLog, WishlistItem, Wishlist, Order, OrderItem, Store
 from .forms import CustomUserCreationForm, CustomUserChangeForm, ReviewForm
+from .caching import cache_anonymous_page, catalog_stamps, conditional_page, product_stamps
+from .cart import SessionCart
+from .counters import increment_quantity
+from .facets import catalog_facets, filter_products, parse_facet_filters, parse_price
+from . import lookups
+from .inventory import (
+    InsufficientStock, InventoryBatchError, apply_inventory_changes, inventory_changes, parse_inventory_changes,
+    reserve_stock,
+)
+from .images import attach_variants
+from .lookups import get_status
+from .moderation import approve_reviews, pending_reviews, reject_reviews
+from .pagination import KeysetPaginator
+from .product_page import load_product_page, parse_page
+from .profiling import metrics
+from .search import search_products
+from .suggest import suggest_index
 from django.contrib import messages
 
-def catalog_view(request):
-    categories = ProductCategory.objects.all()
-    brands = Brand.objects.all()
-    products = Product.objects.all()
-    
-    # Чтение GET-параметров
-    category_id = request.GET.get('category')
-    brand_id = request.GET.get('brand')
-    sort_option = request.GET.get('sort')
-    price_min = request.GET.get('price_min')
-    price_max = request.GET.get('price_max')
-
-    # Собираем параметры в словарь
-    get_params = {
-        'category': category_id,
-        'brand': brand_id,
-        'price_min': price_min,
-        'price_max': price_max,
-        'sort': sort_option,
+def with_stats(products):
+    return products.annotate(
+        average_rating=F('stats__average_rating'),
+        total_quantity=Coalesce('stats__total_quantity', 0),
+    )
+
+def lookup_or_404(table, pk):
+    try:
+        return table.get(pk)
+    except table.model.DoesNotExist:
+        raise Http404
+
+CATALOG_PER_PAGE = 5
+SEARCH_PER_PAGE = 3
+MODERATION_PER_PAGE = 50
+
+def catalog_filters(params):
+    # Выбранные фасеты и цены для счётчиков и полей формы
+    return {
+        'filters': parse_facet_filters(params),
+        'price_min': parse_price(params.get('price_min')),
+        'price_max': parse_price(params.get('price_max')),
     }
 
-    # Удаляем пустые значения
-    get_params_cleaned = {k: v for k, v in get_params.items() if v}
+def catalog_query(params):
+    # Товары каталога по GET-параметрам: queryset, порядок для пагинации и строка запроса для ссылок
+    products = Product.objects.all()
+
+    # Чтение GET-параметров: фасеты допускают несколько значений (?brand=1&brand=2)
+    selected = catalog_filters(params)
+    filters, price_min, price_max = selected['filters'], selected['price_min'], selected['price_max']
+    sort_option = params.get('sort')
 
-    # Собираем строку запроса
-    query_string = urlencode(get_params_cleaned)
+    # Собираем строку запроса из корректных значений
+    get_params = [(name, value) for name, values in filters.items() for value in values]
+    get_params += [
+        (name, value) for name, value in (('price_min', price_min), ('price_max', price_max), ('sort', sort_option))
+        if value is not None and value != ''
+    ]
+    query_string = urlencode(get_params)
 
-    # Фильтрация по категориям
-    if category_id:
-        products = products.filter(category_id=category_id)
-    if brand_id:
-        products = products.filter(brand_id=brand_id)
+    # Фильтрация по фасетам
+    products = filter_products(products, filters)
 
     # Фильтрация по цене
-    if price_min:
+    if price_min is not None:
         products = products.filter(price__gte=price_min)
-    if price_max:
+    if price_max is not None:
         products = products.filter(price__lte=price_max)
 
-    # Сортировка
+    # Сортировка: ключ пагинации (поле сортировки, id)
     if sort_option == 'price_asc':
-        products = products.order_by('price')
+        ordering = ('price', 'id')
     elif sort_option == 'price_desc':
-        products = products.order_by('-price')
+        ordering = ('-price', '-id')
+    else:
+        ordering = ('id',)
 
+    # Средняя оценка и остатки берутся из сводки ProductStats
+    return with_stats(products), ordering, query_string
 
-    # Аннотация средней оценки и количества
-    products = products.annotate(
-        average_rating=Avg('reviews__grade', filter=Q(reviews__viewable=True)),
-        total_quantity=Sum('storeinventory__quantity')
-    )
+@conditional_page(catalog_stamps)
+@cache_anonymous_page(stamp_names=catalog_stamps)
+def catalog_view(request):
+    products, ordering, query_string = catalog_query(request.GET)
+    selected = catalog_filters(request.GET)
+    # Счётчики по значениям фасетов считаются по индексу в памяти, без запросов на каждый фасет
+    facets = catalog_facets(**selected)
 
-    paginator = Paginator(products, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(products, ordering, CATALOG_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    attach_variants(page_obj)
 
     return render(request, 'catalog.html', {
-        'categories': categories,
-        'brands': brands,
+        'facets': facets,
+        'price_min': selected['price_min'],
+        'price_max': selected['price_max'],
         'page_obj': page_obj,
         'query_string': query_string,
+        'fragment_cache_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
     })
 
+@conditional_page(product_stamps)
+@cache_anonymous_page(stamp_names=product_stamps)
 def product_detail_view(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-
-    has_review = ReviewLog.objects.filter(product=product, user=request.user).exists()
-    average_rating = ReviewLog.objects.filter(product=product, viewable=True).aggregate(avg=Avg('grade'))['avg'] or 0
-    composition = ProductComposition.objects.filter(product=product).select_related('nutrient')
-    reviews = ReviewLog.objects.filter(product=product, viewable=True).order_by('-review_date')
-    total_quantity = StoreInventory.objects.filter(product=product).aggregate(qty=Sum('quantity'))['qty'] or 0
+    page = load_product_page(request.user, pk, parse_page(request.GET.get('reviews_page')))
 
     # Форма отзыва
     review_form = None
-    if request.user.is_authenticated:
-        existing_review = ReviewLog.objects.filter(product=product, user=request.user).first()
+    if request.user.is_authenticated and not page['has_review']:
         if request.method == 'POST':
-            form = ReviewForm(request.POST)
-            if form.is_valid():
-                if existing_review:
-                    messages.warning(request, "Вы уже оставляли отзыв.")
-                else:
-                    new_review = form.save(commit=False)
-                    new_review.user = request.user
-                    new_review.product = product
-                    new_review.viewable = False
-                    new_review.save()
-                    messages.success(request, "Ваш отзыв отправлен на модерацию.")
-                    return redirect('product-detail', pk=pk)
+            review_form = ReviewForm(request.POST)
+            if review_form.is_valid():
+                new_review = review_form.save(commit=False)
+                new_review.user = request.user
+                new_review.product = page['product']
+                new_review.viewable = False
+                new_review.save()
+                messages.success(request, "Ваш отзыв отправлен на модерацию.")
+                return redirect('product-detail', pk=pk)
         else:
             review_form = ReviewForm()
+    elif request.method == 'POST' and page['has_review']:
+        messages.warning(request, "Вы уже оставляли отзыв.")
+        return redirect('product-detail', pk=pk)
 
     return render(request, 'product_detail.html', {
-        'product': product,
-        'average_rating': average_rating,
-        'total_quantity': total_quantity,
-        'reviews': reviews,
-        'composition': composition,
+        **page,
         'review_form': review_form,
-        'has_review': has_review,
     })
 
+@cache_anonymous_page()
 def contacts_view(request):
-    stores = Store.objects.all()
+    stores = lookups.stores.all()
     return render(request, 'contacts.html', {'stores': stores})
 
+@cache_anonymous_page(stamp_names=catalog_stamps)
 def about_view(request):
-    fitness_formula = get_object_or_404(Brand, pk=1)
-    just_fit = get_object_or_404(Brand, pk=2)
-    maxler = get_object_or_404(Brand, pk=6)
+    # Копии записей справочника: он общий для всех запросов процесса, а варианты фото проставляются на объект
+    fitness_formula, just_fit, maxler = attach_variants(
+        copy.copy(lookup_or_404(lookups.brands, pk)) for pk in (1, 2, 6)
+    )
 
     top_reviews = ReviewLog.objects.filter(
         viewable=True,
@@ -146,16 +184,32 @@ def register_view(request):
         form = CustomUserCreationForm()
     return render(request, 'register.html', {'form': form})
 
+def order_history(user):
+    # Заказы пользователя по дате (индекс idx_order_user_date_status)
+    return (
+        Order.objects.filter(user=user)
+        .exclude(status=get_status('Черновик'))
+        .select_related('status', 'store')
+        .with_totals()
+        .order_by('-order_date', '-id')
+    )
+
 @login_required
 def profile_view(request):
     wishlist = get_user_wishlist(request.user)
-    items = WishlistItem.objects.filter(wishlist=wishlist).select_related('product')[:3]
-    orders = Order.objects.filter(user=request.user).exclude(status__name='Черновик').order_by('-order_date')
+    items = list(WishlistItem.objects.filter(wishlist=wishlist).select_related('product')[:3])
+    attach_variants(item.product for item in items)
+    orders = order_history(request.user)
+
+    # История заказов постранично: число запросов не зависит от количества заказов
+    paginator = Paginator(orders, 10)
+    orders_page = paginator.get_page(request.GET.get('orders_page'))
 
     return render(request, 'profile.html', {
         'user': request.user,
         'wishlist_items': items,
-        'orders' : orders,
+        'orders' : orders_page,
+        'orders_page_range': paginator.get_elided_page_range(orders_page.number),
     })
 
 @login_required
@@ -183,15 +237,7 @@ def add_to_wishlist(request, product_id):
     wishlist = get_user_wishlist(request.user)
     product = get_object_or_404(Product, pk=product_id)
 
-    item, created = WishlistItem.objects.get_or_create(
-        wishlist=wishlist,
-        product=product,
-        defaults={'quantity': 1}
-    )
-
-    if not created:
-        item.quantity += 1
-        item.save()
+    increment_quantity(WishlistItem, wishlist=wishlist, product=product)
 
     messages.success(request, f'"{product.name}" добавлен в избранное.')
 
@@ -210,94 +256,72 @@ def wishlist_view(request):
 
     return render(request, 'wishlist.html', {'items': items})
 
-@login_required
 def add_to_cart(request, product_id):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
 
-    # Получаем статус "Черновик"
-    draft_status = OrderStatus.objects.get(name='Черновик')
+    product = get_object_or_404(Product.objects.only('id', 'name'), pk=product_id)
 
-    # Ищем или создаём черновик заказа
-    order, created = Order.objects.get_or_create(
-        user=request.user,
-        status=draft_status,
-        defaults={'comment': '', 'store': None}
-    )
-
-    product = get_object_or_404(Product, pk=product_id)
-
-    # Добавляем товар в OrderItem или увеличиваем количество
-    item, item_created = OrderItem.objects.get_or_create(
-        order=order,
-        product=product,
-        defaults={'quantity': 1}
-    )
-
-    if not item_created:
-        item.quantity += 1
-        item.save()
+    # Корзина хранится в сессии, заказ в базе создаётся только при оформлении
+    SessionCart(request.session).add(product.id)
 
     messages.success(request, f'"{product.name}" добавлен в корзину.')
 
     return redirect(request.META.get('HTTP_REFERER', 'catalog'))
 
-@login_required
+def parse_cart_quantities(data):
+    # Поля quantity_<id> формы корзины: {id строки: количество} и признак ошибки ввода
+    quantities = {}
+    invalid = False
+    for key, value in data.items():
+        if not key.startswith('quantity_') or not value:
+            continue
+        try:
+            item_id = int(key.removeprefix('quantity_'))
+            qty = int(value)
+        except ValueError:
+            invalid = True
+            continue
+        if qty < 0:
+            invalid = True
+            continue
+        quantities[item_id] = qty
+    return quantities, invalid
+
 def update_cart(request):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
 
-    draft_status = OrderStatus.objects.get(name='Черновик')
-    try:
-        order = Order.objects.get(user=request.user, status=draft_status)
-    except Order.DoesNotExist:
+    quantities, invalid = parse_cart_quantities(request.POST)
+    if invalid:
+        messages.error(request, "Некорректное количество товара. Корзина не изменена.")
         return redirect('cart')
 
-    for item in OrderItem.objects.filter(order=order):
-        qty_key = f'quantity_{item.id}'
-        new_qty = request.POST.get(qty_key)
-        if new_qty:
-            try:
-                qty_int = int(new_qty)
-                if qty_int > 0:
-                    item.quantity = qty_int
-                    item.save()
-            except ValueError:
-                continue
+    # Все изменения применяются к сессии разом, нулевое количество удаляет строку
+    SessionCart(request.session).update(quantities)
 
     messages.success(request, "Корзина обновлена.")
     return redirect('cart')
 
-@login_required
-def remove_from_cart(request, item_id):
+def remove_from_cart(request, product_id):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
 
-    item = get_object_or_404(OrderItem, id=item_id, order__user=request.user, order__status__name='Черновик')
-    item.delete()
+    if not SessionCart(request.session).remove(product_id):
+        raise Http404
 
     messages.success(request, "Товар удалён из корзины.")
     return redirect('cart')
 
-@login_required
 def cart_view(request):
-    draft_status = OrderStatus.objects.get(name='Черновик')
-    try:
-        order = Order.objects.get(user=request.user, status=draft_status)
-        items = OrderItem.objects.filter(order=order).select_related('product')
-    except Order.DoesNotExist:
-        order = None
-        items = []
-
-    stores = Store.objects.all()
-    total_price = sum(item.product.price * item.quantity for item in items)
+    items = SessionCart(request.session).lines()
+    stores = lookups.stores.all()
+    total_price = sum(item.total for item in items)
 
     return render(request, 'cart.html', {
-        'order': order,
         'items': items,
         'stores': stores,
         'total_price': total_price,
-        'selected_store_id': order.store.id if order and order.store else None
     })
 
 @login_required
@@ -305,14 +329,10 @@ def checkout_view(request):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
 
-    draft_status = OrderStatus.objects.get(name='Черновик')
-    processing_status = OrderStatus.objects.get(name='В обработке')
-
-    try:
-        order = Order.objects.get(user=request.user, status=draft_status)
-        items = OrderItem.objects.filter(order=order)
-    except Order.DoesNotExist:
-        messages.warning(request, "У вас нет активной корзины.")
+    cart = SessionCart(request.session)
+    items = cart.lines()
+    if not items:
+        messages.warning(request, "Корзина пуста.")
         return redirect('cart')
 
     # Получаем магазин
@@ -323,62 +343,182 @@ def checkout_view(request):
         return redirect('cart')
 
     try:
-        store = Store.objects.get(pk=store_id)
+        store = lookups.stores.get(store_id)
     except Store.DoesNotExist:
         messages.error(request, "Выбранный магазин не найден.")
         return redirect('cart')
 
-    # Проверка остатков
-    unavailable_items = []
-    for item in items:
-        stock = StoreInventory.objects.filter(store=store, product=item.product).first()
-        if not stock or stock.quantity < item.quantity:
-            unavailable_items.append((item.product.name, stock.quantity if stock else 0))
+    quantities = {item.product.id: item.quantity for item in items}
+    names = {item.product.id: item.product.name for item in items}
+    # Цены фиксируются в позициях заказа на момент оформления
+    prices = {item.product.id: item.product.price for item in items}
 
-    if unavailable_items:
+    # Списание остатков и создание заказа одной транзакцией
+    try:
+        with transaction.atomic():
+            reserve_stock(store, quantities)
+            order = Order.objects.create(
+                user=request.user,
+                status=get_status('В обработке'),
+                store=store,
+                comment=comment,
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(order=order, product_id=product_id, quantity=quantity, price=prices[product_id])
+                for product_id, quantity in quantities.items()
+            )
+    except InsufficientStock as e:
         msg = "Некоторые товары отсутствуют в выбранном магазине:\n"
-        for name, qty in unavailable_items:
-            msg += f'• {name} (в наличии: {qty})\n'
+        for product_id, qty in e.shortages.items():
+            msg += f'• {names[product_id]} (в наличии: {qty})\n'
         messages.error(request, msg)
         return redirect('cart')
 
-    order.comment = comment
-    order.store = store
-    order.status = processing_status
-    order.save()
-
+    cart.clear()
     messages.success(request, "Заказ оформлен и передан в обработку.")
     return redirect('profile')
 
 @login_required
 def order_detail_view(request, pk):
-    order = get_object_or_404(Order, pk=pk, user=request.user)
-    items = OrderItem.objects.filter(order=order).select_related('product')
-    total_price = sum(item.product.price * item.quantity for item in items)
+    # Суммы строк и заказа считаются в БД по ценам из позиций
+    order = get_object_or_404(
+        Order.objects.select_related('status', 'store').with_totals(), pk=pk, user=request.user,
+    )
+    items = OrderItem.objects.filter(order=order).select_related('product').with_totals().order_by('id')
 
     return render(request, 'order_detail.html', {
         'order': order,
         'items': items,
-        'total_price': total_price
+        'total_price': order.total,
     })
 
+def search_query(query):
+    if not query:
+        return Product.objects.none(), ('id',)
+    # Сначала самые релевантные товары
+    return with_stats(search_products(query)), ('-rank', '-id')
+
 def search_view(request):
     query = request.GET.get('q')
-    products = Product.objects.none()
-
-    if query:
-        products = Product.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).annotate(
-            average_rating=Avg('reviews__grade', filter=Q(reviews__viewable=True)),
-            total_quantity=Sum('storeinventory__quantity')
-        )
+    products, ordering = search_query(query)
 
-    paginator = Paginator(products, 3)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(products, ordering, SEARCH_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    attach_variants(page_obj)
 
     return render(request, 'search_results.html', {
         'query': query,
         'page_obj': page_obj,
-    })
\ No newline at end of file
+        'query_string': urlencode({'q': query or ''}),
+    })
+
+def suggest_view(request):
+    query = request.GET.get('q', '')
+    return JsonResponse({'query': query, 'results': suggest_index.suggest(query)})
+
+def bearer_token(request):
+    # Токен из заголовка Authorization: Bearer <токен>
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token
+
+def metrics_view(request):
+    # Гистограммы профилировщика в формате Prometheus: для персонала и сборщика метрик с METRICS_TOKEN.
+    # Адрес клиента не проверяется: за обратным прокси все запросы приходят с 127.0.0.1
+    token = bearer_token(request)
+    has_token = bool(token and settings.METRICS_TOKEN) and hmac.compare_digest(
+        token.encode(), settings.METRICS_TOKEN.encode(),
+    )
+    if not (request.user.is_staff or has_token):
+        raise Http404
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def sync_token_store(request):
+    # id магазина по токену из заголовка Authorization: Bearer <токен>
+    token = bearer_token(request)
+    if token is None:
+        return None
+    for known, store_id in settings.INVENTORY_SYNC_TOKENS.items():
+        if hmac.compare_digest(known.encode(), token.encode()):
+            return store_id
+    return None
+
+
+@csrf_exempt
+def inventory_sync_view(request, store_id):
+    # Пачка изменений остатков от магазина: {"items": [{"product_id", "quantity", "updated_at"}, ...]}
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    token_store = sync_token_store(request)
+    if token_store is None:
+        return JsonResponse({'errors': ['нужен токен магазина']}, status=401)
+    if token_store != store_id:
+        return JsonResponse({'errors': ['токен выдан другому магазину']}, status=403)
+    store = get_object_or_404(Store, pk=store_id)
+    try:
+        payload = json.loads(request.body)
+        changes = parse_inventory_changes(payload.get('items') if isinstance(payload, dict) else None)
+    except InventoryBatchError as e:
+        return JsonResponse({'errors': e.errors}, status=400)
+    except ValueError:
+        return JsonResponse({'errors': ['тело запроса не JSON']}, status=400)
+    return JsonResponse(apply_inventory_changes(store, changes))
+
+
+def inventory_changes_view(request):
+    # Лента изменений остатков для кэшей и витрин. Магазин по токену видит только свои остатки,
+    # персонал — все (или одного магазина через ?store=). Адрес клиента не проверяется, как и у /metrics/
+    store = sync_token_store(request)
+    if store is None:
+        if not request.user.is_staff:
+            raise Http404
+        store = request.GET.get('store') or None
+    since = request.GET.get('since')
+    try:
+        since = parse_datetime(since) if since else None
+        after_id = int(request.GET.get('after_id') or 0)
+        limit = min(int(request.GET.get('limit') or 500), 5000)
+        if store is not None:
+            store = int(store)
+    except ValueError:
+        return JsonResponse({'errors': ['неверные параметры']}, status=400)
+    if request.GET.get('since') and since is None:
+        return JsonResponse({'errors': ['since не дата']}, status=400)
+    if limit < 1:
+        return JsonResponse({'errors': ['limit меньше 1']}, status=400)
+
+    results = inventory_changes(since, after_id, limit, store)
+    if results:
+        since, after_id = results[-1]['changed_at'], results[-1]['id']
+    # Курсор следующего запроса: при пустом ответе остаётся прежним.
+    # Время передаётся с микросекундами, JSON-кодировщик Django обрезал бы их до миллисекунд.
+    return JsonResponse({
+        'results': results,
+        'next': {'since': since.isoformat() if since else None, 'after_id': after_id},
+        'has_more': len(results) == limit,
+    })
+
+
+@staff_member_required
+@permission_required('main.change_reviewlog', raise_exception=True)
+def moderation_queue_view(request):
+    # Очередь неопубликованных отзывов, старые первыми; отмеченные публикуются или отклоняются одним запросом
+    if request.method == 'POST':
+        ids = [int(value) for value in request.POST.getlist('review_ids') if value.isdigit()]
+        reviews = pending_reviews().filter(id__in=ids)
+        action = request.POST.get('action')
+        if action == 'approve':
+            messages.success(request, f"Опубликовано отзывов: {approve_reviews(reviews)}")
+        elif action == 'reject' and request.user.has_perm('main.delete_reviewlog'):
+            messages.success(request, f"Отклонено отзывов: {reject_reviews(reviews)}")
+        else:
+            messages.error(request, "Действие недоступно.")
+        return redirect('moderation-queue')
+
+    reviews = pending_reviews().select_related('product', 'user')
+    paginator = KeysetPaginator(reviews, ('id',), MODERATION_PER_PAGE)
+    return render(request, 'moderation_queue.html', {
+        'page_obj': paginator.get_page(request.GET.get('cursor')),
+        'query_string': '',
+    })
@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import json
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,6 +30,8 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+INTERNAL_IPS = ['127.0.0.1']
+
 
 # Application definition
 
@@ -41,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +61,7 @@ ROOT_URLCONF = 'ns.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.templating.ProfilingDjangoTemplates',
         'DIRS': [BASE_DIR/'main'/'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -125,6 +131,87 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/main/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic добавляет к именам файлов хэш содержимого и кладёт рядом сжатые .gz/.br;
+# без DEBUG шаблоны ссылаются на имена с хэшем. Сторонние CSS и шрифты скачивает vendor_assets.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'main.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# Уменьшенные копии фотографий (build_image_variants): ширины и каталог, из которого их берёт staticfiles
+IMAGE_VARIANT_WIDTHS = (240, 480, 960)
+IMAGE_VARIANTS_ROOT = BASE_DIR / 'main' / 'static'
+
+# Раздавать собранную статику самим Django с долгим кэшированием (если перед ним нет nginx)
+SERVE_STATIC = os.environ.get('SERVE_STATIC') == '1'
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# По умолчанию кэш в памяти процесса. CACHE_BACKEND=file или redis и CACHE_LOCATION
+# переключают на файловый кэш или Redis, общий для всех процессов.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'ns'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'TIMEOUT': 300,
+    }
+}
+
+# Сессии (и корзина в них) читаются из кэша, база используется только как резервная копия.
+# SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies убирает обращения к базе совсем.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Время жизни закэшированных страниц для анонимных посетителей и фрагментов карточек товаров
+PAGE_CACHE_TIMEOUT = 300
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Профилирование запросов: SQL, шаблоны и общее время в заголовке Server-Timing,
+# логе main.profiling и метриках /metrics/. SAMPLE_RATE — доля профилируемых запросов.
+# Строка лога на каждый запрос включается только явно (PROFILING_LOG=1), при отладке — вместе с PROFILING_SAMPLE_RATE=1.
+# /metrics/ доступны персоналу и сборщику с заголовком Authorization: Bearer <METRICS_TOKEN>.
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING', '1') == '1',
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', '0.1')),
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'SERVER_TIMING': True,
+    'LOG': os.environ.get('PROFILING_LOG') == '1',
+}
+# manage.py test: профилирование не пишет в вывод тестов, нужные тесты включают его через override_settings
+if sys.argv[1:2] == ['test']:
+    PROFILING['ENABLED'] = False
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Общее число результатов в списках каталога и поиска: None (не считать),
+# 'cached' (COUNT(*) с кэшированием) или 'approximate' (оценка по статистике СУБД)
+LISTING_TOTALS = None
+LISTING_TOTALS_TIMEOUT = 300
+
+# Синхронизация остатков магазинов: токены из JSON-объекта {"токен": id магазина} в переменной окружения,
+# предельный размер пачки и задержка ленты изменений в секундах
+INVENTORY_SYNC_TOKENS = json.loads(os.environ.get('INVENTORY_SYNC_TOKENS', '{}'))
+INVENTORY_SYNC_MAX_BATCH = 5000
+INVENTORY_FEED_DELAY = 5
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -1,7 +1,9 @@
+import re
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from django.urls import path
-from main import views
+from django.urls import path, re_path
+from main import assets, async_views, views
 from main.forms import CustomAuthenticationForm
 
 urlpatterns = [
@@ -24,7 +26,7 @@ urlpatterns = [
     path('cart/', views.cart_view, name='cart'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add-to-cart'),
     path('cart/update/', views.update_cart, name='update-cart'),
-    path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove-from-cart'),
+    path('cart/remove/<int:product_id>/', views.remove_from_cart, name='remove-from-cart'),
     path('checkout/', views.checkout_view, name='checkout'),
     path('order/<int:pk>/', views.order_detail_view, name='order-detail'),
     path('password-change/', auth_views.PasswordChangeView.as_view(
@@ -32,4 +34,18 @@ urlpatterns = [
         success_url='/profile/'
     ), name='password_change'),
     path('search/', views.search_view, name='search'),
+    path('search/suggest/', views.suggest_view, name='search-suggest'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('moderation/reviews/', views.moderation_queue_view, name='moderation-queue'),
+    path('api/stores/<int:store_id>/inventory/', views.inventory_sync_view, name='inventory-sync'),
+    path('api/inventory/changes/', views.inventory_changes_view, name='inventory-changes'),
+    # Асинхронные версии страниц для запуска под ASGI
+    path('async/', async_views.catalog_view, name='async-catalog'),
+    path('async/product/<int:pk>/', async_views.product_detail_view, name='async-product-detail'),
+    path('async/search/', async_views.search_view, name='async-search'),
 ]
+
+if settings.SERVE_STATIC:
+    urlpatterns.append(
+        re_path(rf"^{re.escape(settings.STATIC_URL.lstrip('/'))}(?P<path>.+)$", assets.serve_static, name='static'),
+    )